@@ -5,128 +5,120 @@
   python batch_fetch.py bing 2025-12        # 抓取 Bing 2025年12月的所有壁纸
   python batch_fetch.py bing 2025-12-10     # 抓取 Bing 2025年12月10日的壁纸
   python batch_fetch.py unsplash 2025-12    # 抓取 Unsplash 2025年12月的所有壁纸
+  python batch_fetch.py bing 2025-12 --workers 8   # 并发处理（下载/故事走线程池，缩略图/压缩走进程池）
 """
 
+import argparse
 import os
 import sys
-import json
-import requests
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from PIL import Image
 
 # 导入主脚本的工具函数
 import fetch_bing_wallpaper
+import fetch_unsplash_wallpaper
+from src import http_client
+from src.pipeline import StagePools, mark_done, process_wallpaper, stage_done, wallpaper_dir
+from src.storage import object_key_for, sync_wallpapers
 from src.update_readme import update_readme
 from src.update_gallery import update_gallery
 
 
-BING_API = "https://www.bing.com/HPImageArchive.aspx"
-BING_BASE = "https://www.bing.com"
-UNSPLASH_API = "https://api.unsplash.com/photos/random"
+def is_complete(base_dir: Path) -> bool:
+    """meta.json 与 story.md 都已存在的壁纸无需再处理"""
+    return (base_dir / "meta.json").exists() and (base_dir / "story.md").exists()
 
 
-def batch_fetch_bing(target_date):
-    """批量抓取 Bing 壁纸"""
+def run_days(source: str, items, pools: StagePools, **options):
+    """
+    items: [(date_str, fetch_item)]，每天跑一遍壁纸流水线（与每日抓取使用同一套阶段）
+    返回每天的 run_pipeline 结果，顺序与 items 一致
+    """
+    def run_one(entry):
+        date_str, fetch_item = entry
+        return process_wallpaper(source, wallpaper_dir(source, date_str), fetch_item, pools=pools, **options)
+
+    return pools.map_days(run_one, items)
+
+
+def sync_days(source: str, dates):
+    """
+    把尚未同步的壁纸批量同步到所有启用的存储后端
+    （GitHub 图床合并为一个提交，对象存储有界并发上传），全部成功的目录补写 sync 阶段记录
+    """
+    dirs = [wallpaper_dir(source, d) for d in dates]
+    dirs = [d for d in dirs if (d / "image.jpg").exists() and not stage_done(d, "sync")]
+    if not dirs:
+        return
+    results = sync_wallpapers(dirs)
+    failed_keys = {key for r in results.values() for key in r["failed"]}
+    for d in dirs:
+        if results and not any(key.startswith(object_key_for(d) + "/") for key in failed_keys):
+            mark_done(d, "sync")
+
+
+def batch_fetch_bing(target_date, workers: int = 1):
+    """批量抓取 Bing 壁纸（config/sources.yaml 中的所有市场，同一张图片只处理一次）"""
     print(f"🚀 开始批量抓取 Bing {target_date} 的壁纸...")
-    
+
     fetch_bing_wallpaper.load_env()
-    count = 0
-    story_count = 0
-    
-    # 尝试抓取多页
-    all_images = []
-    for idx_start in [0, 8, 16]:
-        params = {
-            "format": "js",
-            "idx": idx_start,
-            "n": 8,
-            "mkt": "zh-CN"
-        }
-        try:
-            resp = requests.get(BING_API, params=params, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            all_images.extend(data.get("images", []))
-        except Exception as e:
-            print(f"⚠️ 无法获取 idx={idx_start} 的数据: {e}")
-    
-    for img in all_images:
-        start_date = img.get("startdate")
-        if not start_date:
-            continue
-        
-        date_str = f"{start_date[:4]}-{start_date[4:6]}-{start_date[6:8]}"
-        
-        # 过滤日期
-        if not date_str.startswith(target_date):
-            continue
-        
-        base_dir = Path("docs/wallpapers/bing") / date_str
-        base_dir.mkdir(parents=True, exist_ok=True)
-        
-        image_path = base_dir / "image.jpg"
-        meta_path = base_dir / "meta.json"
-        thumb_path = base_dir / "thumb.jpg"
-        story_path = base_dir / "story.md"
-        
-        # 1. 下载图片
-        if not image_path.exists():
-            image_url = BING_BASE + img["url"]
-            print(f"📥 正在下载 {date_str}: {img.get('title')}")
-            fetch_bing_wallpaper.download_image(image_url, image_path)
-            fetch_bing_wallpaper.generate_thumbnail(image_path, thumb_path)
-            count += 1
-        
-        # 2. 生成 AI 故事
-        has_story = story_path.exists()
-        if not has_story:
-            story_content = fetch_bing_wallpaper.generate_story(
-                img.get("title"),
-                img.get("copyright"),
-                image_path
-            )
-            if story_content:
-                story_path.write_text(story_content, encoding="utf-8")
-                print(f"📖 已生成故事: {date_str}")
-                has_story = True
-                story_count += 1
-        
-        # 3. 更新元数据
-        meta_info = {
-            "date": date_str,
-            "title": img.get("title"),
-            "copyright": img.get("copyright"),
-            "image_url": BING_BASE + img["url"],
-            "has_story": has_story
-        }
-        meta_path.write_text(json.dumps(meta_info, ensure_ascii=False, indent=2), encoding="utf-8")
-
-        # 4. 上传到 COS
-        from src.utils import upload_to_cos
-        cos_base_path = f"wallpapers/bing/{date_str}"
-        upload_to_cos(str(image_path), f"{cos_base_path}/image.jpg")
-        upload_to_cos(str(thumb_path), f"{cos_base_path}/thumb.jpg")
-        if has_story:
-            upload_to_cos(str(story_path), f"{cos_base_path}/story.md")
-        upload_to_cos(str(meta_path), f"{cos_base_path}/meta.json")
-    
-    print(f"✅ Bing 批量处理完成：新增图片 {count} 张，补全故事 {story_count} 篇。")
-
-
-def batch_fetch_unsplash(target_date):
+
+    # 各市场、各页并发请求
+    markets = fetch_bing_wallpaper.configured_markets()
+    pages = [(mkt, idx_start) for mkt in markets for idx_start in [0, 8, 16]]
+    with ThreadPoolExecutor(max_workers=len(pages)) as pool:
+        results = list(pool.map(lambda page: fetch_bing_wallpaper.fetch_bing_images(page[1], 8, page[0]), pages))
+
+    # 过滤日期，按图片 (hsh) 去重
+    listings = [
+        (mkt, img)
+        for (mkt, _), images in zip(pages, results)
+        for img in images
+        if img.get("startdate") and fetch_bing_wallpaper.get_date_from_meta(img).startswith(target_date)
+    ]
+    groups = fetch_bing_wallpaper.group_by_image(listings)
+
+    targets = []
+    for group in groups:
+        archive = fetch_bing_wallpaper.find_archive(group["meta"], group["markets"])
+        if archive:
+            # 已归档的图片只补充新市场的标题与版权信息
+            fetch_bing_wallpaper.add_markets(archive, group["markets"], group["meta"].get("hsh"))
+            if is_complete(archive):
+                continue
+        base_dir = archive or fetch_bing_wallpaper.archive_dir_for(group["meta"], group["markets"],
+                                                                   taken=[t[0] for t in targets])
+        targets.append((base_dir, fetch_bing_wallpaper.bing_item(group["meta"], group["markets"])))
+    targets.sort(key=lambda t: t[0].name)
+    dates = [base_dir.name for base_dir, _ in targets]
+
+    with StagePools(workers) as pools:
+        items = [(d, lambda item=item: item) for d, (_, item) in zip(dates, targets)]
+        # 逐张同步改为结束后一次性提交
+        results = run_days("bing", items, pools, sync=False)
+    sync_days("bing", [d for d, r in zip(dates, results) if "meta" not in r["failed"]])
+
+    count = sum(1 for r in results if "download" in r["ran"])
+    story_count = sum(1 for r in results if "story" in r["ran"])
+    failed = sum(1 for r in results if "meta" in r["failed"])
+
+    print(f"✅ Bing 批量处理完成（{len(markets)} 个市场，{len(groups)} 张不同图片）："
+          f"新增图片 {count} 张，补全故事 {story_count} 篇，失败 {failed} 天。")
+
+
+def batch_fetch_unsplash(target_date, workers: int = 1):
     """批量抓取 Unsplash 壁纸"""
     print(f"🚀 开始抓取 Unsplash {target_date} 的壁纸...")
     print("⚠️ 注意：Unsplash API 不支持按日期查询历史壁纸")
     print("    将抓取当前精选照片并保存到指定日期目录")
-    
+
     fetch_bing_wallpaper.load_env()
     access_key = os.environ.get("UNSPLASH_ACCESS_KEY")
-    
+
     if not access_key:
         print("[ERROR] UNSPLASH_ACCESS_KEY 未配置")
         return
-    
+
     # 解析目标日期
     if len(target_date) == 7:  # YYYY-MM 格式
         # 抓取整月（实际上是抓取多张当前照片）
@@ -139,104 +131,57 @@ def batch_fetch_unsplash(target_date):
     else:
         print("[ERROR] 日期格式错误，应为 YYYY-MM 或 YYYY-MM-DD")
         return
-    
+
+    # 如果已存在，跳过（只有原图没有 meta.json 的目录会从中断处继续）
+    dates_to_fetch = [d for d in dates_to_fetch if not (wallpaper_dir("unsplash", d) / "meta.json").exists()]
+
+    def fetch_item(date_str):
+        photo = fetch_unsplash_wallpaper.fetch_unsplash_photo()
+        return fetch_unsplash_wallpaper.unsplash_item(photo, date_str) if photo else None
+
+    with StagePools(workers) as pools:
+        items = [(d, lambda d=d: fetch_item(d)) for d in dates_to_fetch]
+        results = run_days("unsplash", items, pools, sync=False)
+    sync_days("unsplash", [d for d, r in zip(dates_to_fetch, results) if "meta" not in r["failed"]])
+
     count = 0
-    for date_str in dates_to_fetch:
-        base_dir = Path("docs/wallpapers/unsplash") / date_str
-        
-        # 如果已存在，跳过
-        if base_dir.exists() and (base_dir / "image.jpg").exists():
-            continue
-        
-        # 抓取一张照片
-        headers = {"Authorization": f"Client-ID {access_key}"}
-        params = {
-            "featured": "true",
-            "orientation": "landscape",
-            "query": "nature,landscape,architecture"
-        }
-        
-        try:
-            resp = requests.get(UNSPLASH_API, headers=headers, params=params, timeout=10)
-            resp.raise_for_status()
-            photo = resp.json()
-            
-            base_dir.mkdir(parents=True, exist_ok=True)
-            
-            # 下载图片
-            image_url = photo["urls"]["full"]
-            image_path = base_dir / "image.jpg"
-            fetch_bing_wallpaper.download_image(image_url, image_path)
-            
-            # 生成缩略图
-            thumb_path = base_dir / "thumb.jpg"
-            fetch_bing_wallpaper.generate_thumbnail(image_path, thumb_path)
-            
-            # 生成故事
-            title = photo.get("description") or photo.get("alt_description") or "Unsplash Featured Photo"
-            author = photo.get("user", {}).get("name", "Unknown")
-            copyright_info = f"Photo by {author} on Unsplash"
-            
-            story_content = fetch_bing_wallpaper.generate_story(title, copyright_info, image_path)
-            if story_content:
-                (base_dir / "story.md").write_text(story_content, encoding="utf-8")
-            
-            # 保存元数据
-            meta_info = {
-                "date": date_str,
-                "title": title,
-                "copyright": copyright_info,
-                "image_url": photo["links"]["html"],
-                "photographer": author,
-                "has_story": bool(story_content)
-            }
-            meta_path = base_dir / "meta.json"
-            meta_path.write_text(json.dumps(meta_info, ensure_ascii=False, indent=2), encoding="utf-8")
-            
-            # 上传到 COS
-            from src.utils import upload_to_cos
-            cos_base_path = f"wallpapers/unsplash/{date_str}"
-            upload_to_cos(str(image_path), f"{cos_base_path}/image.jpg")
-            upload_to_cos(str(thumb_path), f"{cos_base_path}/thumb.jpg")
-            if story_content:
-                upload_to_cos(str(base_dir / "story.md"), f"{cos_base_path}/story.md")
-            upload_to_cos(str(meta_path), f"{cos_base_path}/meta.json")
-            
-            print(f"📥 已抓取 {date_str}: {title}")
-            count += 1
-            
-        except Exception as e:
-            print(f"[ERROR] 抓取 {date_str} 失败: {e}")
+    for date_str, result in zip(dates_to_fetch, results):
+        if "meta" in result["failed"]:
+            print(f"[ERROR] 抓取 {date_str} 失败: {result['failed']}")
             continue
-    
+        print(f"📥 已抓取 {date_str}: {result['ctx']['item']['title']}")
+        count += 1
+
     print(f"✅ Unsplash 批量处理完成：新增 {count} 张照片。")
 
 
 def main():
-    if len(sys.argv) < 3:
-        print("用法:")
-        print("  python batch_fetch.py bing 2025-12        # 抓取 Bing 2025年12月")
-        print("  python batch_fetch.py bing 2025-12-10     # 抓取 Bing 指定日期")
-        print("  python batch_fetch.py unsplash 2025-12    # 抓取 Unsplash 2025年12月")
-        print("  python batch_fetch.py unsplash 2025-12-10 # 抓取 Unsplash 指定日期")
-        sys.exit(1)
-    
-    source = sys.argv[1].lower()  # 忽略大小写
-    target_date = sys.argv[2]
-    
+    parser = argparse.ArgumentParser(
+        description="批量抓取壁纸",
+        epilog="示例: python batch_fetch.py bing 2025-12 --workers 8",
+    )
+    parser.add_argument("source", help="数据源: bing / unsplash（忽略大小写）")
+    parser.add_argument("target_date", help="YYYY-MM 或 YYYY-MM-DD")
+    parser.add_argument("--workers", type=int, default=1, help="并发处理的天数（默认 1，即顺序执行）")
+    args = parser.parse_args()
+
+    source = args.source.lower()  # 忽略大小写
+    target_date = args.target_date
+
     if source == "bing":
-        batch_fetch_bing(target_date)
+        batch_fetch_bing(target_date, workers=args.workers)
     elif source == "unsplash":
-        batch_fetch_unsplash(target_date)
+        batch_fetch_unsplash(target_date, workers=args.workers)
     else:
         print(f"❌ 不支持的数据源: {source}")
         print("支持的数据源: bing, unsplash")
         sys.exit(1)
-    
+
     # 更新索引
     print("🔄 正在更新 README 和 Gallery...")
     update_readme()
     update_gallery()
+    http_client.print_stats()
     print("✅ 全部完成！")
 
 
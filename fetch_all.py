@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+多源壁纸抓取编排器
+- 按 config/sources.yaml 加载所有启用的数据源（fetcher_script 指向的模块即插件）
+- 在同一进程内并发运行各数据源的抓取
+- 全部完成后，根据汇总结果统一渲染一次 README / Gallery / 静态 API
+
+插件约定：fetcher_script 对应的模块提供
+  run(skip_story: bool = False, render: bool = True, defer_story: bool = False) -> Optional[Path]
+抓到新壁纸时返回归档目录，否则返回 None。编排器调用时传入 render=False。
+defer_story=True 时两阶段发布：图片、元数据与页面先发布，故事由 scripts/story_worker.py 补写。
+
+--deadline SECONDS 为整次运行设定时间预算（见 src/run_control）：各阶段按比例分配剩余预算，
+不够时故事改为后台补写、推送 / 同步写入重试队列；每次运行结束前在预算允许时重跑队列中推迟的阶段。
+运行锁保证同一时间只有一个抓取任务。
+
+用法:
+  python fetch_all.py
+  python fetch_all.py --skip-story
+  python fetch_all.py --defer-story
+  python fetch_all.py --defer-story --deadline 600
+  python fetch_all.py --source bing
+"""
+
+import argparse
+import importlib
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from fetch_bing_wallpaper import load_env
+from src import http_client, run_control
+from src.config_loader import get_enabled_sources
+
+
+def load_fetcher(source: dict):
+    """按 fetcher_script 导入数据源插件模块"""
+    script = source.get("fetcher_script")
+    if not script:
+        raise ValueError(f"数据源 {source['name']} 未配置 fetcher_script")
+    module = importlib.import_module(Path(script).stem)
+    if not hasattr(module, "run"):
+        raise ValueError(f"{script} 未提供 run() 入口")
+    return module
+
+
+def run_source(source: dict, skip_story: bool, defer_story: bool = False):
+    """运行单个数据源，返回 (归档目录或 None, 耗时, 错误信息)"""
+    start = time.perf_counter()
+    if run_control.expired():
+        return None, 0.0, "超出时间预算，未启动"
+    try:
+        fetcher = load_fetcher(source)
+        result = fetcher.run(skip_story=skip_story, render=False, defer_story=defer_story)
+        return result, time.perf_counter() - start, None
+    except Exception as e:
+        return None, time.perf_counter() - start, str(e)
+
+
+def render_all():
+    """README / Gallery / 静态 API 各渲染一次"""
+    from src.generate_api import generate_api
+    from src.update_gallery import update_gallery
+    from src.update_readme import update_readme
+
+    update_readme()
+    update_gallery()
+    print("[OK] docs/index.html 已更新")
+    generate_api()
+
+
+def fetch_sources(args):
+    """并发抓取、重跑推迟的阶段、统一渲染"""
+    sources = get_enabled_sources()
+    if args.source:
+        sources = [s for s in sources if s["name"] in args.source]
+    if not sources:
+        print("[WARN] 没有启用的数据源")
+        return
+
+    print(f"🚀 并发抓取 {len(sources)} 个数据源: {', '.join(s['name'] for s in sources)}")
+    with ThreadPoolExecutor(max_workers=len(sources)) as pool:
+        results = list(pool.map(lambda s: run_source(s, args.skip_story, args.defer_story), sources))
+
+    archived = []
+    for source, (result, seconds, error) in zip(sources, results):
+        if error:
+            print(f"[ERROR] {source['name']} 抓取失败 ({seconds:.1f}s): {error}")
+        elif result:
+            archived.append(result)
+            print(f"[OK] {source['name']} 新增壁纸 {result} ({seconds:.1f}s)")
+        else:
+            print(f"[INFO] {source['name']} 没有新壁纸 ({seconds:.1f}s)")
+
+    if archived or args.force_render:
+        render_all()
+    else:
+        print("[INFO] 没有新壁纸，跳过页面渲染")
+
+    # 之前因时间预算推迟的推送 / 同步（state/retry_queue.json）
+    if run_control.queued():
+        if run_control.expired():
+            print("[INFO] 时间预算已用完，推迟的阶段留到下次运行")
+        else:
+            from src.pipeline import resume_deferred
+
+            resume_deferred()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发抓取所有启用的壁纸源，并统一渲染页面")
+    parser.add_argument("--skip-story", action="store_true", help="跳过 AI 故事生成（快速模式）")
+    parser.add_argument("--defer-story", action="store_true",
+                        help="两阶段发布：先发布图片，故事由 scripts/story_worker.py 补写")
+    parser.add_argument("--source", action="append", help="只运行指定源（可重复），默认运行全部启用的源")
+    parser.add_argument("--force-render", action="store_true", help="即使没有新壁纸也重新渲染页面")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS",
+                        help="整次运行的时间预算（秒），不够时推迟故事 / 推送 / 同步")
+    args = parser.parse_args()
+
+    load_env()
+
+    # 运行锁：与定时任务 / 其他手动运行重叠时直接退出，避免重复下载和重复调用 LLM
+    with run_control.run_lock("fetch_all") as acquired:
+        if not acquired:
+            return
+        run_control.start_budget(args.deadline)
+        fetch_sources(args)
+    http_client.print_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,49 @@
 #!/usr/bin/env python3
 """
 每日必应壁纸自动归档脚本
-- 下载必应每日壁纸
+- 并发抓取多个市场的必应每日壁纸（config/sources.yaml 的 markets），按 hsh 去重，每张图片只处理一次
 - 生成缩略图
 - 更新 README 索引
 - 更新 Gallery 页面
 - 推送企业微信
+- --prefetch：提前下载下一天的壁纸并生成派生图与故事（暂存在 state/staging/bing/），
+  上线后常规运行确认 Bing 公布的主市场图片 (hsh) 与暂存的一致，只需移动目录并写入元数据即可发布
 """
-import argparse
+import time
+
+_START = time.perf_counter()
 
+import argparse
 import os
-import json
-import base64
-import requests
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
-from PIL import Image
+from typing import Optional
 
-from src.utils import send_image_to_wecom, send_markdown_to_wecom, send_story_to_wecom
-from src.update_readme import update_readme
-from src.update_gallery import update_gallery
+from src import http_client, run_control
+from src.state import load_state, save_state
 
+# 注意：Pillow、README/Gallery 渲染器等重模块在确认有新壁纸后才导入，
+# 每小时运行一次的定时任务在“已归档”时可以在一次请求内快速退出
 
 BING_API = "https://www.bing.com/HPImageArchive.aspx"
 BING_BASE = "https://www.bing.com"
-THUMB_SIZE = (400, 225)  # 16:9 缩略图
+BING_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+# state/bing.json：主市场上次归档的 startdate/hsh/date、HTTP 缓存校验头 (ETag/Last-Modified)、
+# 预取暂存的下一张壁纸 (staged)、其他市场的同类信息 (markets)、最近归档的图片索引 (images: hsh → 目录)
+# 以及上次完整运行时配置的市场列表 (market_list，快速路径用它代替读取 YAML 配置)
+STATE_NAME = "bing"
+# 未在 config/sources.yaml 配置 markets 时只抓取这些市场
+DEFAULT_MARKETS = ["zh-CN"]
+# images 索引保留的图片数
+IMAGE_INDEX_SIZE = 60
+# 预取的壁纸在上线前暂存于此（随 state/ 一起提交，下次运行可以直接发布）
+STAGING_BASE = Path("state/staging/bing")
+# 发布时写入暂存记录的元数据字段
+STAGED_FIELDS = ("startdate", "fullstartdate", "enddate", "hsh", "url", "title", "copyright")
 
 
 def load_env():
@@ -45,252 +64,463 @@ def get_date_from_meta(meta):
     return f"{start_date[:4]}-{start_date[4:6]}-{start_date[6:8]}"
 
 
-def fetch_bing_metadata():
-    """获取必应每日壁纸元数据"""
+def get_base_dir(date_str: str) -> Path:
+    """壁纸归档目录: docs/wallpapers/bing/YYYY-MM/YYYY-MM-DD"""
+    return Path("docs/wallpapers/bing") / date_str[:7] / date_str
+
+
+def get_staging_dir(date_str: str) -> Path:
+    """预取暂存目录: state/staging/bing/YYYY-MM-DD"""
+    return STAGING_BASE / date_str
+
+
+def is_live(meta: dict) -> bool:
+    """壁纸的上线时间 fullstartdate（UTC，YYYYMMDDHHMM）是否已到；没有该字段时按 startdate 当天 00:00 UTC"""
+    start = meta.get("fullstartdate") or (meta.get("startdate", "") + "0000")
+    return datetime.now(timezone.utc).strftime("%Y%m%d%H%M") >= start
+
+
+def configured_markets() -> list:
+    """config/sources.yaml 中必应源的 markets（第一个为主市场），未配置时只抓取 zh-CN"""
+    from src.config_loader import get_source_config
+
+    return list(get_source_config("bing").get("markets") or DEFAULT_MARKETS)
+
+
+def get_markets(state: dict = None) -> list:
+    """
+    当前抓取的市场：state/bing.json 中上次完整运行记下的 market_list，没有记录时读取配置
+    快速路径只用这份记录，不导入 config_loader / PyYAML
+    """
+    state = load_state(STATE_NAME) if state is None else state
+    return list(state.get("market_list") or configured_markets())
+
+
+def image_key(meta: dict) -> str:
+    """去重键：同一张图片在各市场的 hsh 相同（没有 hsh 时退回 urlbase）"""
+    return meta.get("hsh") or meta.get("urlbase") or meta.get("url")
+
+
+def market_info(meta: dict) -> dict:
+    """meta.json markets 中单个市场的记录"""
+    return {k: meta[k] for k in ("title", "copyright", "startdate") if meta.get(k)}
+
+
+def group_by_image(listings) -> list:
+    """
+    listings: [(市场, Bing 元数据)]，按市场配置顺序排列
+    返回 [{"meta": 第一个列出该图片的市场的元数据, "markets": {市场: market_info}}]，每张图片一条
+    """
+    groups = {}
+    for mkt, meta in listings:
+        group = groups.setdefault(image_key(meta), {"meta": meta, "markets": {}})
+        group["markets"].setdefault(mkt, market_info(meta))
+    return list(groups.values())
+
+
+def bing_item(meta: dict, markets: dict = None) -> dict:
+    """把 Bing API 返回的元数据转换为流水线使用的 item；markets 为列出这张图片的各市场信息"""
+    image_url = BING_BASE + meta["url"]
+    extra = {"image_url": image_url}
+    if meta.get("hsh"):
+        extra["hsh"] = meta["hsh"]
+    if markets:
+        extra["markets"] = markets
+    return {
+        "date": get_date_from_meta(meta),
+        "download_url": image_url,
+        "title": meta.get("title"),
+        "copyright": meta.get("copyright"),
+        "extra": extra,
+    }
+
+
+def _candidate_dirs(meta: dict, markets) -> list:
+    """图片可能的归档目录：当天的日期目录，被其他市场的图片占用时加市场后缀（如 2026-10-18-en-us）"""
+    date_str = get_date_from_meta(meta)
+    return [get_base_dir(date_str)] + [get_base_dir(f"{date_str}-{mkt.lower()}") for mkt in markets]
+
+
+def stored_key(base_dir: Path) -> Optional[str]:
+    """
+    目录中已归档（或处理中断）的图片去重键；目录未被占用时返回 None
+    没有记录 hsh 的旧归档返回空字符串
+    """
+    from src.wallpaper_meta import read_meta
+
+    if (base_dir / "meta.json").exists():
+        return read_meta(base_dir).get("hsh", "")
+    from src.pipeline import has_record, load_record
+
+    if has_record(base_dir):
+        item = load_record(base_dir).get("data", {}).get("item") or {}
+        return item.get("extra", {}).get("hsh")
+    return None
+
+
+def find_archive(meta: dict, markets, state: dict = None) -> Optional[Path]:
+    """
+    已归档这张图片（meta.json 已写入）的目录，没有时返回 None
+    先查 state/bing.json 的 images 索引；旧归档没有记录 hsh，主市场的图片按日期目录判断
+    """
+    key = image_key(meta)
+    known = (state or {}).get("images", {}).get(key)
+    if known and (Path(known) / "meta.json").exists():
+        return Path(known)
+    legacy_ok = get_markets(state)[0] in markets
+    for index, base_dir in enumerate(_candidate_dirs(meta, markets)):
+        if not (base_dir / "meta.json").exists():
+            continue
+        stored = stored_key(base_dir)
+        if stored == key or (stored == "" and legacy_ok and index == 0):
+            return base_dir
+    return None
+
+
+def archive_dir_for(meta: dict, markets, taken=()) -> Path:
+    """
+    新图片的归档目录：优先沿用处理中断的目录，其次第一个未被占用的目录
+    taken: 本次已分配给其他图片、尚未写入的目录（批量抓取时一次分配多张）
+    """
+    key = image_key(meta)
+    candidates = [base_dir for base_dir in _candidate_dirs(meta, markets) if base_dir not in taken]
+    stored = [stored_key(base_dir) for base_dir in candidates]
+    for base_dir, stored_as in zip(candidates, stored):
+        if stored_as == key:
+            return base_dir
+    for base_dir, stored_as in zip(candidates, stored):
+        if stored_as is None:
+            return base_dir
+    return get_base_dir(f"{get_date_from_meta(meta)}-{key[:8]}")
+
+
+def add_markets(base_dir: Path, markets: dict, hsh: str = None) -> bool:
+    """
+    把新列出同一张图片的市场合并进已归档壁纸的 meta.json，返回是否有变化（不重新下载、不重新生成故事）
+    传入 hsh 时顺带为没有记录 hsh 的旧归档补上
+    """
+    from src.catalog import upsert_entry
+    from src.wallpaper_meta import markets_of, read_meta, write_meta
+
+    meta_info = read_meta(base_dir)
+    known = meta_info.get("markets") or {}
+    added = {mkt: info for mkt, info in markets.items() if mkt not in known}
+    if not added:
+        return False
+    # 旧归档没有 markets 字段：它的顶层标题来自旧的唯一市场
+    if not known:
+        known = {mkt: {k: meta_info[k] for k in ("title", "copyright") if meta_info.get(k)}
+                 for mkt in markets_of("bing", meta_info) if mkt not in added}
+    meta_info["markets"] = {**known, **added}
+    if hsh:
+        meta_info.setdefault("hsh", hsh)
+    meta_info = write_meta(base_dir, meta_info)
+    upsert_entry("bing", base_dir, meta_info)
+    print(f"[OK] {base_dir} 新增市场: {', '.join(added)}")
+    return True
+
+
+def fetch_bing_images(idx: int = 0, n: int = 1, mkt: str = DEFAULT_MARKETS[0]) -> list:
+    """获取必应壁纸元数据列表；idx 为负数时 Bing 会返回尚未上线的壁纸（如果已经排期）"""
     params = {
         "format": "js",
-        "idx": 0,
-        "n": 1,
-        "mkt": "zh-CN"
-    }
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        "idx": idx,
+        "n": n,
+        "mkt": mkt
     }
     try:
-        resp = requests.get(BING_API, params=params, headers=headers, timeout=10)
+        resp = http_client.get(BING_API, params=params, headers=BING_HEADERS, timeout=10)
         resp.raise_for_status()
-        data = resp.json()
-        return data["images"][0]
+        return resp.json().get("images") or []
     except Exception as e:
-        print(f"[ERROR] 获取必应元数据失败: {e}")
-        return None
+        print(f"[ERROR] 获取必应元数据失败 ({mkt}): {e}")
+        return []
+
+
+def fetch_bing_metadata(idx: int = 0, mkt: str = DEFAULT_MARKETS[0]):
+    """获取必应每日壁纸元数据"""
+    images = fetch_bing_images(idx, mkt=mkt)
+    return images[0] if images else None
+
+
+def market_state(state: dict, mkt: str) -> dict:
+    """单个市场的状态：主市场沿用 state/bing.json 顶层字段，其他市场在 markets 下"""
+    if mkt == get_markets(state)[0]:
+        return state
+    return state.setdefault("markets", {}).setdefault(mkt, {})
+
+
+def check_for_update(state: dict, mkt: str = DEFAULT_MARKETS[0]):
+    """
+    快速路径：带上次的 ETag/Last-Modified 做条件请求
+    返回 (meta, validators)：
+      meta 为 None 表示服务端返回 304（内容未变）
+      validators 为本次响应的缓存校验头，用于写回状态文件
+    请求失败时抛出异常，由调用方回退到常规流程
+    """
+    headers = dict(BING_HEADERS)
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    params = {"format": "js", "idx": 0, "n": 1, "mkt": mkt}
+    resp = http_client.get(BING_API, params=params, headers=headers, timeout=10, retries=1)
+    validators = {
+        "etag": resp.headers.get("ETag") or state.get("etag"),
+        "last_modified": resp.headers.get("Last-Modified") or state.get("last_modified"),
+    }
+    if resp.status_code == 304:
+        return None, validators
+    resp.raise_for_status()
+    images = resp.json().get("images")
+    if not images:
+        raise ValueError("Bing API 未返回图片")
+    return images[0], validators
+
+
+def check_market(state: dict, mkt: str):
+    """
+    检查单个市场当前的壁纸，返回 (meta, validators)；meta 为 None 表示没有新内容（或获取失败）
+    304 但上次看到的图片尚未归档（处理中断）时，重新获取元数据；条件请求失败时依次尝试今天、昨天
+    """
+    mstate = market_state(state, mkt)
+    try:
+        meta, validators = check_for_update(mstate, mkt)
+        if meta is not None or (mstate.get("hsh") and find_archive(mstate, [mkt], state)):
+            return meta, validators
+    except Exception as e:
+        print(f"[WARN] {mkt} 快速检查失败，回退到常规流程: {e}")
+    for idx in (0, 1):  # 0=今天, 1=昨天
+        meta = fetch_bing_metadata(idx, mkt)
+        if meta:
+            return meta, {}
+    return None, {}
+
+
+def remember(state: dict, mkt: str, meta: dict, validators: dict, base_dir: Path):
+    """记录市场最近一次看到的图片与缓存校验头，以及图片 → 归档目录的索引"""
+    mstate = market_state(state, mkt)
+    mstate.update({**validators, "startdate": meta.get("startdate"), "hsh": meta.get("hsh"),
+                   "date": base_dir.name})
+    images = state.setdefault("images", {})
+    images.pop(image_key(meta), None)
+    images[image_key(meta)] = base_dir.as_posix()
+    for key in list(images)[:-IMAGE_INDEX_SIZE]:
+        images.pop(key)
 
 
 def download_image(url: str, save_path: Path):
-    """下载图片到指定路径"""
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    save_path.write_bytes(r.content)
-
-
-def generate_thumbnail(image_path: Path, thumb_path: Path):
-    """生成缩略图"""
-    with Image.open(image_path) as img:
-        img.thumbnail(THUMB_SIZE, Image.Resampling.LANCZOS)
-        # 确保目录存在 (为了 batch_fetch)
-        thumb_path.parent.mkdir(parents=True, exist_ok=True)
-        img.save(thumb_path, "JPEG", quality=85)
-
-
-def generate_story(title, copyright, image_path: Path):
-    """通过支持视觉的 LLM 生成壁纸背景故事"""
-    api_key = os.environ.get("LLM_API_KEY")
-    base_url = os.environ.get("LLM_BASE_URL", "https://api.openai.com/v1")
-    model_name = os.environ.get("LLM_MODEL_NAME", "gpt-4o") # 默认尝试视觉模型
-    
-    if not api_key:
+    """流式下载图片到指定路径（支持断点续传），返回 (sha256, 字节数)"""
+    return http_client.download_file(url, save_path, timeout=30)
+
+
+def generate_thumbnail(image_path: Path, thumb_path: Path, compress_kb: int = None):
+    """
+    生成缩略图
+    传入 compress_kb 时复用同一次解码，顺带把原图压缩到该大小以内（省去一次解码和一次读写）
+    """
+    from src.derivatives import generate_derivatives
+    generate_derivatives(image_path, outputs=("thumb",), compress_kb=compress_kb, paths={"thumb": thumb_path})
+
+
+def publish_staged(date_str: str, hsh: str = None, base_dir: Path = None) -> bool:
+    """
+    把预取的暂存目录原子移动到归档位置（默认当天的日期目录），返回是否发布了暂存的壁纸
+    下载 / 派生图 / 故事阶段的完成记录随之移到 state/pipeline/ 下，流水线只需补做 meta、推送与同步
+    暂存的图片与 Bing 当前公布的 hsh 不一致（临时换图）时丢弃暂存目录
+    """
+    from src.pipeline import move_record
+
+    staging_dir = get_staging_dir(date_str)
+    if not staging_dir.exists():
+        return False
+    staged = load_state(STATE_NAME).get("staged") or {}
+    if hsh and staged.get("hsh") and staged["hsh"] != hsh:
+        print(f"[WARN] {date_str} 的必应壁纸已更换，丢弃预取的暂存目录")
+        shutil.rmtree(staging_dir)
+        return False
+
+    base_dir = base_dir or get_base_dir(date_str)
+    if base_dir.exists():
+        # 没有 meta.json 的归档目录是之前中断的常规抓取，暂存目录更完整
+        shutil.rmtree(base_dir)
+    base_dir.parent.mkdir(parents=True, exist_ok=True)
+    move_record(staging_dir, base_dir)
+    os.replace(staging_dir, base_dir)
+    print(f"[INFO] 使用预取的 {date_str} 壁纸，已移动至 {base_dir}")
+    return True
+
+
+def prefetch(skip_story: bool = False):
+    """
+    预取主市场尚未上线的下一张壁纸：下载、生成派生图与故事，暂存到 state/staging/bing/<日期>
+    暂存目录不在 docs/ 下，不会提前出现在画廊、API 与图床中；上线后由 run() 移动到归档位置发布
+    返回暂存目录；Bing 还没有排出下一张壁纸时返回 None
+    """
+    from src.pipeline import run_pipeline, wallpaper_stages
+
+    mkt = configured_markets()[0]
+    upcoming = [m for m in fetch_bing_images(idx=-1, n=2, mkt=mkt) if not is_live(m)]
+    if not upcoming:
+        print("[INFO] Bing 尚未公布下一张壁纸，稍后再试")
         return None
 
-    # 从外部文件加载提示词
-    prompt_file = Path(os.environ.get("STORY_PROMPT_FILE", "prompts/story_prompt.txt"))
-    if prompt_file.exists():
-        system_prompt = prompt_file.read_text(encoding="utf-8").strip()
-    else:
-        system_prompt =  "你是一位地理与文化深度旅行作家。请结合提供的图片内容、标题和背景信息，写一篇约 500 字的精美短文。要求：\n1. 直接输出 Markdown 正文，不要包含“好的”、“这是一篇...”等开头或结尾的客套话。\n2. 标题使用一级标题 (# Title)。\n3. 内容要包含对画面视觉细节（光影、色彩、构图）的细腻描写，并自然引出背后的地理文化故事。\n4. 语言风格优美、感性且富有深度。"
-    
-    print(f"[INFO] 正在为 '{title}' 生成视觉深度故事...")
-    try:
-        # 读取图片并编码为 base64
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode('utf-8')
-
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        payload = {
-            "model": model_name,
-            "messages": [
-                {
-                    "role": "system", 
-                    "content": system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"题目：{title}\n背景项：{copyright}\n请结合这张图片进行创作。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "max_tokens": 1000
-        }
-        resp = requests.post(f"{base_url}/chat/completions", headers=headers, json=payload, timeout=90)
-        resp.raise_for_status()
-        result = resp.json()
-        story_text = result["choices"][0]["message"]["content"]
-        
-        # 在文章头部插入原图展示（根据图片文件名动态调整）
-        image_filename = image_path.name  # 获取实际文件名
-        final_content = f"![{title}]({image_filename})\n\n{story_text}"
-        return final_content
-    except Exception as e:
-        print(f"[WARN] 视觉故事生成失败: {e}")
+    meta = min(upcoming, key=lambda m: m.get("fullstartdate") or m.get("startdate", ""))
+    date_str = get_date_from_meta(meta)
+    if find_archive(meta, [mkt]):
+        print(f"[INFO] {date_str} 的壁纸已归档，无需预取")
+        return None
+
+    staging_dir = get_staging_dir(date_str)
+    state = load_state(STATE_NAME)
+    if (state.get("staged") or {}).get("hsh") not in (None, meta.get("hsh")) and staging_dir.exists():
+        print(f"[WARN] {date_str} 的预取壁纸已更换，重新预取")
+        shutil.rmtree(staging_dir)
+
+    print(f"[INFO] 预取 {date_str} 的必应壁纸（上线时间 {meta.get('fullstartdate')} UTC）")
+    # 只执行到故事为止：meta.json、目录索引、推送与同步都要等上线后再做
+    item = bing_item(meta, {mkt: market_info(meta)})
+    stages = [stage for stage in wallpaper_stages(lambda: item)
+              if stage.name in ("metadata", "download", "derivatives", "story")]
+    result = run_pipeline(stages, staging_dir, {
+        "source": "bing",
+        "display_name": "Bing",
+        "options": {"skip_story": skip_story, "notify": True, "sync": True},
+    })
+    if result["failed"]:
+        print(f"[WARN] {date_str} 的预取未完成: {result['failed']}（下次预取会从未完成的阶段继续）")
+
+    save_state(STATE_NAME, {**state, "staged": {k: meta.get(k) for k in STAGED_FIELDS if meta.get(k)}})
+    print(f"[OK] 已暂存至 {staging_dir}")
+    return staging_dir
+
+
+def run(skip_story: bool = False, render: bool = True, defer_story: bool = False):
+    """
+    并发抓取各市场当前的壁纸并归档，同一张图片（按 hsh 去重）只下载、压缩、生成故事一次；
+    返回第一个新增或更新的归档目录，没有新壁纸时返回 None
+    render=False 时不更新 README/Gallery，由编排器 (fetch_all.py) 汇总后统一渲染
+    defer_story=True 时先发布图片，故事由 scripts/story_worker.py 补写
+    """
+    from src.wallpaper_meta import read_meta
+
+    # 0. 快速路径：各市场并发做条件请求，都已归档时直接退出（不导入 Pillow、PyYAML 等重模块）
+    state = load_state(STATE_NAME)
+    recorded = "market_list" in state
+    markets = state["market_list"] = get_markets(state)
+    # 预取的壁纸同样以 Bing 当前公布的主市场图片为准：hsh 一致才发布暂存目录（见 publish_staged）
+    staged = state.get("staged")
+
+    def check_all(mkts) -> list:
+        """并发检查各市场，已归档的记入状态，返回 [(市场, 新图片的元数据)]"""
+        if not mkts:
+            return []
+        with ThreadPoolExecutor(max_workers=len(mkts)) as pool:
+            checked.update(zip(mkts, pool.map(lambda mkt: check_market(state, mkt), mkts)))
+        found = []
+        for mkt in mkts:
+            meta, validators = checked[mkt]
+            if meta is None:
+                continue
+            archive = find_archive(meta, [mkt], state)
+            if archive and mkt in read_meta(archive).get("markets", {}):
+                remember(state, mkt, meta, validators, archive)
+            else:
+                found.append((mkt, meta))
+        return found
+
+    checked = {}
+    listings = check_all(markets)
+    if listings and recorded:
+        # 有新壁纸才读取配置并更新记下的市场列表：配置中新增的市场补查一次，移出配置的市场不再处理
+        configured = configured_markets()
+        added = [mkt for mkt in configured if mkt not in checked]
+        state["market_list"] = markets = configured
+        listings = [(mkt, meta) for mkt, meta in listings if mkt in configured] + check_all(added)
+    if not listings:
+        save_state(STATE_NAME, state)
+        print(f"[INFO] 必应壁纸未更新（{', '.join(markets)}），耗时 {time.perf_counter() - _START:.2f}s")
+        return None
+
+    # 有新壁纸才导入重模块
+    from src.pipeline import process_wallpaper
+
+    changed = []
+    for group in group_by_image(listings):
+        meta, group_markets = group["meta"], group["markets"]
+        date_str = get_date_from_meta(meta)
+        base_dir = find_archive(meta, group_markets, state)
+        if base_dir:
+            # 其他市场已归档的同一张图片：只合并各市场的标题与版权信息
+            if add_markets(base_dir, group_markets, meta.get("hsh")):
+                changed.append(base_dir)
+        else:
+            base_dir = archive_dir_for(meta, group_markets)
+            primary = markets[0] in group_markets
+            print(f"[INFO] 使用 {date_str} 的壁纸（{', '.join(group_markets)}）→ {base_dir}")
+            if primary:
+                # 预取过的壁纸：移动暂存目录即可，下载 / 派生图 / 故事阶段已完成；Bing 临时换图时丢弃暂存目录
+                publish_staged(date_str, meta.get("hsh"), base_dir)
+
+            # 2-9. 下载 → 派生图/压缩 → 故事 → meta.json → 推送 / GitHub 同步（中断后重跑会从未完成的阶段继续）
+            # 只有主市场的图片推送企业微信
+            item = bing_item(meta, group_markets)
+            result = process_wallpaper("bing", base_dir, lambda: item, display_name="Bing",
+                                       skip_story=skip_story, defer_story=defer_story, notify=primary, sync=True)
+            if "meta" in result["failed"]:
+                print(f"[ERROR] {base_dir.name} 的壁纸处理未完成: {result['failed']}")
+                continue
+            # 预取的壁纸在暂存时只记录了主市场
+            add_markets(base_dir, group_markets)
+            changed.append(base_dir)
+
+        for mkt in group_markets:
+            remember(state, mkt, *checked[mkt], base_dir)
+        # 暂存的壁纸已发布，或同一天 Bing 公布了另一张图片（暂存目录已丢弃）
+        if staged and (image_key(staged) == image_key(meta)
+                       or markets[0] in group_markets and get_date_from_meta(staged) == date_str):
+            state.pop("staged", None)
+    save_state(STATE_NAME, state)
+
+    if not changed:
         return None
 
+    # 更新 README 与 Gallery
+    if render:
+        from src.update_gallery import update_gallery
+        from src.update_readme import update_readme
 
-def push_to_wecom(webhook_url: str, image_path: Path, meta: dict, story_content: str = None, source_name: str = "Bing"):
-    """推送图片、消息和故事到企业微信处理核心"""
-    try:
-        # 1. 发送图片
-        send_image_to_wecom(webhook_url, str(image_path))
-        print("[OK] 企业微信图片推送成功")
-
-        # 2. 发送 markdown 消息（元数据）
-        send_markdown_to_wecom(webhook_url, meta, source_name=source_name)
-        print("[OK] 企业微信消息推送成功")
-        
-        # 3. 发送故事内容（如果存在）
-        if story_content:
-            send_story_to_wecom(webhook_url, meta, story_content)
-            print("[OK] 企业微信故事推送成功")
-    except Exception as e:
-        print(f"[WARN] 企业微信推送失败: {e}")
+        update_readme()
+        update_gallery()
+        print("[OK] docs/index.html 已更新")
+
+    print(f"\n✅ 完成！壁纸已归档至 {', '.join(str(d) for d in changed)}")
+    return changed[0]
 
 
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='抓取必应每日壁纸')
     parser.add_argument('--skip-story', action='store_true', help='跳过 AI 故事生成（快速模式）')
+    parser.add_argument('--defer-story', action='store_true', help='先发布图片，故事由 scripts/story_worker.py 补写')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='整次运行的时间预算（秒），不够时推迟故事 / 推送 / 同步')
+    parser.add_argument('--prefetch', action='store_true',
+                        help='预取尚未上线的下一张壁纸（下载、派生图、故事），上线后由常规运行发布')
     args = parser.parse_args()
-    
-    load_env()
-
-    # 1. 获取元数据（尝试今天，如果不存在则使用昨天）
-    print(f"[INFO] 正在获取必应壁纸...")
-    
-    meta = None
-    today = None
-    for idx in [0, 1]:  # 0=今天, 1=昨天
-        params = {
-            "format": "js",
-            "idx": idx,
-            "n": 1,
-            "mkt": "zh-CN"
-        }
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        try:
-            resp = requests.get(BING_API, params=params, headers=headers, timeout=10)
-            resp.raise_for_status()
-            data = resp.json()
-            if not data.get("images"):
-                continue
-            curr_meta = data["images"][0]
-        except Exception as e:
-            print(f"[WARN] Bing API 请求失败 (idx={idx}): {e}")
-            continue
-        
-        # 使用 API 返回的日期作为文件夹名（增加月份层级）
-        curr_date_str = get_date_from_meta(curr_meta)
-        month_str = curr_date_str[:7]  # YYYY-MM
-        curr_base_dir = Path("docs/wallpapers/bing") / month_str / curr_date_str
-        
-        # 如果该日期的壁纸已存在，且是 idx=0 (今天)，则跳过
-        if curr_base_dir.exists() and (curr_base_dir / "image.jpg").exists():
-            if idx == 0:
-                print(f"[INFO] {curr_date_str} 的壁纸已存在，不再重复下载。")
-                return
-            else:
-                continue
-        
-        # 找到可用的壁纸，赋值并跳出循环
-        meta = curr_meta
-        today = curr_date_str
-        base_dir = curr_base_dir
-        print(f"[INFO] 使用 {today} 的壁纸（idx={idx}）")
-        break
-    
-    if not meta:
-        print("[ERROR] 无法获取任何有效的必应壁纸元数据，程序退出。")
-        return
-    
-    base_dir.mkdir(parents=True, exist_ok=True)
-
-    # 2. 下载原图
-    image_url = BING_BASE + meta["url"]
-    image_path = base_dir / "image.jpg"
-    download_image(image_url, image_path)
-    print(f"[OK] 壁纸已下载: {image_path} ({meta.get('title')})")
 
-    # 3. 生成缩略图
-    thumb_path = base_dir / "thumb.jpg"
-    generate_thumbnail(image_path, thumb_path)
-    print(f"[OK] 缩略图已生成: {thumb_path}")
-
-    # 3.5. 压缩原图 (优化存储和分发)
-    try:
-        from scripts.optimize_images import compress_image
-        compress_image(image_path, target_size_kb=1024)
-    except Exception as e:
-        print(f"[WARN] 原图压缩失败: {e}")
-
-    # 4. 生成 AI 故事 (带视觉) - 可选
-    story_content = None
-    if not args.skip_story:
-        story_content = generate_story(meta.get("title"), meta.get("copyright"), image_path)
-        if story_content:
-            (base_dir / "story.md").write_text(story_content, encoding="utf-8")
-            print(f"[OK] AI 故事已生成: {base_dir / 'story.md'}")
-    else:
-        print(f"[INFO] 跳过故事生成（使用 --skip-story）")
-
-    # 5. 保存元数据
-    meta_path = base_dir / "meta.json"
-    meta_info = {
-        "date": today,
-        "title": meta.get("title"),
-        "copyright": meta.get("copyright"),
-        "image_url": image_url,
-        "has_story": bool(story_content)
-    }
-    meta_path.write_text(
-        json.dumps(meta_info, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
-    print(f"[OK] 元数据已保存: {meta_path}")
-
-    # 6. 更新 README
-    update_readme()
-    print("[OK] README.md 已更新")
-
-    # 7. 更新 Gallery
-    update_gallery()
-    print("[OK] docs/index.html 已更新")
-
-    # 8. 推送企业微信
-    webhook_url = os.environ.get("WEWORK_WEBHOOK")
-    if webhook_url:
-        push_to_wecom(webhook_url, image_path, meta_info, story_content, source_name="Bing")
-    else:
-        print("[INFO] WEWORK_WEBHOOK 未配置，跳过推送")
-
-    # 9. 同步到另一个 GitHub 仓库 (blog-images)
-    from src.utils import upload_to_github
-    sync_path = f"wallpapers/bing/{today[:7]}/{today}/image.jpg"
-    upload_to_github(str(image_path), sync_path)
-
-    print(f"\n✅ 完成！壁纸已归档至 {base_dir}")
+    load_env()
+    # 运行锁：与定时任务 / 其他手动运行重叠时直接退出，避免重复下载和重复调用 LLM
+    with run_control.run_lock("bing") as acquired:
+        if not acquired:
+            return
+        run_control.start_budget(args.deadline)
+        if args.prefetch:
+            prefetch(skip_story=args.skip_story)
+        else:
+            run(skip_story=args.skip_story, defer_story=args.defer_story)
+    http_client.print_stats()
 
 
 if __name__ == "__main__":
@@ -7,20 +7,14 @@ Unsplash 每日壁纸抓取脚本
 import argparse
 
 import os
-import json
-import base64
-import requests
 from datetime import datetime, timezone
 from pathlib import Path
-from PIL import Image
 
 # 复用主脚本的函数
 import sys
 sys.path.insert(0, str(Path(__file__).parent))
-from fetch_bing_wallpaper import generate_thumbnail, generate_story, load_env
-from src.utils import send_image_to_wecom, send_markdown_to_wecom, send_story_to_wecom
-from src.update_readme import update_readme
-from src.update_gallery import update_gallery
+from fetch_bing_wallpaper import load_env
+from src import http_client, run_control
 
 
 UNSPLASH_API = "https://api.unsplash.com/photos/random"
@@ -43,7 +37,7 @@ def fetch_unsplash_photo():
     }
     
     try:
-        resp = requests.get(UNSPLASH_API, headers=headers, params=params, timeout=10)
+        resp = http_client.get(UNSPLASH_API, headers=headers, params=params, timeout=10)
         resp.raise_for_status()
         return resp.json()
     except Exception as e:
@@ -51,110 +45,85 @@ def fetch_unsplash_photo():
         return None
 
 
+def unsplash_item(photo: dict, date_str: str) -> dict:
+    """把 Unsplash API 返回的照片转换为流水线使用的 item"""
+    author = photo.get("user", {}).get("name", "Unknown")
+    return {
+        "date": date_str,
+        "download_url": photo["urls"]["full"],  # 使用全尺寸图片
+        "title": photo.get("description") or photo.get("alt_description") or "Unsplash Featured Photo",
+        "copyright": f"Photo by {author} on Unsplash",
+        "extra": {"image_url": photo["links"]["html"], "photographer": author},
+    }
+
+
 def download_image(url: str, save_path: Path):
-    """下载图片"""
-    r = requests.get(url, timeout=30)
-    r.raise_for_status()
-    save_path.write_bytes(r.content)
+    """流式下载图片（Unsplash 原图常有数 MB，支持断点续传），返回 (sha256, 字节数)"""
+    return http_client.download_file(url, save_path, timeout=30)
 
 
-def main():
-    # 解析命令行参数
-    parser = argparse.ArgumentParser(description='抓取 Unsplash 精选壁纸')
-    parser.add_argument('--skip-story', action='store_true', help='跳过 AI 故事生成（快速模式）')
-    args = parser.parse_args()
-    
-    load_env()
-    
-    # 1. 获取照片
-    print("[INFO] 正在获取 Unsplash 精选照片...")
-    photo = fetch_unsplash_photo()
-    
-    if not photo:
-        return
-    
+def run(skip_story: bool = False, render: bool = True, defer_story: bool = False):
+    """
+    抓取并归档一张壁纸，返回归档目录；无新壁纸时返回 None
+    render=False 时不更新 README/Gallery，由编排器 (fetch_all.py) 汇总后统一渲染
+    defer_story=True 时先发布图片，故事由 scripts/story_worker.py 补写
+    """
     # 使用今天的日期并增加月份层级
     today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
     month_str = today[:7]  # YYYY-MM
     base_dir = Path("docs/wallpapers/unsplash") / month_str / today
-    
-    if base_dir.exists() and (base_dir / "image.jpg").exists():
+
+    # 先检查本地归档，已存在时不消耗 API 配额，也不导入重模块
+    # （只有原图没有 meta.json 说明上次处理中断，流水线会从未完成的阶段继续）
+    if (base_dir / "meta.json").exists():
         print(f"[INFO] {today} 的 Unsplash 壁纸已存在")
         return
-    
-    base_dir.mkdir(parents=True, exist_ok=True)
-    
-    # 2. 下载原图
-    image_url = photo["urls"]["full"]  # 使用全尺寸图片
-    image_path = base_dir / "image.jpg"
-    download_image(image_url, image_path)
-    print(f"[OK] Unsplash 照片已下载: {photo.get('description', 'Untitled')}")
-    
-    # 3. 生成缩略图
-    thumb_path = base_dir / "thumb.jpg"
-    generate_thumbnail(image_path, thumb_path)
-    print(f"[OK] 缩略图已生成")
 
-    # 3.5. 压缩原图 (优化存储和分发)
-    try:
-        from scripts.optimize_images import compress_image
-        compress_image(image_path, target_size_kb=1024)
-    except Exception as e:
-        print(f"[WARN] 原图压缩失败: {e}")
-    
-    # 4. 生成 AI 故事 - 可选
-    title = photo.get("description") or photo.get("alt_description") or "Unsplash Featured Photo"
-    author = photo.get("user", {}).get("name", "Unknown")
-    copyright_info = f"Photo by {author} on Unsplash"
-    
-    story_content = None
-    if not args.skip_story:
-        story_content = generate_story(title, copyright_info, image_path)
-        if story_content:
-            (base_dir / "story.md").write_text(story_content, encoding="utf-8")
-            print(f"[OK] AI 故事已生成")
-    else:
-        print(f"[INFO] 跳过故事生成（使用 --skip-story）")
-    
-    # 5. 保存元数据
-    meta_path = base_dir / "meta.json"
-    meta_info = {
-        "date": today,
-        "title": title,
-        "copyright": copyright_info,
-        "image_url": photo["links"]["html"],
-        "photographer": author,
-        "has_story": bool(story_content)
-    }
-    meta_path.write_text(json.dumps(meta_info, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(f"[OK] 元数据已保存")
-    
-    # 6. 更新 README
-    update_readme()
-    print("[OK] README.md 已更新")
-    
-    # 7. 更新 Gallery
-    update_gallery()
-    print("[OK] docs/index.html 已更新")
-    
-    # 8. 推送企业微信（可选）
-    webhook_url = os.environ.get("WEWORK_WEBHOOK")
-    if webhook_url:
-        try:
-            send_image_to_wecom(webhook_url, str(image_path))
-            send_markdown_to_wecom(webhook_url, meta_info, source_name="Unsplash")
-            if story_content:
-                send_story_to_wecom(webhook_url, meta_info, story_content)
-            print("[OK] Unsplash 企业微信推送成功")
-        except Exception as e:
-            print(f"[WARN] Unsplash 企业微信推送失败: {e}")
-    
-    # 9. 同步到另一个 GitHub 仓库 (blog-images)
-    from src.utils import upload_to_github
-    sync_path = f"wallpapers/unsplash/{today[:7]}/{today}/image.jpg"
-    upload_to_github(str(image_path), sync_path)
-    
+    from src.pipeline import process_wallpaper
+
+    def fetch_item():
+        print("[INFO] 正在获取 Unsplash 精选照片...")
+        photo = fetch_unsplash_photo()
+        return unsplash_item(photo, today) if photo else None
+
+    # 1-9. 获取照片 → 下载 → 派生图/压缩 → 故事 → meta.json → 推送 / GitHub 同步
+    # 照片元数据写入完成记录，中断重跑时不会换成另一张随机照片
+    result = process_wallpaper("unsplash", base_dir, fetch_item, display_name="Unsplash",
+                               skip_story=skip_story, defer_story=defer_story, notify=True, sync=True)
+    if "meta" in result["failed"]:
+        print(f"[ERROR] {today} 的 Unsplash 壁纸处理未完成: {result['failed']}")
+        return None
+
+    # 更新 README 与 Gallery
+    if render:
+        from src.update_gallery import update_gallery
+        from src.update_readme import update_readme
+
+        update_readme()
+        update_gallery()
+        print("[OK] docs/index.html 已更新")
+
     print(f"\n✅ 完成！Unsplash 壁纸已归档至 {base_dir}")
+    return base_dir
+
+
+def main():
+    # 解析命令行参数
+    parser = argparse.ArgumentParser(description='抓取 Unsplash 精选壁纸')
+    parser.add_argument('--skip-story', action='store_true', help='跳过 AI 故事生成（快速模式）')
+    parser.add_argument('--defer-story', action='store_true', help='先发布图片，故事由 scripts/story_worker.py 补写')
+    parser.add_argument('--deadline', type=float, metavar='SECONDS',
+                        help='整次运行的时间预算（秒），不够时推迟故事 / 推送 / 同步')
+    args = parser.parse_args()
+
+    load_env()
+    # 运行锁：与定时任务 / 其他手动运行重叠时直接退出，避免重复下载和重复调用 LLM
+    with run_control.run_lock("unsplash") as acquired:
+        if not acquired:
+            return
+        run_control.start_budget(args.deadline)
+        run(skip_story=args.skip_story, defer_story=args.defer_story)
+    http_client.print_stats()
 
 
 if __name__ == "__main__":
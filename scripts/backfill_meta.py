@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+一次性工具：把存量 meta.json 升级为 v2 结构
+补写分辨率、文件大小、SHA-256、缩略图尺寸等信息，完成后重建目录索引
+用法:
+  python scripts/backfill_meta.py            # 默认按 CPU 核数并行
+  python scripts/backfill_meta.py --jobs 4
+  python scripts/backfill_meta.py --force    # 已是 v2 的也重新计算
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.catalog import rebuild_catalog
+from src.wallpaper_meta import is_current, read_meta, write_meta
+
+
+def upgrade_one(date_dir: str, force: bool = False) -> str:
+    """升级单个目录，返回 upgraded / skipped / error:<原因>"""
+    base_dir = Path(date_dir)
+    try:
+        meta = read_meta(base_dir)
+        if is_current(meta) and not force:
+            return "skipped"
+        if not (base_dir / "image.jpg").exists():
+            return "error:缺少 image.jpg"
+        write_meta(base_dir, meta)
+        return "upgraded"
+    except Exception as e:
+        return f"error:{e}"
+
+
+def backfill_meta(jobs: int = None, force: bool = False):
+    print("🚀 开始升级存量 meta.json ...")
+    base = Path("docs/wallpapers")
+    date_dirs = sorted(str(p.parent) for p in base.rglob("meta.json"))
+
+    upgraded = skipped = failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = pool.map(upgrade_one, date_dirs, [force] * len(date_dirs), chunksize=16)
+        for date_dir, result in zip(date_dirs, results):
+            if result == "upgraded":
+                upgraded += 1
+            elif result == "skipped":
+                skipped += 1
+            else:
+                failed += 1
+                print(f"[WARN] {date_dir}: {result[len('error:'):]}")
+
+    print(f"✅ 升级完成：升级 {upgraded}，跳过 {skipped}，失败 {failed}")
+    if upgraded:
+        rebuild_catalog()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="升级存量 meta.json 到 v2 结构")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="并行进程数")
+    parser.add_argument("--force", action="store_true", help="已是 v2 的 meta.json 也重新计算")
+    args = parser.parse_args()
+
+    backfill_meta(jobs=args.jobs, force=args.force)
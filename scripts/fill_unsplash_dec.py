@@ -6,13 +6,13 @@
 import os
 import sys
 import json
-import requests
 from pathlib import Path
 from PIL import Image
 
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 import fetch_bing_wallpaper
+from src import http_client
 
 UNSPLASH_API = "https://api.unsplash.com/photos/random"
 
@@ -49,7 +49,7 @@ def fill_unsplash_december():
         }
         
         try:
-            resp = requests.get(UNSPLASH_API, headers=headers, params=params, timeout=10)
+            resp = http_client.get(UNSPLASH_API, headers=headers, params=params, timeout=10)
             resp.raise_for_status()
             photo = resp.json()
             
@@ -1,96 +1,236 @@
 #!/usr/bin/env python3
 """
 异步生成缺失的 AI 故事
-扫描所有壁纸目录，为没有 story.md 的壁纸生成故事
+递归扫描所有壁纸目录 (docs/wallpapers/<源>/YYYY-MM/YYYY-MM-DD)，为没有 story.md 的壁纸生成故事
+
+两种执行方式:
+  并发池（默认）  --jobs 个线程并发调用，按 --rpm 每分钟请求数限速；--jobs 1 即逐个生成
+  Batch API       --batch 把请求打包成 JSONL 提交到 OpenAI 兼容的批处理接口，轮询结束后写回结果；
+                  批任务 ID 记录在 state/story_batches.json，--no-wait 提交后即退出，下次运行继续收取；
+                  服务商不支持批处理接口时自动退回并发池
+
+按提示词版本 / 模型选择性重新生成（依据 meta.json 的 "story" 字段，并删除对应的故事缓存）:
+  python scripts/generate_missing_stories.py --regenerate-prompt 3f2a9c
+  python scripts/generate_missing_stories.py --regenerate-model gpt-4o
+
+用法:
+  python scripts/generate_missing_stories.py --jobs 4 --rpm 30
+  python scripts/generate_missing_stories.py --batch
+  python scripts/generate_missing_stories.py --batch --no-wait
 """
 
+import argparse
 import os
 import sys
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
-import fetch_bing_wallpaper
+from fetch_bing_wallpaper import load_env
 from src.update_readme import update_readme
 from src.update_gallery import update_gallery
+from src.catalog import upsert_entry
+from src.wallpaper_meta import write_meta
+from src.storage import sync_wallpapers
+from src.state import load_state, save_state
+from src import llm_client, story, story_cache
 
+WALLPAPERS_BASE = Path("docs/wallpapers")
+BATCH_STATE = "story_batches"
+BATCH_MAX_REQUESTS = 500
+POLL_SECONDS = 30
 
-def generate_missing_stories():
-    """生成所有缺失的故事"""
-    print("🚀 开始扫描并生成缺失的故事...")
-    
-    fetch_bing_wallpaper.load_env()
-    wallpapers_base = Path("docs/wallpapers")
-    
-    total_count = 0
-    success_count = 0
-    
-    # 遍历所有源
-    for source_dir in wallpapers_base.iterdir():
-        if not source_dir.is_dir() or source_dir.name.startswith('.'):
+
+def needs_regeneration(meta_path: Path, prompt: str = None, model: str = None) -> bool:
+    """已有故事是否由指定的提示词版本（SHA 前缀）/ 模型生成"""
+    if (prompt is None and model is None) or not meta_path.exists():
+        return False
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    return story_cache.matches(meta.get("story"), prompt, model)
+
+
+def find_missing(regenerate_prompt: str = None, regenerate_model: str = None):
+    """递归查找需要生成故事的壁纸，按日期倒序返回 [{id, source, date, dir, title, copyright}]"""
+    jobs = []
+    for meta_path in WALLPAPERS_BASE.rglob("meta.json"):
+        date_dir = meta_path.parent
+        source_name = date_dir.relative_to(WALLPAPERS_BASE).parts[0]
+        if (date_dir / "story.md").exists() and not needs_regeneration(meta_path, regenerate_prompt, regenerate_model):
             continue
-        
-        source_name = source_dir.name
-        print(f"\n📂 处理 {source_name} 源...")
-        
-        # 遍历所有日期目录
-        for date_dir in sorted(source_dir.iterdir(), reverse=True):
-            if not date_dir.is_dir():
-                continue
-            
-            date_str = date_dir.name
-            story_path = date_dir / "story.md"
-            meta_path = date_dir / "meta.json"
-            image_path = date_dir / "image.jpg"
-            
-            # 检查是否需要生成故事
-            if story_path.exists():
-                continue
-            
-            if not meta_path.exists() or not image_path.exists():
-                print(f"[SKIP] {date_str}: 缺少元数据或图片")
-                continue
-            
-            total_count += 1
-            
-            try:
-                # 读取元数据
-                meta = json.loads(meta_path.read_text(encoding="utf-8"))
-                title = meta.get("title", "Wallpaper")
-                copyright_info = meta.get("copyright", "")
-                
-                # 生成故事
-                print(f"[INFO] 正在为 {source_name}/{date_str} 生成故事...")
-                story_content = fetch_bing_wallpaper.generate_story(title, copyright_info, image_path)
-                
-                if story_content:
-                    story_path.write_text(story_content, encoding="utf-8")
-                    
-                    # 更新元数据
-                    meta["has_story"] = True
-                    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
-                    
-                    print(f"✅ {source_name}/{date_str}: 故事已生成")
-                    
-                    # 同步到 COS
-                    from src.utils import upload_to_cos
-                    cos_base_path = f"wallpapers/{source_name}/{date_str}"
-                    upload_to_cos(str(story_path), f"{cos_base_path}/story.md")
-                    upload_to_cos(str(meta_path), f"{cos_base_path}/meta.json")
-                    
-                    success_count += 1
-                else:
-                    print(f"[WARN] {source_name}/{date_str}: 故事生成失败")
-                    
-            except Exception as e:
-                print(f"[ERROR] {source_name}/{date_str}: {e}")
+        if not (date_dir / "image.jpg").exists():
+            print(f"[SKIP] {source_name}/{date_dir.name}: 缺少图片")
+            continue
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        jobs.append({
+            "id": f"{source_name}/{date_dir.name}",
+            "source": source_name,
+            "date": date_dir.name,
+            "dir": date_dir.as_posix(),
+            "title": meta.get("title", "Wallpaper"),
+            "copyright": meta.get("copyright", ""),
+        })
+    jobs.sort(key=lambda job: job["date"], reverse=True)
+    return jobs
+
+
+def save_story_meta(job: dict, story_info: dict):
+    """故事写入后更新 meta.json 与目录索引（同时清除两阶段发布留下的 story_pending）"""
+    date_dir = Path(job["dir"])
+    meta = json.loads((date_dir / "meta.json").read_text(encoding="utf-8"))
+    meta["has_story"] = True
+    meta["story"] = story_info
+    meta.pop("story_pending", None)
+    meta = write_meta(date_dir, meta)
+    upsert_entry(job["source"], date_dir, meta)
+    print(f"✅ {job['id']}: 故事已生成")
+
+
+def run_pool(jobs, workers: int = 1, rpm: float = 0):
+    """并发池：每个请求单独调用，按 rpm 限速；返回成功的目录"""
+    limiter = llm_client.RateLimiter(rpm)
+
+    def one(job):
+        date_dir = Path(job["dir"])
+        try:
+            limiter.wait()
+            print(f"[INFO] 正在为 {job['id']} 生成故事...")
+            story_info = {}
+            story_content = story.generate_story(
+                job["title"], job["copyright"], date_dir / "image.jpg", info=story_info,
+                story_path=date_dir / "story.md")
+            if not story_content:
+                print(f"[WARN] {job['id']}: 故事生成失败")
+                return None
+            save_story_meta(job, story_info)
+            return date_dir
+        except Exception as e:
+            print(f"[ERROR] {job['id']}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return [d for d in pool.map(one, jobs) if d]
+
+
+def _finish_batch(batch_entry: dict, results: dict):
+    """把一个批任务的结果写回各壁纸目录，返回成功的目录"""
+    done = []
+    for custom_id, job in batch_entry["jobs"].items():
+        result = results.get(custom_id)
+        if not result or "error" in result:
+            print(f"[WARN] {custom_id}: 批任务未返回故事 ({(result or {}).get('error', '无结果')})")
+            continue
+        date_dir = Path(job["dir"])
+        try:
+            story_cache.put(job["story"]["cache_key"], result["text"], job["story"])
+            story.finish_story(job["title"], date_dir / "image.jpg", result["text"], date_dir / "story.md")
+            save_story_meta(job, job["story"])
+            done.append(date_dir)
+        except Exception as e:
+            print(f"[ERROR] {custom_id}: {e}")
+    return done
+
+
+def run_batch(jobs, wait: bool = True, poll: float = POLL_SECONDS):
+    """
+    Batch API：先收取上次提交的批任务，再为剩余的壁纸提交新批任务
+    返回成功的目录；服务商不支持批处理时抛出 BatchUnsupported
+    """
+    api_key = os.environ.get("LLM_API_KEY")
+    base_url = os.environ.get("LLM_BASE_URL") or "https://api.openai.com/v1"
+    state = load_state(BATCH_STATE)
+    # 其他服务商提交的批任务原样保留
+    others = [b for b in state.get("batches", []) if b.get("base_url") != base_url]
+    batches = [b for b in state.get("batches", []) if b.get("base_url") == base_url]
+    pending_ids = {custom_id for b in batches for custom_id in b["jobs"]}
+
+    # 缓存命中的直接写回，不进入批任务
+    done, to_submit = [], []
+    for job in jobs:
+        if job["id"] in pending_ids:
+            continue
+        provenance = story.story_provenance(Path(job["dir"]) / "image.jpg")
+        cached = story_cache.get(provenance["cache_key"])
+        if cached:
+            story.finish_story(job["title"], Path(job["dir"]) / "image.jpg", cached,
+                               Path(job["dir"]) / "story.md")
+            save_story_meta(job, provenance)
+            done.append(Path(job["dir"]))
+        else:
+            to_submit.append({**job, "story": provenance})
+
+    for start in range(0, len(to_submit), BATCH_MAX_REQUESTS):
+        chunk = to_submit[start:start + BATCH_MAX_REQUESTS]
+        requests_ = [(job["id"], story.story_payload(job["title"], job["copyright"],
+                                                     Path(job["dir"]) / "image.jpg"))
+                     for job in chunk]
+        batch_id = llm_client.submit_batch(base_url, api_key, requests_)
+        batches.append({"id": batch_id, "base_url": base_url, "submitted": int(time.time()),
+                        "jobs": {job["id"]: job for job in chunk}})
+        state["batches"] = others + batches
+        save_state(BATCH_STATE, state)
+        print(f"[OK] 已提交批任务 {batch_id}（{len(chunk)} 个请求）")
+
+    # 轮询直到全部批任务结束（--no-wait 时只检查一次）
+    while batches:
+        remaining = []
+        for entry in batches:
+            batch = llm_client.get_batch(base_url, api_key, entry["id"])
+            status = batch.get("status")
+            if status not in llm_client.BATCH_TERMINAL:
+                counts = batch.get("request_counts") or {}
+                print(f"[INFO] 批任务 {entry['id']}: {status} ({counts.get('completed', 0)}/{counts.get('total', len(entry['jobs']))})")
+                remaining.append(entry)
                 continue
-    
-    print(f"\n✅ 故事生成完成：成功 {success_count}/{total_count}")
-    
-    # 更新 README 和 Gallery
-    if success_count > 0:
+            print(f"[INFO] 批任务 {entry['id']} 已结束: {status}")
+            done += _finish_batch(entry, llm_client.batch_results(base_url, api_key, batch))
+        batches = remaining
+        state["batches"] = others + batches
+        save_state(BATCH_STATE, state)
+        if not batches or not wait:
+            break
+        time.sleep(poll)
+
+    if batches:
+        print(f"[INFO] 还有 {len(batches)} 个批任务未完成，下次运行时继续收取")
+    return done
+
+
+def generate_missing_stories(regenerate_prompt: str = None, regenerate_model: str = None,
+                             batch: bool = False, workers: int = 1, rpm: float = 0,
+                             wait: bool = True, poll: float = POLL_SECONDS):
+    """生成所有缺失的故事；指定提示词版本 / 模型时，这些版本生成的故事也重新生成"""
+    print("🚀 开始扫描并生成缺失的故事...")
+
+    load_env()
+    if not os.environ.get("LLM_API_KEY"):
+        print("[WARN] LLM_API_KEY 未配置，无法生成故事")
+        return
+    if regenerate_prompt or regenerate_model:
+        removed = story_cache.invalidate(prompt=regenerate_prompt, model=regenerate_model)
+        print(f"[INFO] 已删除 {removed} 条匹配的故事缓存")
+
+    jobs = find_missing(regenerate_prompt, regenerate_model)
+    total_count = len(jobs)
+    print(f"[INFO] 共 {total_count} 张壁纸需要生成故事")
+
+    done = []
+    if batch:
+        try:
+            done = run_batch(jobs, wait=wait, poll=poll)
+            jobs = []
+        except llm_client.BatchUnsupported as e:
+            print(f"[WARN] 服务商不支持 Batch API ({e})，改用并发池")
+    if jobs:
+        done += run_pool(jobs, workers=workers, rpm=rpm)
+
+    print(f"\n✅ 故事生成完成：成功 {len(done)}/{total_count}")
+
+    # 同步新写入的故事与元数据，并更新 README 和 Gallery
+    if done:
+        sync_wallpapers(done, names=("story.md", "meta.json"))
         print("\n🔄 更新 README 和 Gallery...")
         update_readme()
         update_gallery()
@@ -98,4 +238,14 @@ def generate_missing_stories():
 
 
 if __name__ == "__main__":
-    generate_missing_stories()
+    parser = argparse.ArgumentParser(description="为缺少故事的壁纸生成 AI 故事")
+    parser.add_argument("--regenerate-prompt", metavar="SHA", help="同时重新生成该提示词版本（SHA 前缀）生成的故事")
+    parser.add_argument("--regenerate-model", metavar="MODEL", help="同时重新生成该模型生成的故事")
+    parser.add_argument("--batch", action="store_true", help="使用 OpenAI 兼容的 Batch API（不支持时退回并发池）")
+    parser.add_argument("--no-wait", action="store_true", help="批处理模式下提交后不等待，下次运行再收取结果")
+    parser.add_argument("--poll", type=float, default=POLL_SECONDS, help="批任务轮询间隔秒数")
+    parser.add_argument("--jobs", type=int, default=1, help="并发池线程数")
+    parser.add_argument("--rpm", type=float, default=0, help="并发池每分钟最多请求数（0 表示不限速）")
+    args = parser.parse_args()
+    generate_missing_stories(args.regenerate_prompt, args.regenerate_model, batch=args.batch,
+                             workers=args.jobs, rpm=args.rpm, wait=not args.no_wait, poll=args.poll)
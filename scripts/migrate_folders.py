@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import os
+import sys
 import shutil
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.catalog import rebuild_catalog
+
 def migrate_folders():
     base_path = Path("docs/wallpapers")
     sources = ["bing", "unsplash"]
@@ -33,5 +37,8 @@ def migrate_folders():
                 print(f"  [MOVE] {date_str} -> {month_str}/{date_str}")
                 shutil.move(str(item), str(target_path))
 
+    # 目录结构变化后索引中的路径失效，需要全量重建
+    rebuild_catalog()
+
 if __name__ == "__main__":
     migrate_folders()
@@ -3,65 +3,228 @@
 图片优化工具：
 1. 批量压缩存量图片
 2. 提供给抓取脚本调用的压缩接口
+
+使用 Pillow 在进程内编码：对质量参数做二分搜索（在内存中编码），
+找到不超过目标大小的最高质量，输出渐进式 + 优化哈夫曼表的 JPEG，并去除全部元数据。
+不再依赖系统安装的 jpegoptim。
 """
 
+import argparse
+import io
+import json
 import os
-import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Optional
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.catalog import load_catalog, upsert_entry
+from src.wallpaper_meta import file_sha256, is_current, read_meta, write_meta
+
+MIN_QUALITY = 40
+MAX_QUALITY = 95
+
+# 存量优化参数：大于 THRESHOLD_KB 的原图才压缩到 TARGET_SIZE_KB（稍微留一点余量）
+TARGET_SIZE_KB = 1024
+THRESHOLD_KB = 1100
+LEDGER_PATH = Path("state/optimize_ledger.json")
+# 优化参数变化时，账本中的旧记录自动失效
+LEDGER_SETTINGS = f"pillow-q{MIN_QUALITY}-{MAX_QUALITY}-{TARGET_SIZE_KB}k-{THRESHOLD_KB}k"
+
 
-def compress_image(image_path: Path, target_size_kb: int = 1024):
+def _encode(img: Image.Image, quality: int) -> bytes:
+    buf = io.BytesIO()
+    # 不传 exif / icc_profile，相当于 jpegoptim --strip-all
+    img.save(buf, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buf.getvalue()
+
+
+def encode_jpeg(img: Image.Image, target_bytes: int,
+                min_quality: int = MIN_QUALITY, max_quality: int = MAX_QUALITY) -> bytes:
     """
-    使用 jpegoptim 压缩单张图片
+    二分搜索 JPEG 质量，返回不超过 target_bytes 的最高质量编码结果
+    即使最低质量也超出目标时，返回最低质量的结果
     """
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    best = None
+    lo, hi = min_quality, max_quality
+    while lo <= hi:
+        mid = (lo + hi) // 2
+        data = _encode(img, mid)
+        if len(data) <= target_bytes:
+            best = data
+            lo = mid + 1
+        else:
+            hi = mid - 1
+
+    return best if best is not None else _encode(img, min_quality)
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def compress_image(image_path: Path, target_size_kb: int = 1024, img: Optional[Image.Image] = None):
+    """
+    将单张 JPG 压缩到目标大小以内
+    img: 调用方已经解码好的图片（例如生成缩略图时打开的原图），传入后不再重复解码
+    文件已小于目标大小时保持原样，避免重复有损编码
+    """
+    image_path = Path(image_path)
     if not image_path.exists():
         print(f"[ERROR] 文件不存在: {image_path}")
         return False
-    
+
     if image_path.suffix.lower() not in ['.jpg', '.jpeg']:
         print(f"[INFO] 跳过非 JPG 文件: {image_path}")
         return False
 
+    target_bytes = target_size_kb * 1024
+    if image_path.stat().st_size <= target_bytes:
+        return True
+
     print(f">>> [压缩中] {image_path} (目标: {target_size_kb}k)")
     try:
-        # 尝试调用 jpegoptim
-        # --size 指定目标大小，--strip-all 移除所有元数据（减小体积）
-        subprocess.run(
-            ['jpegoptim', f'--size={target_size_kb}k', '--strip-all', str(image_path)],
-            check=True,
-            capture_output=True
-        )
+        if img is None:
+            with Image.open(image_path) as opened:
+                data = encode_jpeg(opened, target_bytes)
+        else:
+            data = encode_jpeg(img, target_bytes)
+        _write_atomic(image_path, data)
         return True
-    except FileNotFoundError:
-        print("[ERROR] 系统未安装 jpegoptim，请先安装：sudo apt-get install jpegoptim")
-        return False
-    except subprocess.CalledProcessError as e:
+    except Exception as e:
         print(f"[ERROR] 压缩失败: {e}")
         return False
 
-def batch_optimize_legacy():
+
+def _optimize_one(path: str, target_size_kb: int, threshold_kb: int) -> dict:
+    """处理单张图片（可在子进程中执行），返回写入账本的信息"""
+    img_path = Path(path)
+    size_before = img_path.stat().st_size
+    compressed = False
+    if size_before > threshold_kb * 1024:
+        compressed = compress_image(img_path, target_size_kb=target_size_kb)
+
+    stat = img_path.stat()
+    return {
+        "size": stat.st_size,
+        "sha256": file_sha256(img_path),
+        "settings": LEDGER_SETTINGS,
+        "saved": size_before - stat.st_size,
+        "compressed": compressed,
+    }
+
+
+def load_ledger() -> dict:
+    if LEDGER_PATH.exists():
+        try:
+            return json.loads(LEDGER_PATH.read_text(encoding="utf-8"))
+        except Exception:
+            print(f"[WARN] {LEDGER_PATH} 损坏，将重新建立")
+    return {}
+
+
+def save_ledger(ledger: dict):
+    LEDGER_PATH.parent.mkdir(parents=True, exist_ok=True)
+    LEDGER_PATH.write_text(json.dumps(ledger, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+
+
+def _refresh_meta(path: str):
+    """
+    原图被重新压缩后，同步更新 meta.json 中的图片事实（大小、哈希）与目录索引
+    否则默认模式会因 meta 中的旧哈希与账本不一致，每次都把这张图当作候选
+    """
+    base_dir = Path(path).parent
+    if not (base_dir / "meta.json").exists():
+        return
+    meta = read_meta(base_dir)
+    if not is_current(meta):
+        return
+    # docs/wallpapers/<源>/YYYY-MM/YYYY-MM-DD/image.jpg
+    source = Path(path).parts[-4]
+    upsert_entry(source, base_dir, write_meta(base_dir, meta))
+
+
+def _find_candidates(ledger: dict, full: bool):
+    """
+    找出需要处理的图片
+    默认模式只读目录索引与账本（不遍历、不 stat 归档），新图片或哈希变化的图片才是候选；
+    full 模式遍历全部 image.jpg，用 size + sha256 判断变化（大小一致时才计算哈希）；
+    不看 mtime，actions/checkout 之后所有文件的 mtime 都是新的
     """
-    遍历 docs/wallpapers 优化所有存量图片
+    candidates = []
+    if full:
+        for img_path in Path("docs/wallpapers").rglob("image.jpg"):
+            entry = ledger.get(img_path.as_posix())
+            if (not entry or entry.get("settings") != LEDGER_SETTINGS
+                    or entry.get("size") != img_path.stat().st_size
+                    or entry.get("sha256") != file_sha256(img_path)):
+                candidates.append(img_path.as_posix())
+        return candidates
+
+    for record in load_catalog():
+        if not record["has_image"]:
+            continue
+        path = f"{record['dir']}/image.jpg"
+        entry = ledger.get(path)
+        if not entry or entry.get("settings") != LEDGER_SETTINGS:
+            candidates.append(path)
+            continue
+        facts = record["meta"].get("image") if is_current(record["meta"]) else None
+        if facts and facts.get("sha256") != entry.get("sha256"):
+            candidates.append(path)
+    return candidates
+
+
+def batch_optimize_legacy(jobs: int = 1, full: bool = False):
     """
-    print("🚀 开始扫描存量图片进行优化...")
-    base_dir = Path("docs/wallpapers")
-    if not base_dir.exists():
-        print("[ERROR] 目录不存在")
+    优化新增或变化的存量图片
+    已处理过的图片记录在账本 state/optimize_ledger.json 中（路径 → 大小、哈希、优化参数），
+    日常运行只检查账本之外的新图片，耗时与归档规模无关
+    """
+    ledger = load_ledger()
+    candidates = _find_candidates(ledger, full)
+    if not candidates:
+        print("✨ 没有需要优化的新图片")
         return
 
+    print(f"🚀 开始优化 {len(candidates)} 张新增/变化的图片...")
+    args = (TARGET_SIZE_KB, THRESHOLD_KB)
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(_optimize_one, candidates, *[[a] * len(candidates) for a in args]))
+    else:
+        results = [_optimize_one(path, *args) for path in candidates]
+
     count = 0
-    # 递归搜索所有 image.jpg
-    for img_path in base_dir.rglob("image.jpg"):
-        original_size = img_path.stat().st_size / 1024
-        if original_size > 1100: # 稍微留一点余量，大于 1100k 的才处理
-            if compress_image(img_path):
-                new_size = img_path.stat().st_size / 1024
-                print(f"  ✅ 优化完成: {original_size:.1f}k -> {new_size:.1f}k")
-                count += 1
-        else:
-            print(f"  [跳过] {img_path.relative_to(base_dir)} 大小合适 ({original_size:.1f}k)")
+    saved = 0
+    for path, result in zip(candidates, results):
+        if result.pop("compressed"):
+            count += 1
+            saved += result["saved"]
+            print(f"  ✅ 优化完成: {path} -{result['saved'] / 1024:.1f}k")
+            _refresh_meta(path)
+        # 账本记录累计节省的字节数
+        result["saved"] += ledger.get(path, {}).get("saved", 0)
+        ledger[path] = result
+    save_ledger(ledger)
+
+    total_saved = sum(entry.get("saved", 0) for entry in ledger.values())
+    print(f"\n✨ 优化结束：检查 {len(candidates)} 张，压缩 {count} 张，本次节省 {saved / 1024 / 1024:.2f}MB，"
+          f"账本累计节省 {total_saved / 1024 / 1024:.2f}MB（共 {len(ledger)} 条记录）")
 
-    print(f"\n✨ 存量优化脚本运行结束，共处理 {count} 张图片。")
 
 if __name__ == "__main__":
-    # 如果系统安装了 jpegoptim 则运行
-    batch_optimize_legacy()
+    parser = argparse.ArgumentParser(description="优化新增或变化的壁纸原图")
+    parser.add_argument("--jobs", type=int, default=1, help="并行进程数（存量批量处理时使用）")
+    parser.add_argument("--full", action="store_true", help="遍历全部 image.jpg，按大小与哈希重新核对账本")
+    args = parser.parse_args()
+
+    batch_optimize_legacy(jobs=args.jobs, full=args.full)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+为存量壁纸生成画廊响应式派生图（宽度阶梯 × JPEG/WebP/AVIF）
+- 在进程池中并行渲染
+- meta.json 中记录的 variants.source_sha256 与当前原图一致且文件齐全时跳过
+- 完成后写回 meta.json 并更新目录索引，随后可运行 src/update_gallery.py
+用法:
+  python scripts/render_responsive.py            # 默认按 CPU 核数并行
+  python scripts/render_responsive.py --jobs 4
+  python scripts/render_responsive.py --source bing --force
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.catalog import load_catalog, upsert_entry
+from src.derivatives import generate_responsive, responsive_formats
+from src.wallpaper_meta import file_sha256, is_current, read_meta, write_meta
+
+
+def is_up_to_date(base_dir: Path, meta: dict) -> bool:
+    """原图哈希未变、格式集合未变且所有派生文件都存在"""
+    variants = meta.get("variants")
+    if not variants or variants.get("formats") != responsive_formats():
+        return False
+    image_sha = meta["image"]["sha256"] if is_current(meta) else file_sha256(base_dir / "image.jpg")
+    if variants.get("source_sha256") != image_sha:
+        return False
+    return all((base_dir / f["path"]).exists() for f in variants.get("files", []))
+
+
+def render_one(date_dir: str) -> str:
+    """渲染单个目录并写回 meta.json，返回 rendered / error:<原因>"""
+    base_dir = Path(date_dir)
+    try:
+        meta = read_meta(base_dir)
+        meta["variants"] = generate_responsive(base_dir / "image.jpg")
+        write_meta(base_dir, meta)
+        return "rendered"
+    except Exception as e:
+        return f"error:{e}"
+
+
+def render_responsive(jobs: int = None, source: str = None, force: bool = False):
+    print("🚀 开始生成响应式派生图...")
+    records = load_catalog(sources=[source] if source else None)
+
+    pending = []
+    skipped = 0
+    for record in records:
+        if not record["has_image"]:
+            continue
+        base_dir = Path(record["dir"])
+        if not force and is_up_to_date(base_dir, record["meta"]):
+            skipped += 1
+            continue
+        pending.append(record)
+
+    rendered = failed = 0
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = pool.map(render_one, [r["dir"] for r in pending])
+            for record, result in zip(pending, results):
+                if result == "rendered":
+                    rendered += 1
+                    upsert_entry(record["source"], Path(record["dir"]))
+                else:
+                    failed += 1
+                    print(f"[WARN] {record['dir']}: {result[len('error:'):]}")
+
+    print(f"✅ 完成：生成 {rendered}，跳过 {skipped}，失败 {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="为存量壁纸生成响应式派生图")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="并行进程数")
+    parser.add_argument("--source", help="只处理指定源，例如 bing")
+    parser.add_argument("--force", action="store_true", help="忽略哈希，全部重新生成")
+    args = parser.parse_args()
+
+    render_responsive(jobs=args.jobs, source=args.source, force=args.force)
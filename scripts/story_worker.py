@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+两阶段发布的故事任务
+fetch_all.py --defer-story 先发布图片、缩略图、元数据与页面（meta.json: has_story=false + story_pending），
+本脚本随后为这些壁纸补写故事:
+
+  1. 生成 story.md（见 src/story.generate_story）
+  2. meta.json 改为 has_story=true，删除 story_pending，更新目录索引
+  3. 只重绘受影响的画廊卡片与 API 分片；日期在 README 展示范围内时才重绘 README
+  4. 需要推送的壁纸补发一条企业微信故事消息
+  5. 把 story.md / meta.json 同步到存储后端
+
+生成失败时 story_pending.attempts 加一，下次运行继续重试；超过 MAX_ATTEMPTS 次后放弃，
+留给 scripts/generate_missing_stories.py 处理。
+--deadline 设定时间预算：剩余预算不够一次 LLM 调用时停止，剩下的壁纸留到下次运行。
+
+用法:
+  python scripts/story_worker.py
+  python scripts/story_worker.py --deadline 900
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+# 添加项目根目录到路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+import fetch_bing_wallpaper
+from src import http_client, run_control, story
+from src.catalog import load_catalog, upsert_entry
+from src.config_loader import get_display_config
+from src.pipeline import STORY_MIN_SECONDS, mark_done
+from src.storage import sync_wallpapers
+from src.wallpaper_meta import read_meta, write_meta
+
+MAX_ATTEMPTS = 5
+
+
+def pending_records():
+    """目录索引中等待补写故事的壁纸，按日期倒序"""
+    records = [r for r in load_catalog() if r["meta"].get("story_pending") and not r["has_story"]]
+    return sorted(records, key=lambda r: r["date"], reverse=True)
+
+
+def push_story(meta: dict, story_content: str):
+    webhook_url = os.environ.get("WEWORK_WEBHOOK")
+    if not webhook_url:
+        return
+    from src.utils import send_story_to_wecom
+
+    send_story_to_wecom(webhook_url, meta, story_content)
+    print("[OK] 企业微信故事推送成功")
+
+
+def process(record: dict) -> bool:
+    """为一张壁纸补写故事，成功返回 True"""
+    base_dir = Path(record["dir"])
+    meta = read_meta(base_dir)
+    pending = dict(meta.get("story_pending") or {})
+    label = f"{record['source']}/{record['date']}"
+
+    story_info = {}
+    story_content = story.generate_story(
+        meta.get("title"), meta.get("copyright"), base_dir / "image.jpg", info=story_info,
+        story_path=base_dir / "story.md")
+
+    if not story_content:
+        if run_control.expired():
+            # 时间预算用完导致的失败不计入次数
+            print(f"[INFO] {label}: 时间预算已用完，下次运行重试")
+            return False
+        pending["attempts"] = pending.get("attempts", 0) + 1
+        if pending["attempts"] >= MAX_ATTEMPTS:
+            print(f"[WARN] {label}: 故事生成已失败 {pending['attempts']} 次，放弃（可用 generate_missing_stories 补生成）")
+            meta.pop("story_pending", None)
+        else:
+            print(f"[WARN] {label}: 故事生成失败（第 {pending['attempts']} 次），下次运行重试")
+            meta["story_pending"] = pending
+        upsert_entry(record["source"], base_dir, write_meta(base_dir, meta))
+        return False
+
+    meta.pop("story_pending", None)
+    meta["has_story"] = True
+    meta["story"] = story_info
+    meta = write_meta(base_dir, meta)
+    upsert_entry(record["source"], base_dir, meta)
+    mark_done(base_dir, "story", story_info=story_info)
+    print(f"✅ {label}: 故事已补写")
+
+    if pending.get("notify"):
+        try:
+            push_story(meta, story_content)
+        except Exception as e:
+            print(f"[WARN] {label}: 企业微信故事推送失败: {e}")
+    return True
+
+
+def render_updates(records):
+    """只重绘受影响的部分：画廊卡片、API 分片（增量），README 仅在日期处于展示范围内时重绘"""
+    from src.generate_api import generate_api
+    from src.update_gallery import refresh_cards, update_gallery
+    from src.update_readme import update_readme
+
+    keys = {(r["source"], r["date"]) for r in records}
+    if refresh_cards(keys):
+        print(f"[OK] docs/index.html 已更新 {len(keys)} 张卡片")
+    else:
+        update_gallery()
+        print("[OK] docs/index.html 已更新")
+    generate_api()
+
+    max_items = get_display_config().get("max_items_per_source", 10)
+    shown = sorted({r["date"] for r in load_catalog() if r["has_thumb"]}, reverse=True)[:max_items]
+    if any(r["date"] in shown for r in records):
+        update_readme()
+
+
+def run():
+    records = pending_records()
+    if not records:
+        print("[INFO] 没有等待补写故事的壁纸")
+        return
+
+    print(f"🚀 为 {len(records)} 张壁纸补写故事...")
+    done = []
+    for index, record in enumerate(records):
+        if not run_control.allows(STORY_MIN_SECONDS):
+            print(f"[INFO] 剩余时间预算不足，{len(records) - index} 张壁纸留到下次运行")
+            break
+        if process(record):
+            done.append(record)
+    if done:
+        sync_wallpapers([Path(r["dir"]) for r in done], names=("story.md", "meta.json"))
+        render_updates(done)
+    print(f"\n✅ 故事补写完成：成功 {len(done)}/{len(records)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为两阶段发布的壁纸补写 AI 故事")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS", help="整次运行的时间预算（秒）")
+    args = parser.parse_args()
+
+    fetch_bing_wallpaper.load_env()
+    if not os.environ.get("LLM_API_KEY"):
+        print("[INFO] LLM_API_KEY 未配置，跳过故事补写")
+        return
+
+    # 与抓取任务共用运行锁，避免同一张壁纸被重复调用 LLM
+    with run_control.run_lock("story_worker") as acquired:
+        if not acquired:
+            return
+        run_control.start_budget(args.deadline)
+        run()
+    http_client.print_stats()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 集成功能测试脚本
 用于验证：
 1. 企业微信推送（多源标识、消息清洗）
-2. 腾讯云 COS 上传功能
+2. 存储后端上传功能（GitHub 图床 / S3 兼容对象存储 / 本地目录）
 """
 
 import os
@@ -15,9 +15,10 @@ from datetime import datetime
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from fetch_bing_wallpaper import load_env
-from src.utils import send_image_to_wecom, send_markdown_to_wecom, send_story_to_wecom, upload_to_cos
+from src.utils import send_image_to_wecom, send_markdown_to_wecom, send_story_to_wecom
+from src.storage import get_sinks
 
-def test_wecom_push():
+def check_wecom_push():
     print("\n--- [1/2] 测试企业微信推送 ---")
     webhook_url = os.environ.get("WEWORK_WEBHOOK")
     if not webhook_url:
@@ -63,27 +64,34 @@ def test_wecom_push():
         print(f"❌ 企业微信推送测试失败: {e}")
         return False
 
-def test_cos_upload():
-    print("\n--- [2/2] 测试腾讯云 COS 上传 ---")
-    
+def check_storage_upload():
+    print("\n--- [2/2] 测试存储后端上传 ---")
+    sinks = get_sinks()
+    if not sinks:
+        print("❌ 错误: 未配置任何存储后端 (STORAGE_SINKS)，跳过测试")
+        return False
+
     # 创建一个临时的测试文件
-    test_file = Path("cos_test_temp.txt")
-    test_file.write_text(f"COS Integration Test at {datetime.now()}", encoding="utf-8")
-    
-    cos_path = f"tests/integration_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-    
+    test_file = Path("storage_test_temp.txt")
+    test_file.write_text(f"Storage Integration Test at {datetime.now()}", encoding="utf-8")
+
+    key = f"tests/integration_test_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+
+    ok = True
     try:
-        print(f"正在上传测试文件到: {cos_path}")
-        url = upload_to_cos(str(test_file), cos_path)
-        if url:
-            print(f"✅ COS 上传成功! 访问地址: {url}")
-            return True
-        else:
-            print("❌ COS 上传返回为空 (可能是配置缺失)")
-            return False
-    except Exception as e:
-        print(f"❌ COS 上传测试过程报错: {e}")
-        return False
+        for sink in sinks:
+            try:
+                print(f"正在上传测试文件到 {sink.name}: {key}")
+                url = sink.upload_file(test_file, key)
+                if url:
+                    print(f"✅ {sink.name} 上传成功! 访问地址: {url}")
+                else:
+                    print(f"❌ {sink.name} 上传返回为空 (可能是配置缺失)")
+                    ok = False
+            except Exception as e:
+                print(f"❌ {sink.name} 上传测试过程报错: {e}")
+                ok = False
+        return ok
     finally:
         if test_file.exists():
             test_file.unlink()
@@ -92,16 +100,16 @@ def main():
     load_env()
     
     print("🚀 开始集成功能验证...")
-    wecom_ok = test_wecom_push()
-    cos_ok = test_cos_upload()
+    wecom_ok = check_wecom_push()
+    storage_ok = check_storage_upload()
     
     print("\n" + "="*30)
     print("测试结果汇总:")
     print(f"企业微信推送: {'✅ 通过' if wecom_ok else '❌ 未通过'}")
-    print(f"腾讯云 COS:   {'✅ 通过' if cos_ok else '❌ 未通过' or '⚠️ 未配置'}")
+    print(f"存储后端:     {'✅ 通过' if storage_ok else '❌ 未通过'}")
     print("="*30)
     
-    if wecom_ok and cos_ok:
+    if wecom_ok and storage_ok:
         print("\n🎉 恭喜！所有新集成功能均已就绪。")
     else:
         print("\n💡 请检查 .env 配置文件中的密钥是否正确。")
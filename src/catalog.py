@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+壁纸目录索引 (catalog)
+- 以 JSON Lines 格式持久化在 docs/api/catalog.jsonl，每行一条壁纸记录
+- 抓取脚本在写入 meta.json 后追加一行（同一 source+date 以最后一行为准）
+- date 为归档目录名：同一天其他市场的另一张必应图片归档在带市场后缀的目录（如 2026-10-18-en-us），
+  真实日期见 meta["date"]
+- README / Gallery / API 生成均从这里读取，不再各自 rglob 整个归档目录
+- 索引文件缺失或需要修复时，可用 `python src/catalog.py --rebuild` 全量重建
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+CATALOG_PATH = Path("docs/api/catalog.jsonl")
+WALLPAPERS_BASE = Path("docs/wallpapers")
+
+# 追加写入产生的重复行超过该比例时，自动压缩索引文件
+COMPACT_RATIO = 0.5
+
+
+def _build_record(source: str, date_dir: Path, meta: Optional[dict] = None) -> Optional[Dict[str, Any]]:
+    """根据壁纸目录构建一条索引记录"""
+    if meta is None:
+        meta_file = date_dir / "meta.json"
+        try:
+            meta = json.loads(meta_file.read_text(encoding="utf-8"))
+        except Exception:
+            return None
+
+    return {
+        "source": source,
+        "date": date_dir.name,
+        "dir": date_dir.as_posix(),
+        "has_image": (date_dir / "image.jpg").exists(),
+        "has_thumb": (date_dir / "thumb.jpg").exists(),
+        "has_story": (date_dir / "story.md").exists(),
+        "meta": meta,
+    }
+
+
+def _sort_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """日期倒序，同一天内按源名称排序"""
+    records = sorted(records, key=lambda r: r["source"])
+    return sorted(records, key=lambda r: r["date"], reverse=True)
+
+
+def _write_records(records: List[Dict[str, Any]]):
+    """按日期倒序写出完整索引文件（原子替换）"""
+    CATALOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+    records = _sort_records(records)
+    tmp_path = CATALOG_PATH.with_suffix(".jsonl.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    tmp_path.replace(CATALOG_PATH)
+
+
+def rebuild_catalog() -> List[Dict[str, Any]]:
+    """全量扫描 docs/wallpapers 重建索引"""
+    records = []
+    if WALLPAPERS_BASE.exists():
+        for source_dir in sorted(WALLPAPERS_BASE.iterdir()):
+            if not source_dir.is_dir() or source_dir.name.startswith("."):
+                continue
+            for meta_file in source_dir.rglob("meta.json"):
+                record = _build_record(source_dir.name, meta_file.parent)
+                if record:
+                    records.append(record)
+
+    _write_records(records)
+    print(f"[OK] {CATALOG_PATH} 已重建 (共 {len(records)} 条)")
+    return records
+
+
+def _read_lines() -> List[Dict[str, Any]]:
+    lines = []
+    with open(CATALOG_PATH, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                lines.append(json.loads(line))
+            except json.JSONDecodeError:
+                # 进程中途被杀可能留下半行，忽略即可
+                continue
+    return lines
+
+
+def load_catalog(sources: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    读取索引，返回按日期倒序的记录列表
+    sources 不为空时只返回这些源的记录
+    """
+    if not CATALOG_PATH.exists():
+        records = rebuild_catalog()
+    else:
+        merged = {}
+        lines = _read_lines()
+        for record in lines:
+            merged[(record["source"], record["date"])] = record
+        records = list(merged.values())
+
+        if lines and len(lines) - len(records) > len(records) * COMPACT_RATIO:
+            _write_records(records)
+
+    if sources is not None:
+        records = [r for r in records if r["source"] in sources]
+    return _sort_records(records)
+
+
+def upsert_entry(source: str, date_dir: Path, meta: Optional[dict] = None) -> Optional[Dict[str, Any]]:
+    """
+    新增或更新一条壁纸记录（追加一行，O(1)）
+    在写入 meta.json / story.md 之后调用
+    """
+    if not CATALOG_PATH.exists():
+        # 首次使用时整体重建，已包含当前目录
+        rebuild_catalog()
+        return _build_record(source, date_dir, meta)
+
+    record = _build_record(source, date_dir, meta)
+    if record is None:
+        print(f"[WARN] 无法读取 {date_dir}/meta.json，索引未更新")
+        return None
+
+    with open(CATALOG_PATH, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    return record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="壁纸目录索引工具")
+    parser.add_argument("--rebuild", action="store_true", help="全量扫描 docs/wallpapers 重建索引")
+    args = parser.parse_args()
+
+    if args.rebuild:
+        rebuild_catalog()
+    else:
+        records = load_catalog()
+        print(f"[INFO] {CATALOG_PATH}: 共 {len(records)} 条记录")
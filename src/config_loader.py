@@ -36,6 +36,12 @@ def get_enabled_sources() -> List[Dict[str, Any]]:
     return [s for s in config.get("sources", []) if s.get("enabled", False)]
 
 
+def get_source_config(name: str) -> Dict[str, Any]:
+    """获取指定壁纸源的配置（不论是否启用），不存在时返回空 dict"""
+    config = load_sources_config()
+    return next((s for s in config.get("sources", []) if s.get("name") == name), {})
+
+
 def get_display_config() -> Dict[str, Any]:
     """获取显示配置"""
     config = load_sources_config()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+派生图生成引擎
+一次解码原图，产出所有需要的派生文件:
+  thumb.jpg   画廊 / README 缩略图 (400x225)
+  push.jpg    企业微信推送用的中等尺寸图（临时文件，不入库）
+  llm.jpg     视觉 LLM 输入图（最长边 LLM_IMAGE_MAX_EDGE，默认 1024；质量 LLM_IMAGE_QUALITY，默认 80；不入库，
+              缺失时由 llm_input 从原图重新生成）
+  image.jpg   原图超过目标大小时，就地压缩
+  image-<宽>.jpg/.webp/.avif  画廊响应式宽度阶梯（400/800/1280/1920，可选）
+                              每天新增约 9 个入库的二进制文件，默认关闭；设置 RESPONSIVE_IMAGES=1 开启，
+                              存量壁纸用 scripts/render_responsive.py 补生成
+
+原图无需压缩时，利用 JPEG draft 模式在 DCT 域直接按 1/2、1/4、1/8 解码到
+不小于最大派生尺寸的分辨率，再用 reduce() + LANCZOS 逐级缩小；
+大尺寸 Unsplash 原图的解码耗时和峰值内存因此显著下降。
+"""
+
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from PIL import Image, features
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.wallpaper_meta import file_sha256
+
+# name -> 输出文件名、最大尺寸 (宽, 高)、JPEG 质量
+DERIVATIVES = {
+    "push": {"filename": "push.jpg", "size": (1280, 1280), "quality": 85},
+    "llm": {"filename": "llm.jpg", "size": (1024, 1024), "quality": 80},
+    "thumb": {"filename": "thumb.jpg", "size": (400, 225), "quality": 85},
+}
+DEFAULT_OUTPUTS = ("thumb", "push", "llm")
+
+# 响应式宽度阶梯及各格式的编码质量
+RESPONSIVE_WIDTHS = (400, 800, 1280, 1920)
+RESPONSIVE_QUALITY = {"jpg": 82, "webp": 78, "avif": 55}
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def spec_for(name: str) -> dict:
+    """派生图规格；llm 的尺寸与质量可由环境变量覆盖"""
+    spec = dict(DERIVATIVES[name])
+    if name == "llm":
+        edge = _env_int("LLM_IMAGE_MAX_EDGE", spec["size"][0])
+        spec["size"] = (edge, edge)
+        spec["quality"] = _env_int("LLM_IMAGE_QUALITY", spec["quality"])
+    return spec
+
+
+def _fit(size, box):
+    """按比例缩放到 box 以内时的目标尺寸（与 Image.thumbnail 一致，不放大）"""
+    width, height = size
+    scale = min(box[0] / width, box[1] / height, 1.0)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _resize(img: Image.Image, box) -> Image.Image:
+    target = _fit(img.size, box)
+    if target == img.size:
+        return img.copy()
+    # reducing_gap: 先用 reduce() 整数倍快速缩小，再做 LANCZOS 精修
+    return img.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def _save_jpeg(img: Image.Image, path: Path, quality: int):
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    img.save(path, "JPEG", quality=quality, optimize=True)
+
+
+def responsive_enabled() -> bool:
+    """流水线是否为新壁纸生成响应式宽度阶梯（RESPONSIVE_IMAGES，默认关闭）"""
+    return os.environ.get("RESPONSIVE_IMAGES", "0").lower() in ("1", "true", "yes", "on")
+
+
+def responsive_formats():
+    """当前 Pillow 支持的响应式输出格式（AVIF 需要 Pillow 带 libavif 编译）"""
+    formats = ["jpg"]
+    if features.check("webp"):
+        formats.append("webp")
+    if features.check("avif"):
+        formats.append("avif")
+    return formats
+
+
+def _responsive_widths(source_width: int):
+    widths = [w for w in RESPONSIVE_WIDTHS if w <= source_width]
+    return widths or [source_width]
+
+
+def _render_responsive(img: Image.Image, image_path: Path) -> dict:
+    """从已解码的图片生成宽度阶梯，返回写入 meta.json 的 variants 描述"""
+    formats = responsive_formats()
+    files = []
+    current = img if img.mode in ("RGB", "L") else img.convert("RGB")
+    with Image.open(image_path) as original:
+        source_width = original.size[0]
+    for width in sorted(_responsive_widths(img.size[0]), reverse=True):
+        current = _resize(current, (width, width * 10))
+        for fmt in formats:
+            out_path = image_path.parent / f"image-{width}.{fmt}"
+            if fmt == "jpg" and current.size[0] == source_width and image_path.suffix.lower() in (".jpg", ".jpeg"):
+                # 原尺寸 JPEG 直接引用原图，不再重复编码
+                out_path = image_path
+            elif fmt == "jpg":
+                current.save(out_path, "JPEG", quality=RESPONSIVE_QUALITY[fmt], optimize=True, progressive=True)
+            elif fmt == "webp":
+                current.save(out_path, "WEBP", quality=RESPONSIVE_QUALITY[fmt], method=4)
+            else:
+                # speed=8 比默认快约 3 倍，体积几乎不变
+                current.save(out_path, "AVIF", quality=RESPONSIVE_QUALITY[fmt], speed=8)
+            files.append({
+                "width": current.size[0],
+                "height": current.size[1],
+                "format": fmt,
+                "path": out_path.name,
+                "file_size": out_path.stat().st_size,
+            })
+
+    return {
+        # 记录生成时原图的哈希，原图未变化时可以跳过重新生成
+        "source_sha256": file_sha256(image_path),
+        "formats": formats,
+        "files": files,
+    }
+
+
+def generate_responsive(image_path: Path, compress_kb: Optional[int] = None) -> dict:
+    """只生成响应式宽度阶梯（用于存量回填），返回 variants 描述"""
+    return generate_derivatives(image_path, outputs=(), compress_kb=compress_kb, responsive=True)["responsive"]
+
+
+def generate_derivatives(image_path: Path, outputs: Iterable[str] = DEFAULT_OUTPUTS,
+                         compress_kb: Optional[int] = None,
+                         paths: Optional[Dict[str, Path]] = None,
+                         responsive: bool = False) -> Dict[str, Path]:
+    """
+    从 image_path 一次解码生成 outputs 中的派生图，返回 {name: 输出路径}
+    compress_kb: 原图超过该大小时顺带压缩原图（需要全分辨率解码）
+    paths: 覆盖默认输出路径（默认与原图同目录）
+    responsive: 同时生成画廊响应式宽度阶梯，结果的 "responsive" 键为 variants 描述（而非路径）
+    """
+    image_path = Path(image_path)
+    paths = dict(paths or {})
+    outputs = [name for name in outputs if name in DERIVATIVES]
+    # 从大到小生成，每一级都从上一级结果缩小
+    specs = {name: spec_for(name) for name in outputs}
+    outputs.sort(key=lambda name: specs[name]["size"][0] * specs[name]["size"][1], reverse=True)
+
+    needs_compress = bool(compress_kb) and image_path.stat().st_size > compress_kb * 1024
+
+    with Image.open(image_path) as img:
+        if not needs_compress and img.format == "JPEG" and (outputs or responsive):
+            boxes = [specs[name]["size"] for name in outputs[:1]]
+            if responsive:
+                boxes.append((max(RESPONSIVE_WIDTHS), img.size[1]))
+            needed = [_fit(img.size, box) for box in boxes]
+            img.draft("RGB", (max(w for w, _ in needed), max(h for _, h in needed)))
+        img.load()
+
+        if needs_compress:
+            from scripts.optimize_images import compress_image
+            compress_image(image_path, target_size_kb=compress_kb, img=img)
+
+        results = {}
+        if responsive:
+            results["responsive"] = _render_responsive(img, image_path)
+
+        current = img
+        for name in outputs:
+            spec = specs[name]
+            current = _resize(current, spec["size"])
+            out_path = Path(paths.get(name) or image_path.parent / spec["filename"])
+            _save_jpeg(current, out_path, spec["quality"])
+            results[name] = out_path
+
+    return results
+
+
+def llm_input(image_path: Path) -> Path:
+    """
+    视觉 LLM 输入图 llm.jpg：已存在、不旧于原图且尺寸符合当前配置时直接复用（重试与补生成不再重新编码），
+    否则从原图重新生成
+    """
+    image_path = Path(image_path)
+    llm_path = image_path.parent / DERIVATIVES["llm"]["filename"]
+    if llm_path.exists() and llm_path.stat().st_mtime >= image_path.stat().st_mtime:
+        with Image.open(image_path) as img, Image.open(llm_path) as llm:
+            if llm.size == _fit(img.size, spec_for("llm")["size"]):
+                return llm_path
+    return generate_derivatives(image_path, outputs=("llm",))["llm"]
@@ -1,89 +1,214 @@
 #!/usr/bin/env python3
 """
 生成静态 JSON API 文件（增量更新）
-输出: docs/api/v1/all.json
+输出:
+  docs/api/v1/index.json               分片清单（每个分片的条目数与内容哈希）
+  docs/api/v1/latest.json              每个源最新一张壁纸
+  docs/api/v1/<source>/<YYYY-MM>.json  按源、按月分片
+  docs/api/v1/all.json                 兼容旧客户端的全量文件（可用 --no-all-json 关闭）
+
+只有内容发生变化的分片才会被重写，日常运行通常只改动当月分片。
+必应条目带有 markets（列出该图片的市场），index.json 的 markets 汇总各源出现过的市场，供客户端按市场筛选。
 """
 
+import argparse
+import hashlib
 import json
 import sys
+from collections import defaultdict
 from pathlib import Path
-from PIL import Image
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.config_loader import get_enabled_sources
+from src.catalog import load_catalog
+from src.wallpaper_meta import image_size, is_current, markets_of
 
 CDN_BASE = "https://cnb.cool/deepalhome/SyncPic/-/git/raw/main/docs"
-
-
-def generate_api():
-    wallpapers_base = Path("docs/wallpapers")
-    api_dir = Path("docs/api/v1")
-    api_dir.mkdir(parents=True, exist_ok=True)
-    api_file = api_dir / "all.json"
+API_DIR = Path("docs/api/v1")
+API_VERSION = 1
+# 条目字段变化时递增，已有分片会整体重建一次
+ENTRY_SCHEMA = 2
+
+
+def _dump(obj, compact: bool = True) -> str:
+    if compact:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _write_if_changed(path: Path, text: str) -> bool:
+    """内容不变时不落盘，避免无意义的 git 变更"""
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    return True
+
+
+def _load_entries(path: Path) -> dict:
+    """读取已有的 API 文件，返回 {image_url: entry}"""
+    if not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return {wp["image"]: wp for wp in data.get("wallpapers", [])}
+    except Exception:
+        return {}
+
+
+def _build_entry(record: dict, cache: dict) -> dict:
+    """由索引记录生成 API 条目，已知条目直接复用（避免重复解码图片）"""
+    date_dir = Path(record["dir"])
+    rel = date_dir.relative_to(Path("docs"))
+    image_url = f"{CDN_BASE}/{rel}/image.jpg"
+    meta = record["meta"]
+
+    # v2 meta.json 已记录图片事实，直接读取；旧数据退回到缓存或解码图片
+    facts = meta.get("image") if is_current(meta) else None
+    cached = cache.get(image_url)
+    if facts:
+        width_height = f"{facts['width']}x{facts['height']}"
+        file_size = facts["file_size"]
+    elif cached:
+        width_height = cached["resolution"]
+        file_size = cached["fileSize"]
+    else:
+        # 只有旧数据才需要读取图片头部（image_size 内部才导入 Pillow）
+        image_path = date_dir / "image.jpg"
+        width, height = image_size(image_path)
+        width_height = f"{width}x{height}"
+        file_size = image_path.stat().st_size
+
+    entry = {
+        "date": meta.get("date", record["date"]),
+        "title": meta.get("title", record["date"]),
+        "source": record["source"],
+        "fileSize": file_size,
+        "resolution": width_height,
+        "image": image_url,
+        "thumb": f"{CDN_BASE}/{rel}/thumb.jpg",
+    }
+    markets = markets_of(record["source"], meta)
+    if markets:
+        entry["markets"] = markets
+    return entry
+
+
+def generate_api(full: bool = False, write_all_json: bool = True):
+    """
+    增量生成分片 API
+    full=True 时忽略 index.json 中记录的哈希，强制重建所有分片
+    """
+    API_DIR.mkdir(parents=True, exist_ok=True)
+    index_file = API_DIR / "index.json"
+    all_file = API_DIR / "all.json"
 
     enabled_sources = get_enabled_sources()
     if not enabled_sources:
         print("[WARN] 没有启用的壁纸源")
         return
 
-    # 加载已有数据，用 image URL 作为去重 key
-    existing = {}
-    if api_file.exists():
+    old_shards = {}
+    if index_file.exists() and not full:
         try:
-            data = json.loads(api_file.read_text(encoding="utf-8"))
-            for wp in data.get("wallpapers", []):
-                existing[wp["image"]] = wp
+            old_index = json.loads(index_file.read_text(encoding="utf-8"))
+            old_shards = {s["path"]: s for s in old_index.get("shards", [])}
         except Exception:
-            pass
-
-    new_count = 0
-    for source in enabled_sources:
-        source_dir = wallpapers_base / source["name"]
-        if not source_dir.exists():
+            old_shards = {}
+
+    # 按 (源, 月份) 分组索引记录
+    source_names = [s["name"] for s in enabled_sources]
+    groups = defaultdict(list)
+    markets = defaultdict(set)
+    for record in load_catalog(sources=source_names):
+        if not (record["has_thumb"] and record["has_image"]):
             continue
+        groups[(record["source"], record["date"][:7])].append(record)
+        markets[record["source"]].update(markets_of(record["source"], record["meta"]))
 
-        for meta_file in source_dir.rglob("meta.json"):
-            date_dir = meta_file.parent
-            image_path = date_dir / "image.jpg"
-            thumb_path = date_dir / "thumb.jpg"
-
-            if not (thumb_path.exists() and image_path.exists()):
-                continue
-
-            rel = date_dir.relative_to(Path("docs"))
-            image_url = f"{CDN_BASE}/{rel}/image.jpg"
+    # 首次生成分片时，用旧的 all.json 作为缓存，避免重新打开所有图片
+    legacy_cache = None
 
-            # 已存在则跳过
-            if image_url in existing:
-                continue
-
-            try:
-                meta = json.loads(meta_file.read_text(encoding="utf-8"))
-            except Exception:
-                continue
-
-            with Image.open(image_path) as img:
-                width, height = img.size
+    shards = []
+    changed = 0
+    new_count = 0
+    for (source, month), records in sorted(groups.items()):
+        rel_path = f"{source}/{month}.json"
+        shard_file = API_DIR / rel_path
+        catalog_hash = _sha256(f"{ENTRY_SCHEMA}:" + _dump(records))
+
+        old = old_shards.get(rel_path)
+        if old and old.get("catalog_hash") == catalog_hash and shard_file.exists():
+            shards.append(old)
+            continue
 
-            existing[image_url] = {
-                "date": meta.get("date", date_dir.name),
-                "title": meta.get("title", date_dir.name),
-                "source": source["name"],
-                "fileSize": image_path.stat().st_size,
-                "resolution": f"{width}x{height}",
-                "image": image_url,
-                "thumb": f"{CDN_BASE}/{rel}/thumb.jpg",
-            }
-            new_count += 1
+        cache = _load_entries(shard_file)
+        if not cache:
+            if legacy_cache is None:
+                legacy_cache = _load_entries(all_file)
+            cache = legacy_cache
+
+        entries = []
+        for record in records:
+            entry = _build_entry(record, cache)
+            if entry["image"] not in cache:
+                new_count += 1
+            entries.append(entry)
+        entries.sort(key=lambda x: x["date"], reverse=True)
+
+        text = _dump({"source": source, "month": month, "count": len(entries), "wallpapers": entries})
+        if _write_if_changed(shard_file, text):
+            changed += 1
+        shards.append({
+            "source": source,
+            "month": month,
+            "path": rel_path,
+            "count": len(entries),
+            "sha256": _sha256(text),
+            "catalog_hash": catalog_hash,
+        })
+
+    shards.sort(key=lambda s: (s["month"], s["source"]), reverse=True)
+    total = sum(s["count"] for s in shards)
+    index = {
+        "version": API_VERSION,
+        "cdn_base": CDN_BASE,
+        "total": total,
+        "markets": {source: sorted(codes) for source, codes in sorted(markets.items()) if codes},
+        "shards": shards,
+    }
+    index_changed = _write_if_changed(index_file, _dump(index, compact=False))
+
+    # latest.json：每个源最新的一个分片中的第一条
+    latest = {}
+    for shard in shards:
+        if shard["source"] in latest:
+            continue
+        data = json.loads((API_DIR / shard["path"]).read_text(encoding="utf-8"))
+        if data["wallpapers"]:
+            latest[shard["source"]] = data["wallpapers"][0]
+    _write_if_changed(API_DIR / "latest.json", _dump({"version": API_VERSION, "latest": latest}, compact=False))
 
-    all_wallpapers = sorted(existing.values(), key=lambda x: x["date"], reverse=True)
+    # all.json：仅在分片有变化时重新拼装
+    if write_all_json and (index_changed or not all_file.exists()):
+        all_wallpapers = []
+        for shard in shards:
+            data = json.loads((API_DIR / shard["path"]).read_text(encoding="utf-8"))
+            all_wallpapers.extend(data["wallpapers"])
+        all_wallpapers.sort(key=lambda x: (x["date"], x["source"]), reverse=True)
+        _write_if_changed(all_file, _dump({"wallpapers": all_wallpapers}, compact=False))
 
-    output = {"wallpapers": all_wallpapers}
-    api_file.write_text(
-        json.dumps(output, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
-    print(f"[OK] docs/api/v1/all.json 已更新 (共 {len(all_wallpapers)} 张, 新增 {new_count} 张)")
+    print(f"[OK] docs/api/v1 已更新 (共 {total} 张, 新增 {new_count} 张, 重写分片 {changed}/{len(shards)} 个)")
 
 
 if __name__ == "__main__":
-    generate_api()
+    parser = argparse.ArgumentParser(description="生成静态 JSON API")
+    parser.add_argument("--full", action="store_true", help="强制重建所有分片")
+    parser.add_argument("--no-all-json", action="store_true", help="不再输出兼容用的 all.json")
+    args = parser.parse_args()
+
+    generate_api(full=args.full, write_all_json=not args.no_all_json)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+GitHub 批量同步（Git Data API）
+把一批文件作为单个提交推送到图床仓库 (IMAGE_REPO)，而不是每个文件一次 Contents API 提交:
+
+  1. GET   git/ref/heads/<分支>        取分支当前提交
+  2. GET   git/commits/<sha>           取其根目录树
+  3. POST  git/blobs  × N（并发）       上传文件内容
+  4. POST  git/trees                   基于旧树生成新树
+  5. POST  git/commits                 创建一个提交
+  6. PATCH git/refs/heads/<分支>       快进分支（force=false）
+
+分支在第 1 步之后被其他人推进时第 6 步会失败，此时基于新的分支头重做 4-6 步（blob 无需重新上传）。
+
+跳过未变化的文件:
+  本地按 git 的规则计算 blob SHA-1（"blob <长度>\\0" + 内容），与 state/github_manifest.json
+  中记录的远端 SHA 比较，一致的文件不发任何请求。清单缺少的路径通过一次递归读取远端树补齐，
+  因此全量重新同步 800+ 张图片只需要几次请求。
+
+环境变量:
+  GH_PAT / GITHUB_TOKEN  访问令牌
+  IMAGE_REPO             目标仓库，默认 Hana19951208/blog-images
+  IMAGE_REPO_BRANCH      目标分支，默认 main
+  GITHUB_API_URL         API 地址，默认 https://api.github.com（可指向本地替身服务器）
+
+用法:
+  python src/github_sync.py docs/wallpapers/bing/2025-12          # 同步该目录下的全部 image.jpg
+  python src/github_sync.py docs/wallpapers/bing/2025-12 --jobs 16
+"""
+
+import argparse
+import base64
+import hashlib
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import http_client
+from src.state import load_state, save_state
+
+DEFAULT_REPO = "Hana19951208/blog-images"
+BLOB_WORKERS = 8
+MAX_REF_ATTEMPTS = 3
+MANIFEST_STATE = "github_manifest"
+
+_manifest_lock = threading.Lock()
+
+
+class GitHubSyncError(Exception):
+    pass
+
+
+def _config():
+    token = os.environ.get("GH_PAT") or os.environ.get("GITHUB_TOKEN")
+    return {
+        "token": token,
+        "repo": os.environ.get("IMAGE_REPO", DEFAULT_REPO),
+        "branch": os.environ.get("IMAGE_REPO_BRANCH", "main"),
+        "api": os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/"),
+    }
+
+
+def _headers(token: str) -> dict:
+    return {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.v3+json",
+        "User-Agent": "DailyWallpaperHub-Bot",
+    }
+
+
+def _call(method: str, url: str, token: str, expected=(200, 201), **kwargs) -> dict:
+    resp = http_client.request(method, url, headers=_headers(token), **kwargs)
+    if resp.status_code not in expected:
+        raise GitHubSyncError(f"{method} {url} 返回 {resp.status_code}: {resp.text[:200]}")
+    return resp.json()
+
+
+def git_blob_sha(path: Path) -> str:
+    """与 git hash-object 相同的 blob SHA-1，流式计算"""
+    path = Path(path)
+    digest = hashlib.sha1(f"blob {path.stat().st_size}\0".encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _manifest_key(config: dict) -> str:
+    return f"{config['repo']}@{config['branch']}"
+
+
+def load_manifest(config: dict = None) -> Dict[str, str]:
+    """本地记录的远端文件 SHA: {仓库路径: blob SHA}"""
+    config = config or _config()
+    return dict(load_state(MANIFEST_STATE).get(_manifest_key(config), {}))
+
+
+def update_manifest(entries: Dict[str, str], config: dict = None):
+    """合并写入远端 SHA 清单（线程安全）"""
+    if not entries:
+        return
+    config = config or _config()
+    with _manifest_lock:
+        state = load_state(MANIFEST_STATE)
+        current = state.setdefault(_manifest_key(config), {})
+        current.update(entries)
+        state[_manifest_key(config)] = dict(sorted(current.items()))
+        save_state(MANIFEST_STATE, state)
+
+
+def remote_tree(api: str, token: str, tree_sha: str) -> Optional[Dict[str, str]]:
+    """一次请求读取远端全部文件的 SHA；结果被截断（仓库过大）时返回 None"""
+    data = _call("GET", f"{api}/trees/{tree_sha}", token, params={"recursive": "1"})
+    if data.get("truncated"):
+        return None
+    return {item["path"]: item["sha"] for item in data.get("tree", []) if item.get("type") == "blob"}
+
+
+def repo_path_for(local_path: Path) -> str:
+    """本地归档路径 → 图床仓库路径（去掉 docs/ 前缀）: wallpapers/<源>/YYYY-MM/YYYY-MM-DD/image.jpg"""
+    parts = Path(local_path).as_posix().split("/")
+    if "wallpapers" in parts:
+        parts = parts[parts.index("wallpapers"):]
+    return "/".join(parts)
+
+
+def create_blob(api: str, token: str, local_path: Path) -> str:
+    content = base64.b64encode(Path(local_path).read_bytes()).decode("utf-8")
+    data = _call("POST", f"{api}/blobs", token, json={"content": content, "encoding": "base64"},
+                 timeout=(5, 120))
+    return data["sha"]
+
+
+def sync_files(files: Sequence[Tuple[Path, str]], message: str, workers: int = BLOB_WORKERS) -> Optional[dict]:
+    """
+    把 files ([(本地路径, 仓库路径)]) 作为一个提交推送到图床仓库
+    返回 {"commit": sha, "files": 上传数, "skipped": 跳过数, "requests": 调用次数}，全部未变化时 commit 为 None；
+    未配置令牌或没有文件时返回 None
+    失败时抛出 GitHubSyncError
+    """
+    config = _config()
+    if not config["token"]:
+        print("[INFO] GH_PAT/GITHUB_TOKEN 未配置，跳过 GitHub 同步")
+        return None
+    if not files:
+        return None
+
+    token = config["token"]
+    api = f"{config['api']}/repos/{config['repo']}/git"
+    branch = config["branch"]
+    requests_made = 0
+
+    # 本地计算 blob SHA，与清单一致的文件直接跳过
+    local_shas = {repo_path: git_blob_sha(local) for local, repo_path in files}
+    manifest = load_manifest(config)
+    changed = [(local, repo_path) for local, repo_path in files if manifest.get(repo_path) != local_shas[repo_path]]
+    if not changed:
+        print(f"[INFO] {len(files)} 个文件与远端一致，无需同步")
+        return {"commit": None, "files": 0, "skipped": len(files), "requests": 0}
+
+    # 1-2. 当前分支头及其树
+    head = _call("GET", f"{api}/ref/heads/{branch}", token)["object"]["sha"]
+    base_tree = _call("GET", f"{api}/commits/{head}", token)["tree"]["sha"]
+    requests_made += 2
+
+    # 清单未覆盖的路径：读一次远端树，补齐清单后再比较
+    if any(repo_path not in manifest for _, repo_path in changed):
+        tree_shas = remote_tree(api, token, base_tree)
+        requests_made += 1
+        if tree_shas is not None:
+            known = {path: sha for path, sha in tree_shas.items() if path in local_shas}
+            update_manifest(known, config)
+            manifest.update(known)
+            changed = [(local, repo_path) for local, repo_path in changed
+                       if manifest.get(repo_path) != local_shas[repo_path]]
+    skipped = len(files) - len(changed)
+    if not changed:
+        print(f"[INFO] {len(files)} 个文件与远端一致，无需同步 ({requests_made} 次 API 调用)")
+        return {"commit": None, "files": 0, "skipped": skipped, "requests": requests_made}
+
+    # 3. 并发上传 blob（与分支状态无关，快进重试时复用）
+    print(f"[INFO] 正在上传 {len(changed)} 个文件到 {config['repo']}（跳过未变化的 {skipped} 个）...")
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        shas = list(pool.map(lambda f: create_blob(api, token, f[0]), changed))
+    requests_made += len(changed)
+    tree_items = [
+        {"path": repo_path, "mode": "100644", "type": "blob", "sha": sha}
+        for (_, repo_path), sha in zip(changed, shas)
+    ]
+
+    for attempt in range(MAX_REF_ATTEMPTS):
+        if attempt:
+            head = _call("GET", f"{api}/ref/heads/{branch}", token)["object"]["sha"]
+            base_tree = _call("GET", f"{api}/commits/{head}", token)["tree"]["sha"]
+            requests_made += 2
+        # 4-5. 新树与提交
+        tree = _call("POST", f"{api}/trees", token, json={"base_tree": base_tree, "tree": tree_items})
+        commit = _call("POST", f"{api}/commits", token,
+                       json={"message": message, "tree": tree["sha"], "parents": [head]})
+        requests_made += 2
+
+        # 6. 快进分支；分支被并发推进时返回 422，基于新的分支头重来
+        resp = http_client.request("PATCH", f"{api}/refs/heads/{branch}", headers=_headers(token),
+                                   json={"sha": commit["sha"], "force": False})
+        requests_made += 1
+        if resp.status_code == 200:
+            # GitHub 返回的 blob SHA 与本地计算结果相同
+            update_manifest({repo_path: local_shas[repo_path] for _, repo_path in changed}, config)
+            print(f"[OK] 已同步 {len(changed)} 个文件到 {config['repo']}@{branch} (提交 {commit['sha'][:7]}，"
+                  f"共 {requests_made} 次 API 调用)")
+            return {"commit": commit["sha"], "files": len(changed), "skipped": skipped, "requests": requests_made}
+        if resp.status_code != 422:
+            raise GitHubSyncError(f"更新分支失败 ({resp.status_code}): {resp.text[:200]}")
+        print(f"[WARN] 分支 {branch} 已被推进，重新基于最新提交 ({attempt + 1}/{MAX_REF_ATTEMPTS})")
+
+    raise GitHubSyncError(f"分支 {branch} 持续变化，放弃快进")
+
+
+def collect_images(paths: Sequence[str]) -> List[Tuple[Path, str]]:
+    """把命令行传入的文件/目录展开为 [(本地 image.jpg, 仓库路径)]"""
+    files: Dict[str, Path] = {}
+    for arg in paths:
+        path = Path(arg)
+        candidates = sorted(path.rglob("image.jpg")) if path.is_dir() else [path]
+        for local in candidates:
+            files[repo_path_for(local)] = local
+    return [(local, repo_path) for repo_path, local in sorted(files.items())]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="以单个提交批量同步原图到 GitHub 图床仓库")
+    parser.add_argument("paths", nargs="+", help="文件或目录（目录下的 image.jpg 全部同步）")
+    parser.add_argument("--jobs", type=int, default=BLOB_WORKERS, help="并发上传 blob 的线程数")
+    parser.add_argument("--message", help="提交说明")
+    args = parser.parse_args()
+
+    from fetch_bing_wallpaper import load_env
+    load_env()
+
+    files = collect_images(args.paths)
+    message = args.message or f"upload: {len(files)} files (batch sync)"
+    sync_files(files, message, workers=args.jobs)
+    http_client.print_stats()
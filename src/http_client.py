@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+共享 HTTP 客户端
+- 每个主机复用一个 requests.Session（连接池 + keep-alive），避免重复 DNS/TCP/TLS 握手
+- 默认超时，杜绝无超时请求卡死整个任务
+- 失败重试：指数退避 + 随机抖动，遵循 Retry-After
+- 按主机统计请求数、重试数、耗时与收发字节数
+- 流式下载：分块写临时文件、边下载边计算 SHA-256、支持 Range 断点续传、原子替换
+- 遵守 src/run_control 的时间预算：超时压缩到剩余预算以内，预算不够时不再重试
+
+环境变量（均可选）:
+  HTTP_CONNECT_TIMEOUT  连接超时秒数，默认 5
+  HTTP_READ_TIMEOUT     读取超时秒数，默认 30
+  HTTP_RETRIES          最大重试次数，默认 3
+  HTTP_BACKOFF          退避基数秒数，默认 0.5
+  HTTP_BACKOFF_MAX      单次等待上限秒数，默认 30
+"""
+
+import email.utils
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import run_control
+
+USER_AGENT = "DailyWallpaperHub/1.0 (+https://github.com/Hana19951208/DailyWallpaperHub)"
+POOL_MAXSIZE = 16
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# 可以安全重放的方法；POST 只在请求确定未被处理时重试（连接超时、429、503）
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+RETRY_STATUS = {429, 500, 502, 503, 504}
+SAFE_RETRY_STATUS = {429, 503}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_stats = defaultdict(lambda: {"requests": 0, "retries": 0, "errors": 0, "seconds": 0.0, "bytes_in": 0, "bytes_out": 0})
+_stats_lock = threading.Lock()
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def default_timeout():
+    return (_env_float("HTTP_CONNECT_TIMEOUT", 5), _env_float("HTTP_READ_TIMEOUT", 30))
+
+
+def get_session(url: str) -> requests.Session:
+    """获取目标主机对应的 Session（线程安全，按 scheme+host 复用）"""
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE)
+            session.mount(key, adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _sessions[key] = session
+        return session
+
+
+def _retry_after(resp: requests.Response) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期）"""
+    value = resp.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff(attempt: int) -> float:
+    """指数退避 + full jitter"""
+    base = _env_float("HTTP_BACKOFF", 0.5)
+    cap = _env_float("HTTP_BACKOFF_MAX", 30)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def _body_size(kwargs) -> int:
+    for key in ("data", "json"):
+        body = kwargs.get(key)
+        if body is None:
+            continue
+        if isinstance(body, (bytes, str)):
+            return len(body)
+        if key == "json":
+            # 近似值，避免为统计再序列化一次大对象
+            return len(str(body))
+    return 0
+
+
+def _record(host: str, **delta):
+    with _stats_lock:
+        entry = _stats[host]
+        for key, value in delta.items():
+            entry[key] += value
+
+
+def request(method: str, url: str, retries: Optional[int] = None, **kwargs) -> requests.Response:
+    """
+    发送请求，失败时自动重试
+    与 requests.request 参数一致，额外支持 retries 覆盖默认重试次数
+    返回最后一次的 Response（状态码错误不抛异常，由调用方 raise_for_status）
+    """
+    method = method.upper()
+    host = urlsplit(url).netloc
+    timeout = kwargs.pop("timeout", None) or default_timeout()
+    max_retries = int(_env_float("HTTP_RETRIES", 3)) if retries is None else retries
+    idempotent = method in IDEMPOTENT_METHODS
+    cap = _env_float("HTTP_BACKOFF_MAX", 30)
+    session = get_session(url)
+    bytes_out = _body_size(kwargs)
+
+    attempt = 0
+    while True:
+        # 时间预算已用完时抛出 run_control.DeadlineExceeded
+        kwargs["timeout"] = run_control.clamp(timeout)
+        start = time.monotonic()
+        try:
+            resp = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            _record(host, requests=1, errors=1, seconds=time.monotonic() - start, bytes_out=bytes_out)
+            # 连接超时说明请求未发出，任何方法都可以安全重试
+            safe = idempotent or isinstance(e, requests.ConnectTimeout)
+            delay = _backoff(attempt)
+            if attempt >= max_retries or not safe or not run_control.allows(delay):
+                raise
+            print(f"[WARN] {method} {host} 请求失败 ({e.__class__.__name__})，{delay:.1f}s 后重试 ({attempt + 1}/{max_retries})")
+        else:
+            if kwargs.get("stream"):
+                bytes_in = int(resp.headers.get("Content-Length") or 0)
+            else:
+                bytes_in = len(resp.content)
+            _record(host, requests=1, seconds=time.monotonic() - start, bytes_in=bytes_in, bytes_out=bytes_out)
+
+            retryable = RETRY_STATUS if idempotent else SAFE_RETRY_STATUS
+            if resp.status_code not in retryable or attempt >= max_retries:
+                return resp
+            retry_after = _retry_after(resp)
+            delay = min(cap, retry_after) if retry_after is not None else _backoff(attempt)
+            if not run_control.allows(delay):
+                return resp
+            print(f"[WARN] {method} {host} 返回 {resp.status_code}，{delay:.1f}s 后重试 ({attempt + 1}/{max_retries})")
+            resp.close()
+
+        _record(host, retries=1)
+        time.sleep(delay)
+        attempt += 1
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def put(url: str, **kwargs) -> requests.Response:
+    return request("PUT", url, **kwargs)
+
+
+def download_file(url: str, save_path: Path, chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+                  max_attempts: int = 3, **kwargs) -> Tuple[str, int]:
+    """
+    流式下载到 save_path，返回 (sha256, 字节数)
+    - 数据先写入 <文件名>.part，完成后原子替换，进程中途退出不会留下截断的目标文件
+    - .part 已存在时用 Range 请求续传（服务端不支持时从头下载）
+    - 内存占用只与 chunk_size 有关，与图片大小无关
+    - 时间预算用完时抛出 run_control.DeadlineExceeded，保留 .part 供下次续传
+    """
+    save_path = Path(save_path)
+    part_path = save_path.with_name(save_path.name + ".part")
+    save_path.parent.mkdir(parents=True, exist_ok=True)
+    headers = dict(kwargs.pop("headers", None) or {})
+
+    for attempt in range(max_attempts):
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        digest = hashlib.sha256()
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        else:
+            headers.pop("Range", None)
+
+        resp = get(url, headers=headers, stream=True, **kwargs)
+        try:
+            if resp.status_code == 416:
+                # 续传范围无效（文件已变化），丢弃临时文件重来
+                part_path.unlink(missing_ok=True)
+                continue
+            resp.raise_for_status()
+
+            if offset and resp.status_code == 206:
+                # 续传：先把已有部分计入哈希
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b""):
+                        digest.update(chunk)
+                mode = "ab"
+                print(f"[INFO] 从 {offset / 1024:.0f}KB 处续传 {save_path.name}")
+            else:
+                offset = 0
+                mode = "wb"
+
+            expected = resp.headers.get("Content-Length")
+            received = 0
+            with open(part_path, mode) as f:
+                for chunk in resp.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    digest.update(chunk)
+                    received += len(chunk)
+                    if run_control.expired():
+                        raise run_control.DeadlineExceeded(f"时间预算已用完，{save_path.name} 留待续传")
+
+            if expected is not None and received != int(expected):
+                raise requests.ConnectionError(f"下载不完整: {received}/{expected} 字节")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # 保留 .part，下一轮从断点继续
+            if attempt + 1 >= max_attempts:
+                raise
+            print(f"[WARN] 下载中断 ({e})，准备续传 ({attempt + 1}/{max_attempts})")
+            continue
+        finally:
+            resp.close()
+
+        size = offset + received
+        os.replace(part_path, save_path)
+        return digest.hexdigest(), size
+
+    raise requests.ConnectionError(f"下载失败: {url}")
+
+
+def get_stats() -> dict:
+    """返回按主机聚合的统计快照"""
+    with _stats_lock:
+        return {host: dict(entry) for host, entry in _stats.items()}
+
+
+def print_stats():
+    """打印各主机的请求统计（运行结束时调用）"""
+    stats = get_stats()
+    if not stats:
+        return
+    print("[INFO] HTTP 请求统计:")
+    for host, s in sorted(stats.items()):
+        avg = s["seconds"] / s["requests"] if s["requests"] else 0
+        print(
+            f"  {host}: {s['requests']} 次 (重试 {s['retries']}, 失败 {s['errors']}), "
+            f"平均 {avg * 1000:.0f}ms, 下行 {s['bytes_in'] / 1024:.1f}KB, 上行 {s['bytes_out'] / 1024:.1f}KB"
+        )
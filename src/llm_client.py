@@ -0,0 +1,473 @@
+#!/usr/bin/env python3
+"""
+OpenAI 兼容的 Chat Completions 客户端
+- 流式模式 (SSE)：边接收边把正文追加写入临时文件，超时或连接中断时保留已收到的部分
+- 非流式模式：一次性返回结果；响应体同样分块读取，对冲请求被取消或到达截止时间时随时中断
+- 每次调用记录首字延迟 (TTFT)、生成速度 (tokens/s，仅在服务商返回 usage 时计算) 与总耗时，
+  按 服务商|模型 保存到 state/llm_metrics.json，用于比较不同服务商 / 模型的实际速度；
+  流式模式另记内容块数 (chunks)；被截断的调用记为 partial，不计入延迟统计，被取消的对冲请求不记录
+- 多服务商对冲 (hedged_completion)：先请求第一个服务商，超过其历史 p95 耗时仍未返回时向下一个服务商
+  发出对冲请求，取最先完成的结果并取消其余请求；请求失败时立即切换到下一个服务商
+- 熔断：某服务商最近 LLM_BREAKER_FAILURES 次调用全部失败时，在 LLM_BREAKER_COOLDOWN 秒内跳过它
+  （依据 state/llm_metrics.json，跨次运行有效；冷却结束后放行一次试探请求）
+- Batch API：上传 JSONL 请求文件 → 创建批任务 → 轮询 → 下载结果（大批量补生成故事时使用）
+- RateLimiter：并发调用时按每分钟请求数限速
+
+环境变量:
+  LLM_STREAM    是否使用流式模式，默认 1（服务商不支持时设为 0）
+  LLM_TIMEOUT   单次调用总时长上限（秒），默认 90；设定了运行时间预算（--deadline）时不超过剩余预算
+  LLM_API_KEY / LLM_BASE_URL / LLM_MODEL_NAME              主服务商
+  LLM_API_KEY_2 / LLM_BASE_URL_2 / LLM_MODEL_NAME_2 ...    备用服务商（最多到 _9，按序号排列）
+  LLM_HEDGE_DELAY         没有足够历史数据时的对冲等待秒数，默认 30
+  LLM_BREAKER_FAILURES    连续失败多少次后熔断，默认 3
+  LLM_BREAKER_COOLDOWN    熔断持续秒数，默认 900
+
+用法:
+  python src/llm_client.py --stats     # 各服务商 / 模型的延迟统计
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import http_client, run_control
+from src.state import load_state, save_state
+
+DEFAULT_TIMEOUT = 90
+METRICS_STATE = "llm_metrics"
+METRICS_KEEP = 200
+MAX_PROVIDERS = 9
+HEDGE_MIN_SAMPLES = 5
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+_metrics_lock = threading.Lock()
+
+
+class LLMError(Exception):
+    pass
+
+
+class BatchUnsupported(LLMError):
+    """服务商没有提供 Batch API"""
+
+
+class Cancelled(LLMError):
+    """对冲请求中其他服务商已先返回，本请求被取消"""
+
+
+class RateLimiter:
+    """按每分钟请求数 (rpm) 均匀放行，线程安全；rpm 为 0 时不限速"""
+
+    def __init__(self, rpm: float):
+        self.interval = 60.0 / rpm if rpm else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def stream_enabled() -> bool:
+    return os.environ.get("LLM_STREAM", "1").lower() not in ("0", "false", "no", "off")
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def default_timeout() -> float:
+    return _env_float("LLM_TIMEOUT", DEFAULT_TIMEOUT)
+
+
+def load_providers() -> List[dict]:
+    """按序号读取配置的服务商: [{"name", "base_url", "api_key", "model"}]，未配置 LLM_API_KEY 的序号跳过"""
+    providers = []
+    for index in range(1, MAX_PROVIDERS + 1):
+        suffix = "" if index == 1 else f"_{index}"
+        api_key = os.environ.get(f"LLM_API_KEY{suffix}")
+        if not api_key:
+            continue
+        # 工作流中未设置的 secret 是空字符串，同样使用默认值
+        base_url = os.environ.get(f"LLM_BASE_URL{suffix}") or "https://api.openai.com/v1"
+        model = os.environ.get(f"LLM_MODEL_NAME{suffix}") or "gpt-4o"
+        providers.append({
+            "name": f"{urlsplit(base_url).netloc}|{model}",
+            "base_url": base_url,
+            "api_key": api_key,
+            "model": model,
+        })
+    return providers
+
+
+def _percentile(values, pct: float) -> Optional[float]:
+    values = sorted(v for v in values if v is not None)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def record_metrics(provider: str, model: str, metrics: dict):
+    """追加一条调用记录（每个 服务商|模型 只保留最近 METRICS_KEEP 条）"""
+    key = f"{provider}|{model}"
+    with _metrics_lock:
+        state = load_state(METRICS_STATE)
+        calls = state.get(key, [])
+        calls.append(metrics)
+        state[key] = calls[-METRICS_KEEP:]
+        save_state(METRICS_STATE, state)
+
+
+def _complete(calls: list) -> list:
+    """完整返回的调用（延迟统计的样本）；旧记录中被截断的调用同样是 ok，按 partial 排除"""
+    return [c for c in calls if c.get("ok") and not c.get("partial")]
+
+
+def metrics_summary() -> dict:
+    """{服务商|模型: {calls, errors, partial, ttft_p50, ttft_p95, total_p50, total_p95, tps_p50}}"""
+    summary = {}
+    for key, calls in load_state(METRICS_STATE).items():
+        ok = _complete(calls)
+        summary[key] = {
+            "calls": len(calls),
+            "errors": sum(1 for c in calls if c.get("error")),
+            "partial": sum(1 for c in calls if c.get("partial")),
+            "ttft_p50": _percentile([c.get("ttft") for c in ok], 50),
+            "ttft_p95": _percentile([c.get("ttft") for c in ok], 95),
+            "total_p50": _percentile([c.get("total") for c in ok], 50),
+            "total_p95": _percentile([c.get("total") for c in ok], 95),
+            "tps_p50": _percentile([c.get("tokens_per_second") for c in ok], 50),
+        }
+    return summary
+
+
+def breaker_open(name: str, now: Optional[float] = None) -> bool:
+    """服务商最近 LLM_BREAKER_FAILURES 次调用全部失败（没有返回任何内容）、且最后一次失败仍在冷却期内"""
+    threshold = int(_env_float("LLM_BREAKER_FAILURES", 3))
+    cooldown = _env_float("LLM_BREAKER_COOLDOWN", 900)
+    calls = load_state(METRICS_STATE).get(name, [])[-threshold:]
+    if threshold <= 0 or len(calls) < threshold or any(c.get("ok") or c.get("partial") for c in calls):
+        return False
+    return (now or time.time()) - calls[-1].get("at", 0) < cooldown
+
+
+def hedge_delay(name: str) -> float:
+    """对冲等待时间：该服务商成功调用总耗时的 p95，历史不足时使用 LLM_HEDGE_DELAY"""
+    totals = [c.get("total") for c in _complete(load_state(METRICS_STATE).get(name, []))]
+    p95 = _percentile(totals, 95) if len(totals) >= HEDGE_MIN_SAMPLES else None
+    return max(1.0, p95 if p95 is not None else _env_float("LLM_HEDGE_DELAY", 30))
+
+
+def _remaining(timeout: float, start: float) -> float:
+    return max(0.1, timeout - (time.monotonic() - start))
+
+
+def _stream(url: str, headers: dict, payload: dict, timeout: float, partial_path: Optional[Path], start: float,
+            cancel: Optional[threading.Event] = None):
+    """
+    读取 SSE 流，返回 (正文, 首字延迟, token 数, 内容块数, 是否被截断)
+    token 数只取服务商返回的 usage，没有 usage 时为 None（内容块数不等于 token 数）
+    """
+    pieces, ttft, chunks, usage_tokens = [], None, 0, None
+    truncated = False
+    part = open(partial_path, "w", encoding="utf-8") if partial_path else None
+    try:
+        resp = http_client.post(url, headers=headers, json={**payload, "stream": True}, stream=True,
+                                timeout=(5, min(30, _remaining(timeout, start))))
+        try:
+            if resp.status_code >= 400:
+                raise LLMError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+            for line in resp.iter_lines():
+                if cancel is not None and cancel.is_set():
+                    raise Cancelled("已取消")
+                if not line or not line.startswith(b"data:"):
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    break
+                chunk = json.loads(data)
+                if chunk.get("usage"):
+                    usage_tokens = chunk["usage"].get("completion_tokens")
+                for choice in chunk.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if not content:
+                        continue
+                    if ttft is None:
+                        ttft = time.monotonic() - start
+                    pieces.append(content)
+                    chunks += 1
+                    if part:
+                        part.write(content)
+                        part.flush()
+                if time.monotonic() - start > timeout:
+                    truncated = True
+                    print(f"[WARN] LLM 流式响应超过 {timeout:.0f}s，保留已生成的部分")
+                    break
+        finally:
+            resp.close()
+    except requests.RequestException as e:
+        if not pieces:
+            raise
+        truncated = True
+        print(f"[WARN] LLM 流式响应中断 ({e.__class__.__name__})，保留已生成的部分")
+    finally:
+        if part:
+            part.close()
+    return "".join(pieces), ttft, usage_tokens, chunks, truncated
+
+
+def _post_json(url: str, headers: dict, payload: dict, timeout: float, start: float,
+               cancel: Optional[threading.Event] = None) -> dict:
+    """
+    非流式请求：同样以 stream=True 分块读取响应体，每块之间检查 cancel 与总耗时，
+    单次读取的超时不超过剩余时间，落后的对冲请求最迟在截止时间结束
+    """
+    resp = http_client.post(url, headers=headers, json=payload, stream=True,
+                            timeout=(5, _remaining(timeout, start)))
+    try:
+        resp.raise_for_status()
+        body = bytearray()
+        for chunk in resp.iter_content(chunk_size=8192):
+            if cancel is not None and cancel.is_set():
+                raise Cancelled("已取消")
+            body.extend(chunk)
+            if time.monotonic() - start > timeout:
+                raise LLMError(f"LLM 响应超过 {timeout:.0f}s")
+        return json.loads(body)
+    finally:
+        resp.close()
+
+
+def chat_completion(base_url: str, api_key: str, payload: dict, timeout: Optional[float] = None,
+                    stream: Optional[bool] = None, partial_path: Optional[Path] = None,
+                    cancel: Optional[threading.Event] = None) -> dict:
+    """
+    调用 {base_url}/chat/completions，返回 {"text": 正文, "partial": 是否被截断, "metrics": {...}}
+    流式模式下正文同时增量写入 partial_path（如提供）；cancel 被置位时尽快放弃（抛出 Cancelled，不计入统计）
+    失败（且没有任何已生成内容）时抛出异常
+    """
+    timeout = default_timeout() if timeout is None else timeout
+    stream = stream_enabled() if stream is None else stream
+    url = f"{base_url.rstrip('/')}/chat/completions"
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    provider = urlsplit(base_url).netloc
+    model = payload.get("model", "")
+    metrics = {"at": int(time.time()), "stream": stream, "ok": False, "partial": False}
+
+    start = time.monotonic()
+    try:
+        if stream:
+            text, ttft, tokens, chunks, truncated = _stream(url, headers, payload, timeout, partial_path, start,
+                                                            cancel)
+            metrics["chunks"] = chunks
+        else:
+            result = _post_json(url, headers, payload, timeout, start, cancel)
+            text = result["choices"][0]["message"]["content"]
+            ttft = None
+            tokens = (result.get("usage") or {}).get("completion_tokens")
+            truncated = False
+        if not text:
+            raise LLMError("响应为空")
+    except Cancelled:
+        raise
+    except Exception as e:
+        if cancel is not None and cancel.is_set():
+            # 取消后连接被关闭导致的错误不算服务商失败
+            raise Cancelled("已取消") from e
+        metrics.update(total=round(time.monotonic() - start, 2), error=str(e)[:200])
+        record_metrics(provider, model, metrics)
+        raise
+
+    total = time.monotonic() - start
+    generating = total - (ttft or 0)
+    metrics.update({
+        "ok": not truncated,
+        "partial": truncated,
+        "ttft": round(ttft, 2) if ttft is not None else None,
+        "total": round(total, 2),
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / generating, 1) if tokens and generating > 0 else None,
+    })
+    record_metrics(provider, model, metrics)
+    ttft_text = f"首字 {metrics['ttft']}s，" if metrics["ttft"] is not None else ""
+    tps_text = f"，{metrics['tokens_per_second']} tokens/s" if metrics["tokens_per_second"] else ""
+    print(f"[INFO] LLM {provider} {model}: {ttft_text}总耗时 {metrics['total']}s{tps_text}")
+    return {"text": text, "partial": truncated, "metrics": metrics}
+
+
+def hedged_completion(payload: dict, timeout: Optional[float] = None,
+                      partial_path: Optional[Path] = None) -> dict:
+    """
+    在服务商池上执行一次对冲调用，返回 chat_completion 的结果并附带 "provider"
+    - 按配置顺序使用未熔断的服务商（全部熔断时仍按顺序尝试）
+    - 当前请求超过该服务商的 hedge_delay 仍未完成时，向下一个服务商发出对冲请求；请求失败时立即切换
+    - 取最先完整返回的结果，其余请求被取消；都只返回了部分内容时取最长的一份
+    - 总耗时不超过 timeout（及剩余的运行时间预算）：到期后不再发出对冲或切换请求，
+      已有部分内容时立即返回最长的一份，否则等待进行中的请求（各自的超时同样不超过截止时间）
+    - payload 中的 model 按服务商替换
+    """
+    providers = load_providers()
+    if not providers:
+        raise LLMError("未配置 LLM_API_KEY")
+    available = [p for p in providers if not breaker_open(p["name"])]
+    for p in providers:
+        if p not in available:
+            print(f"[WARN] LLM 服务商 {p['name']} 已熔断，本次跳过")
+    available = available or providers
+    timeout = run_control.clamp(default_timeout() if timeout is None else timeout)
+    deadline = time.monotonic() + timeout
+    cancel = threading.Event()
+    futures = {}
+    partials, errors = [], []
+
+    def attempt(provider: dict, part: Optional[Path]):
+        # 请求只在截止时间之前发出，自身超时同样不超过截止时间
+        remaining = max(0.1, deadline - time.monotonic())
+        result = chat_completion(provider["base_url"], provider["api_key"], {**payload, "model": provider["model"]},
+                                 timeout=remaining, partial_path=part, cancel=cancel)
+        return {**result, "provider": {k: provider[k] for k in ("name", "base_url", "model")}}
+
+    pool = ThreadPoolExecutor(max_workers=len(available))
+    try:
+        def launch(failover: bool = False):
+            index = len(futures)
+            provider = available[index]
+            # 只有第一个请求增量写入临时文件，避免多个请求写同一个文件
+            future = pool.submit(attempt, provider, partial_path if index == 0 else None)
+            futures[future] = provider
+            if index:
+                print(f"[INFO] {'切换到' if failover else '向'} {provider['name']}{'' if failover else ' 发出对冲请求'}")
+            return time.monotonic() + hedge_delay(provider["name"])
+
+        def can_launch() -> bool:
+            return len(futures) < len(available) and time.monotonic() < deadline
+
+        # 对冲时刻不晚于截止时间，到期后不再发出新请求
+        hedge_at = min(launch(), deadline)
+        pending = set(futures)
+        while pending:
+            now = time.monotonic()
+            if now >= deadline and partials:
+                break
+            if can_launch():
+                wait_for = max(0.0, hedge_at - now)
+            else:
+                # 到期后进行中的请求由各自的超时兜底，阻塞等待而不是空转
+                wait_for = deadline - now if now < deadline else None
+            done, pending = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"{futures[future]['name']}: {e}")
+                    print(f"[WARN] LLM 服务商 {futures[future]['name']} 失败: {e}")
+                    if can_launch():
+                        hedge_at = min(launch(failover=True), deadline)
+                        pending = {f for f in futures if not f.done()}
+                    continue
+                if not result["partial"]:
+                    cancel.set()
+                    if len(futures) > 1:
+                        print(f"[OK] 采用 {result['provider']['name']} 的结果")
+                    return result
+                partials.append(result)
+            if can_launch() and time.monotonic() >= hedge_at:
+                hedge_at = min(launch(), deadline)
+                pending = {f for f in futures if not f.done()}
+    finally:
+        cancel.set()
+        pool.shutdown(wait=False)
+
+    if partials:
+        return max(partials, key=lambda r: len(r["text"]))
+    raise LLMError("; ".join(errors) or "所有服务商均失败")
+
+
+def _batch_call(method: str, url: str, api_key: str, **kwargs):
+    resp = http_client.request(method, url, headers={"Authorization": f"Bearer {api_key}"}, **kwargs)
+    if resp.status_code in (404, 405, 501):
+        raise BatchUnsupported(f"{method} {url} 返回 {resp.status_code}")
+    if resp.status_code >= 400:
+        raise LLMError(f"{method} {url} 返回 {resp.status_code}: {resp.text[:200]}")
+    return resp
+
+
+def submit_batch(base_url: str, api_key: str, requests_: Sequence[Tuple[str, dict]]) -> str:
+    """上传 [(custom_id, 请求体)] 组成的 JSONL 并创建批任务，返回批任务 ID"""
+    base_url = base_url.rstrip("/")
+    lines = "\n".join(
+        json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": payload},
+                   ensure_ascii=False)
+        for custom_id, payload in requests_
+    ).encode("utf-8")
+    upload = _batch_call("POST", f"{base_url}/files", api_key, data={"purpose": "batch"},
+                         files={"file": ("stories.jsonl", lines, "application/jsonl")}, timeout=(5, 300))
+    batch = _batch_call("POST", f"{base_url}/batches", api_key, json={
+        "input_file_id": upload.json()["id"],
+        "endpoint": BATCH_ENDPOINT,
+        "completion_window": "24h",
+    })
+    return batch.json()["id"]
+
+
+def get_batch(base_url: str, api_key: str, batch_id: str) -> dict:
+    return _batch_call("GET", f"{base_url.rstrip('/')}/batches/{batch_id}", api_key).json()
+
+
+def batch_results(base_url: str, api_key: str, batch: dict) -> Dict[str, dict]:
+    """下载已结束批任务的结果: {custom_id: {"text": 正文} 或 {"error": 原因}}"""
+    results = {}
+    for file_key in ("output_file_id", "error_file_id"):
+        file_id = batch.get(file_key)
+        if not file_id:
+            continue
+        content = _batch_call("GET", f"{base_url.rstrip('/')}/files/{file_id}/content", api_key,
+                              timeout=(5, 300)).text
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            response = item.get("response") or {}
+            body = response.get("body") or {}
+            try:
+                if response.get("status_code") != 200:
+                    raise LLMError(item.get("error") or body.get("error") or f"HTTP {response.get('status_code')}")
+                results[item["custom_id"]] = {"text": body["choices"][0]["message"]["content"]}
+            except (LLMError, KeyError, IndexError, TypeError) as e:
+                results[item["custom_id"]] = {"error": str(e)[:200]}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM 调用延迟统计")
+    parser.add_argument("--stats", action="store_true", help="显示各服务商 / 模型的延迟统计")
+    parser.parse_args()
+
+    def fmt(value, unit="s"):
+        return "-" if value is None else f"{value}{unit}"
+
+    for key, s in sorted(metrics_summary().items()):
+        print(f"{key}: {s['calls']} 次（失败 {s['errors']}，截断 {s['partial']}）"
+              f" 首字 p50 {fmt(s['ttft_p50'])} / p95 {fmt(s['ttft_p95'])}，"
+              f"总耗时 p50 {fmt(s['total_p50'])} / p95 {fmt(s['total_p95'])}，"
+              f"速度 p50 {fmt(s['tps_p50'], ' tokens/s')}")
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+壁纸生命周期流水线引擎
+把单张壁纸的处理拆成声明了依赖 (requires) 和产出文件 (outputs) 的阶段:
+
+  metadata → download → derivatives → story → meta ─┬─ push
+                                                    └─ sync
+  (README / Gallery / API 由调用方汇总后统一渲染)
+
+- 每张壁纸保存一份完成记录 state/pipeline/<源>/<日期>.json（各阶段状态 + 阶段产出的数据，不放进会发布到
+  Pages 的 docs/），进程中途退出后重跑会从第一个未完成的阶段继续，不会重复下载或重复调用 LLM
+- 已完成的阶段只在产出文件缺失、或 refresh_on 中的上游阶段本次重新执行时才重跑
+- 依赖都已完成的阶段并发执行（例如 push 与 sync）
+- 阶段按类型调度: io 直接在线程中执行，cpu 交给进程池，llm 受信号量限流
+- 记录缺失但产出文件齐全的阶段（旧版本归档的壁纸）视为已完成
+- 时间预算（src/run_control）：每个阶段最多使用剩余预算的 share；预算不足的可推迟阶段（推送、同步）
+  记为 deferred 并写入重试队列，由 resume_deferred 在下次运行时重跑；预算用完后不再启动必需阶段
+
+fetch_bing_wallpaper / fetch_unsplash_wallpaper / batch_fetch 共用这一套阶段定义。
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Optional, Sequence
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import http_client, run_control
+
+RECORD_FILENAME = ".pipeline.json"
+RECORD_VERSION = 1
+RECORDS_DIR = Path("state/pipeline")
+WALLPAPERS_BASE = Path("docs/wallpapers")
+# 剩余预算少于这么多秒时不再同步调用 LLM，改为 story_pending 交给 scripts/story_worker.py
+STORY_MIN_SECONDS = 30
+
+
+class StagePools:
+    """
+    分阶段并发控制
+    - 网络阶段（下载、API 请求）: 线程池，最多 workers 个并发
+    - CPU 阶段（缩略图、压缩）: 进程池，最多 min(workers, CPU 核数) 个并发
+    - LLM 故事阶段: 信号量限制并发，避免触发服务商限流
+    workers=1 时所有阶段在当前线程内顺序执行
+    """
+
+    def __init__(self, workers: int = 1, llm_workers: int = None):
+        self.workers = max(1, workers)
+        self.llm_slots = threading.Semaphore(llm_workers or self.workers)
+        self.io_pool = None
+        self.cpu_pool = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.io_pool = ThreadPoolExecutor(max_workers=self.workers)
+            self.cpu_pool = ProcessPoolExecutor(max_workers=min(self.workers, os.cpu_count() or 1))
+        return self
+
+    def __exit__(self, *exc):
+        if self.io_pool:
+            self.io_pool.shutdown(wait=True)
+        if self.cpu_pool:
+            self.cpu_pool.shutdown(wait=True)
+
+    def run_cpu(self, fn, *args):
+        if self.cpu_pool:
+            return self.cpu_pool.submit(fn, *args).result()
+        return fn(*args)
+
+    def run_llm(self, fn, *args):
+        with self.llm_slots:
+            return fn(*args)
+
+    def map_days(self, fn, items):
+        """对每一项执行 fn，结果按输入顺序返回（保证最终索引更新的顺序确定）"""
+        if not self.io_pool:
+            return [fn(item) for item in items]
+        futures = [self.io_pool.submit(fn, item) for item in items]
+        return [f.result() for f in futures]
+
+
+class Stage:
+    """
+    流水线阶段
+    fn(ctx) -> dict | None: 返回的 dict 合并进 ctx 并写入完成记录；返回 None 表示本次跳过（不算完成）
+    requires: 依赖的阶段名
+    outputs: 阶段产出的文件名（相对归档目录），用于校验完成记录、识别旧归档
+    kind: io / cpu / llm，决定调度方式；cpu 阶段的 fn 必须是可 pickle 的模块级函数
+    optional: 失败或跳过时不阻塞下游（例如故事生成）
+    refresh_on: 这些上游阶段本次重新执行时，已完成的本阶段也要重跑（例如故事补全后重写 meta.json）
+    share: 设定了时间预算时，本阶段最多使用剩余预算的这一比例
+    min_seconds: 剩余预算少于该值时不启动本阶段
+    deferrable: 预算不足（或执行中用完）时不算失败，写入重试队列留待下次运行，不阻塞下游
+    """
+
+    def __init__(self, name: str, fn: Callable[[dict], Optional[dict]], requires: Sequence[str] = (),
+                 outputs: Sequence[str] = (), kind: str = "io", optional: bool = False,
+                 refresh_on: Sequence[str] = (), share: float = 1.0, min_seconds: float = 0,
+                 deferrable: bool = False):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+        self.outputs = tuple(outputs)
+        self.kind = kind
+        self.optional = optional
+        self.refresh_on = tuple(refresh_on)
+        self.share = share
+        self.min_seconds = min_seconds
+        self.deferrable = deferrable
+
+
+def record_path(base_dir: Path) -> Path:
+    """
+    完成记录的位置：归档目录 docs/wallpapers/<源>/YYYY-MM/<日期> → state/pipeline/<源>/<日期>.json
+    其他目录（例如 state/staging 下的预取暂存目录）记录在目录内的 .pipeline.json
+    """
+    base_dir = Path(base_dir)
+    try:
+        source = base_dir.relative_to(WALLPAPERS_BASE).parts[0]
+    except (ValueError, IndexError):
+        return base_dir / RECORD_FILENAME
+    return RECORDS_DIR / source / f"{base_dir.name}.json"
+
+
+def load_record(base_dir: Path) -> dict:
+    path = record_path(base_dir)
+    if not path.exists():
+        # 旧版本写在归档目录内的记录，下次保存时迁移
+        path = Path(base_dir) / RECORD_FILENAME
+    if path.exists():
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except Exception:
+            print(f"[WARN] 完成记录损坏，将重新执行: {path}")
+    return {"version": RECORD_VERSION, "stages": {}, "data": {}}
+
+
+def save_record(base_dir: Path, record: dict):
+    path = record_path(base_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(json.dumps(record, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, path)
+    legacy = Path(base_dir) / RECORD_FILENAME
+    if legacy != path and legacy.exists():
+        legacy.unlink()
+
+
+def has_record(base_dir: Path) -> bool:
+    return record_path(base_dir).exists() or (Path(base_dir) / RECORD_FILENAME).exists()
+
+
+def move_record(src_dir: Path, dest_dir: Path):
+    """目录移动（例如预取暂存目录发布到归档位置）前，把完成记录移到新目录对应的位置"""
+    if has_record(src_dir):
+        record = load_record(src_dir)
+        save_record(dest_dir, record)
+        src_path = record_path(src_dir)
+        if src_path.exists() and src_path != record_path(dest_dir):
+            src_path.unlink()
+
+
+def stage_done(base_dir: Path, name: str) -> bool:
+    return load_record(base_dir).get("stages", {}).get(name, {}).get("status") == "done"
+
+
+def mark_done(base_dir: Path, name: str, **data):
+    """在流水线之外完成了某个阶段（例如批量同步）时，补写完成记录"""
+    record = load_record(base_dir)
+    record.setdefault("stages", {})[name] = {
+        "status": "done",
+        "at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+    record.setdefault("data", {}).update(data)
+    save_record(base_dir, record)
+
+
+def run_pipeline(stages: Sequence[Stage], base_dir: Path, ctx: dict,
+                 pools: Optional[StagePools] = None) -> dict:
+    """
+    在 base_dir 上执行流水线，返回 {"ctx": 合并后的上下文, "ran": [...], "failed": {...}, "deferred": [...]}
+    ctx 中的值需可 JSON 序列化（阶段产出会持久化到完成记录）
+    stages 中未包含的依赖视为已完成（重试队列只重跑被推迟的阶段）
+    """
+    base_dir = Path(base_dir)
+    base_dir.mkdir(parents=True, exist_ok=True)
+    pools = pools or StagePools(1)
+    record = load_record(base_dir)
+    status = record.setdefault("stages", {})
+    ctx = {**record.get("data", {}), **ctx, "base_dir": base_dir.as_posix()}
+
+    ran, failed, deferred = [], {}, []
+    pending = {stage.name: stage for stage in stages}
+    settled = {dep for stage in stages for dep in stage.requires if dep not in pending}
+
+    def is_complete(stage: Stage) -> bool:
+        if not all((base_dir / name).exists() for name in stage.outputs):
+            return False
+        if any(dep in ran for dep in stage.refresh_on):
+            return False
+        # 旧版本归档：没有该阶段的记录但产出文件齐全，同样视为已完成；记录为失败的阶段要重跑
+        entry = status.get(stage.name)
+        return entry.get("status") == "done" if entry else bool(stage.outputs)
+
+    def execute(stage: Stage):
+        snapshot = dict(ctx)
+        start = time.monotonic()
+        try:
+            with run_control.stage_slice(stage.share):
+                if stage.kind == "cpu":
+                    result = pools.run_cpu(stage.fn, snapshot)
+                elif stage.kind == "llm":
+                    result = pools.run_llm(stage.fn, snapshot)
+                else:
+                    result = stage.fn(snapshot)
+        except Exception as e:
+            result = e
+        return stage, result, time.monotonic() - start
+
+    def defer(stage: Stage, reason: str):
+        status[stage.name] = {"status": "deferred", "reason": reason}
+        deferred.append(stage.name)
+        settled.add(stage.name)
+        print(f"[INFO] {base_dir} 阶段 {stage.name} 推迟到下次运行: {reason}")
+
+    with ThreadPoolExecutor(max_workers=max(1, len(stages))) as wave_pool:
+        while pending:
+            ready = [stage for stage in pending.values() if all(dep in settled for dep in stage.requires)]
+            if not ready:
+                # 剩余阶段的上游失败
+                for name in pending:
+                    failed[name] = "上游阶段未完成"
+                break
+
+            to_run = []
+            for stage in ready:
+                pending.pop(stage.name)
+                if is_complete(stage):
+                    settled.add(stage.name)
+                elif stage.deferrable and (run_control.expired() or not run_control.allows(stage.min_seconds)):
+                    defer(stage, "剩余时间预算不足")
+                elif run_control.expired():
+                    failed[stage.name] = "超出时间预算"
+                    status[stage.name] = {"status": "failed", "error": "超出时间预算"}
+                    print(f"[WARN] {base_dir} 阶段 {stage.name} 未启动: 超出时间预算")
+                    if stage.optional:
+                        settled.add(stage.name)
+                else:
+                    to_run.append(stage)
+            if not to_run:
+                continue
+
+            # 每个阶段完成后立即写入记录，而不是等整批结束
+            for future in as_completed([wave_pool.submit(execute, stage) for stage in to_run]):
+                stage, result, seconds = future.result()
+                if isinstance(result, run_control.DeadlineExceeded) and stage.deferrable:
+                    defer(stage, str(result))
+                elif isinstance(result, Exception):
+                    failed[stage.name] = str(result)
+                    status[stage.name] = {"status": "failed", "error": str(result)}
+                    print(f"[WARN] {base_dir} 阶段 {stage.name} 失败: {result}")
+                    if stage.optional:
+                        settled.add(stage.name)
+                elif result is None:
+                    status[stage.name] = {"status": "skipped"}
+                    settled.add(stage.name)
+                else:
+                    ctx.update(result)
+                    status[stage.name] = {
+                        "status": "done",
+                        "at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                        "seconds": round(seconds, 2),
+                    }
+                    ran.append(stage.name)
+                    settled.add(stage.name)
+                record["data"] = {k: v for k, v in ctx.items() if k not in ("base_dir", "options")}
+                save_record(base_dir, record)
+
+    # 未启动就推迟 / 失败的阶段也要写入记录
+    save_record(base_dir, record)
+    if deferred:
+        run_control.enqueue(base_dir, ctx.get("source"), deferred, ctx.get("options"), ctx.get("display_name"))
+    return {"ctx": ctx, "ran": ran, "failed": failed, "deferred": deferred}
+
+
+# ---------------------------------------------------------------------------
+# 壁纸阶段定义
+# ctx 约定:
+#   source   数据源名（bing / unsplash）
+#   item     数据源元数据: date, download_url, title, copyright, extra（写入 meta.json 的其他字段）
+#   options  skip_story / defer_story / notify / sync / responsive
+# ---------------------------------------------------------------------------
+
+def _download(ctx: dict) -> dict:
+    sha256, size = http_client.download_file(ctx["item"]["download_url"], Path(ctx["base_dir"]) / "image.jpg", timeout=30)
+    print(f"[OK] 壁纸已下载: {ctx['base_dir']}/image.jpg ({ctx['item'].get('title')})")
+    return {"download_sha256": sha256}
+
+
+def _derivatives(ctx: dict) -> dict:
+    """一次解码生成缩略图/推送图/LLM 输入图/响应式宽度阶梯，并压缩原图（在进程池中执行）"""
+    from src.derivatives import generate_derivatives, responsive_enabled
+
+    options = ctx.get("options", {})
+    outputs = ("thumb", "push", "llm") if options.get("notify") else ("thumb", "llm")
+    derived = generate_derivatives(Path(ctx["base_dir"]) / "image.jpg", outputs=outputs, compress_kb=1024,
+                                   responsive=options.get("responsive", responsive_enabled()))
+    return {"variants": derived.get("responsive")}
+
+
+def _story(ctx: dict) -> Optional[dict]:
+    options = ctx.get("options", {})
+    if options.get("skip_story"):
+        print("[INFO] 跳过故事生成（使用 --skip-story）")
+        return None
+    if not os.environ.get("LLM_API_KEY"):
+        # 未配置 LLM，不算失败，留给 generate_missing_stories 之后补全
+        return None
+    # 两阶段发布 / 剩余时间预算不够一次 LLM 调用：先发布图片，meta.json 标记 story_pending，
+    # 由 scripts/story_worker.py 补写故事
+    if options.get("defer_story"):
+        print("[INFO] 故事改由后台任务生成（--defer-story）")
+        return _story_pending(ctx)
+    if not run_control.allows(STORY_MIN_SECONDS):
+        print("[INFO] 剩余时间预算不足，故事改由后台任务生成")
+        return _story_pending(ctx)
+    from src.story import generate_story
+
+    item = ctx["item"]
+    story_path = Path(ctx["base_dir"]) / "story.md"
+    story_info = {}
+    story_content = generate_story(item.get("title"), item.get("copyright"), Path(ctx["base_dir"]) / "image.jpg",
+                                   info=story_info, story_path=story_path)
+    if not story_content:
+        if run_control.expired():
+            print("[INFO] 故事生成用完了时间预算，改由后台任务生成")
+            return _story_pending(ctx)
+        raise RuntimeError("故事生成失败")
+    print(f"[OK] AI 故事已生成: {story_path}")
+    return {"story_info": story_info}
+
+
+def _story_pending(ctx: dict) -> dict:
+    return {"story_pending": {
+        "notify": bool(ctx.get("options", {}).get("notify")),
+        "display_name": ctx.get("display_name"),
+        "since": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "attempts": 0,
+    }}
+
+
+def _meta(ctx: dict) -> dict:
+    from src.catalog import upsert_entry
+    from src.wallpaper_meta import read_meta, write_meta
+
+    base_dir = Path(ctx["base_dir"])
+    item = ctx["item"]
+    # 保留旧 meta.json 中的字段（例如旧归档已有的 variants）
+    meta_info = read_meta(base_dir) if (base_dir / "meta.json").exists() else {}
+    # 之后合并进来的其他市场（见 fetch_bing_wallpaper.add_markets）不能被重跑的 meta 阶段覆盖
+    markets = {**meta_info.get("markets", {}), **item.get("extra", {}).get("markets", {})}
+    meta_info.update({
+        "date": item["date"],
+        "title": item.get("title"),
+        "copyright": item.get("copyright"),
+        **item.get("extra", {}),
+        "has_story": (base_dir / "story.md").exists(),
+    })
+    if markets:
+        meta_info["markets"] = markets
+    if ctx.get("variants"):
+        meta_info["variants"] = ctx["variants"]
+    if ctx.get("story_info"):
+        meta_info["story"] = ctx["story_info"]
+    if ctx.get("story_pending") and not meta_info["has_story"]:
+        meta_info["story_pending"] = ctx["story_pending"]
+    else:
+        meta_info.pop("story_pending", None)
+    meta_info = write_meta(base_dir, meta_info)
+    upsert_entry(ctx["source"], base_dir, meta_info)
+    print(f"[OK] 元数据已保存: {base_dir / 'meta.json'}")
+    return {"meta_info": meta_info}
+
+
+def _push(ctx: dict) -> Optional[dict]:
+    webhook_url = os.environ.get("WEWORK_WEBHOOK")
+    if not ctx.get("options", {}).get("notify") or not webhook_url:
+        if ctx.get("options", {}).get("notify"):
+            print("[INFO] WEWORK_WEBHOOK 未配置，跳过推送")
+        return None
+    from src.utils import send_image_to_wecom, send_markdown_to_wecom, send_story_to_wecom
+
+    base_dir = Path(ctx["base_dir"])
+    push_path = base_dir / "push.jpg"
+    if not push_path.exists():
+        push_path = base_dir / "image.jpg"
+    source_name = ctx.get("display_name") or ctx["source"].capitalize()
+    story_path = base_dir / "story.md"
+
+    send_image_to_wecom(webhook_url, str(push_path))
+    print("[OK] 企业微信图片推送成功")
+    send_markdown_to_wecom(webhook_url, ctx["meta_info"], source_name=source_name)
+    print("[OK] 企业微信消息推送成功")
+    if story_path.exists():
+        send_story_to_wecom(webhook_url, ctx["meta_info"], story_path.read_text(encoding="utf-8"))
+        print("[OK] 企业微信故事推送成功")
+    return {}
+
+
+def _sync(ctx: dict) -> Optional[dict]:
+    """同步到所有启用的存储后端（GitHub 图床 / S3 兼容对象存储 / 本地目录）"""
+    if not ctx.get("options", {}).get("sync"):
+        return None
+    from src.storage import get_sinks, sync_wallpapers
+
+    sinks = get_sinks()
+    if not sinks:
+        print("[INFO] 未配置任何存储后端，跳过同步")
+        return None
+    results = sync_wallpapers([Path(ctx["base_dir"])], sinks=sinks)
+    failed = {name: r["failed"] for name, r in results.items() if r["failed"]}
+    if failed:
+        if run_control.expired():
+            # 后端把超时记成了失败的文件，按推迟处理，下次运行补传
+            raise run_control.DeadlineExceeded(f"时间预算用完，未同步: {failed}")
+        raise RuntimeError(f"同步失败: {failed}")
+    return {}
+
+
+def wallpaper_stages(fetch_item: Callable[[], Optional[dict]]):
+    """
+    单张壁纸的阶段列表
+    fetch_item: 返回数据源元数据 item 的函数；结果写入完成记录，重跑时不再请求
+    （Unsplash 随机图片接口每次返回不同照片，必须固定下来）
+    """
+    def metadata(ctx):
+        item = fetch_item()
+        if not item:
+            raise RuntimeError("获取元数据失败")
+        return {"item": item}
+
+    # share: 设定时间预算时各阶段最多使用剩余预算的比例（push 与 sync 并发执行）
+    return [
+        Stage("metadata", metadata, share=0.2),
+        Stage("download", _download, requires=("metadata",), outputs=("image.jpg",), share=0.5),
+        Stage("derivatives", _derivatives, requires=("download",), outputs=("thumb.jpg",), kind="cpu",
+              refresh_on=("download",)),
+        # 故事读取压缩后的原图，因此排在 derivatives 之后
+        Stage("story", _story, requires=("derivatives",), outputs=("story.md",), kind="llm", optional=True,
+              share=0.6),
+        Stage("meta", _meta, requires=("derivatives", "story"), outputs=("meta.json",),
+              refresh_on=("derivatives", "story")),
+        Stage("push", _push, requires=("meta",), share=0.5, min_seconds=10, deferrable=True),
+        # 对象存储同步全部四个文件，必须等 story.md / meta.json 写完
+        Stage("sync", _sync, requires=("meta",), min_seconds=20, deferrable=True),
+    ]
+
+
+def wallpaper_dir(source: str, date_str: str) -> Path:
+    """归档目录: docs/wallpapers/<源>/YYYY-MM/YYYY-MM-DD"""
+    return WALLPAPERS_BASE / source / date_str[:7] / date_str
+
+
+def process_wallpaper(source: str, base_dir: Path, fetch_item: Callable[[], Optional[dict]],
+                      pools: Optional[StagePools] = None, display_name: str = None, **options) -> dict:
+    """
+    跑完一张壁纸的全部阶段，返回 run_pipeline 的结果
+    options: skip_story / defer_story（两阶段发布，故事由 scripts/story_worker.py 补写）/ notify（企业微信推送）/
+             sync（同步到存储后端）/ responsive（响应式派生图，默认取 RESPONSIVE_IMAGES，关闭）
+    """
+    ctx = {"source": source, "options": options}
+    if display_name:
+        ctx["display_name"] = display_name
+    return run_pipeline(wallpaper_stages(fetch_item), base_dir, ctx, pools)
+
+
+def resume_deferred() -> list:
+    """
+    重跑重试队列（state/retry_queue.json）中因时间预算推迟的阶段，返回处理过的归档目录
+    只执行被推迟的阶段，上游阶段的产出（item、meta_info 等）从完成记录读取
+    """
+    resumed = []
+    for entry in run_control.queued():
+        if run_control.expired():
+            break
+        base_dir = Path(entry["dir"])
+        if not has_record(base_dir):
+            print(f"[WARN] 重试队列中的目录已不存在，移除: {base_dir}")
+            run_control.settle(base_dir, done=entry["stages"])
+            continue
+        print(f"[INFO] 重跑推迟的阶段 {', '.join(entry['stages'])}: {base_dir}")
+        stages = [stage for stage in wallpaper_stages(lambda: None) if stage.name in entry["stages"]]
+        ctx = {"source": entry["source"], "options": entry.get("options") or {}}
+        if entry.get("display_name"):
+            ctx["display_name"] = entry["display_name"]
+        result = run_pipeline(stages, base_dir, ctx)
+        done = [name for name in entry["stages"] if name not in result["failed"] and name not in result["deferred"]]
+        run_control.settle(base_dir, done=done, failed=list(result["failed"]))
+        resumed.append(base_dir)
+    return resumed
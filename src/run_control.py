@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+运行控制：时间预算、重试队列、运行锁
+每小时的定时任务没有整体时间上限时，一次慢的 Bing 响应、一次 90 秒的故事调用和一次慢的 GitHub 上传会叠加起来；
+定时任务与手动运行重叠时还会重复下载、重复调用 LLM。
+
+- 时间预算: 入口脚本的 --deadline SECONDS 设定整次运行的截止时刻
+    * src/http_client 的每次请求把超时压缩到剩余预算以内，预算不够时不再退避重试
+    * 流水线的每个阶段最多使用剩余预算的 share（Stage.share），LLM 调用的总超时同样受限
+    * 剩余预算不足以启动的可推迟阶段（推送、同步）写入重试队列；故事改为 story_pending，
+      由 scripts/story_worker.py 补写
+- 重试队列 (state/retry_queue.json): 记录被推迟的阶段，下次 fetch_all.py 在预算允许时重跑
+- 运行锁 (state/run.lock): 同一工作目录同时只允许一个抓取 / 故事任务，进程已退出或超过
+  LOCK_STALE_SECONDS 的锁视为失效
+
+未设定截止时刻时，预算相关的函数都不做任何限制。只依赖标准库。
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from src.state import STATE_DIR, load_state, save_state
+
+QUEUE_STATE = "retry_queue"
+QUEUE_MAX_ATTEMPTS = 5
+LOCK_PATH = STATE_DIR / "run.lock"
+LOCK_STALE_SECONDS = 3 * 3600
+
+_deadline = None  # time.monotonic() 截止时刻
+_local = threading.local()  # 当前线程所在阶段的截止时刻
+_queue_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """剩余时间预算已用完"""
+
+
+# ---------------------------------------------------------------------------
+# 时间预算
+# ---------------------------------------------------------------------------
+
+def start_budget(seconds: Optional[float]):
+    """从现在起计时；seconds 为空表示不限时"""
+    global _deadline
+    _deadline = time.monotonic() + seconds if seconds else None
+    if seconds:
+        print(f"[INFO] 本次运行时间预算 {seconds:.0f}s")
+
+
+def remaining() -> Optional[float]:
+    """剩余秒数（取整次运行与当前阶段中较早的截止时刻）；不限时返回 None"""
+    deadlines = [d for d in (_deadline, getattr(_local, "deadline", None)) if d is not None]
+    if not deadlines:
+        return None
+    return min(deadlines) - time.monotonic()
+
+
+def expired() -> bool:
+    left = remaining()
+    return left is not None and left <= 0
+
+
+def allows(seconds: float) -> bool:
+    """剩余预算是否还够 seconds 秒（不限时总是 True）"""
+    left = remaining()
+    return left is None or left >= seconds
+
+
+def clamp(timeout):
+    """
+    把超时（秒数或 requests 的 (连接, 读取) 元组）压缩到剩余预算以内
+    预算已用完时抛出 DeadlineExceeded
+    """
+    left = remaining()
+    if left is None:
+        return timeout
+    if left <= 0:
+        raise DeadlineExceeded("时间预算已用完")
+    if isinstance(timeout, tuple):
+        return tuple(min(t, left) if t else left for t in timeout)
+    return min(timeout, left) if timeout else left
+
+
+@contextmanager
+def stage_slice(share: float = 1.0):
+    """在当前线程内把截止时刻收紧到剩余预算的 share"""
+    left = remaining()
+    previous = getattr(_local, "deadline", None)
+    if left is not None and share < 1:
+        _local.deadline = time.monotonic() + max(0.0, left) * share
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+# ---------------------------------------------------------------------------
+# 重试队列
+# ---------------------------------------------------------------------------
+
+def queued() -> List[dict]:
+    """[{dir, source, stages, options, display_name, since, attempts}]，按加入时间排序"""
+    return sorted(load_state(QUEUE_STATE).get("items", []), key=lambda e: e.get("since", ""))
+
+
+def enqueue(base_dir: Path, source: str, stages, options: dict = None, display_name: str = None):
+    """把推迟的阶段加入队列；同一目录合并为一条"""
+    key = Path(base_dir).as_posix()
+    with _queue_lock:
+        items = load_state(QUEUE_STATE).get("items", [])
+        entry = next((e for e in items if e["dir"] == key), None)
+        if entry is None:
+            entry = {
+                "dir": key,
+                "source": source,
+                "stages": [],
+                "options": options or {},
+                "display_name": display_name,
+                "since": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "attempts": 0,
+            }
+            items.append(entry)
+        entry["stages"] = sorted(set(entry["stages"]) | set(stages))
+        save_state(QUEUE_STATE, {"items": items})
+
+
+def settle(base_dir: Path, done=(), failed=()):
+    """重跑之后更新队列：完成的阶段移除；仍失败的阶段累计次数，超过 QUEUE_MAX_ATTEMPTS 次后放弃"""
+    key = Path(base_dir).as_posix()
+    with _queue_lock:
+        items = load_state(QUEUE_STATE).get("items", [])
+        for entry in items:
+            if entry["dir"] != key:
+                continue
+            entry["stages"] = [name for name in entry["stages"] if name not in done]
+            if failed:
+                entry["attempts"] = entry.get("attempts", 0) + 1
+                if entry["attempts"] >= QUEUE_MAX_ATTEMPTS:
+                    print(f"[WARN] {key}: 推迟的阶段 {entry['stages']} 已失败 {entry['attempts']} 次，放弃")
+                    entry["stages"] = []
+        save_state(QUEUE_STATE, {"items": [e for e in items if e["stages"]]})
+
+
+# ---------------------------------------------------------------------------
+# 运行锁
+# ---------------------------------------------------------------------------
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+def _lock_stale(path: Path) -> bool:
+    try:
+        owner = json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        # 写入中途退出留下的空锁 / 损坏的锁，按文件时间判断
+        return time.time() - path.stat().st_mtime > LOCK_STALE_SECONDS
+    if time.time() - owner.get("started", 0) > LOCK_STALE_SECONDS:
+        return True
+    return owner.get("host") == socket.gethostname() and not _pid_alive(owner.get("pid", 0))
+
+
+@contextmanager
+def run_lock(name: str):
+    """
+    获取运行锁，返回是否拿到锁；已有其他任务在运行时 yield False，调用方应直接退出
+      with run_lock("fetch_all") as acquired:
+          if not acquired:
+              return
+    """
+    LOCK_PATH.parent.mkdir(parents=True, exist_ok=True)
+    owner = {"name": name, "pid": os.getpid(), "host": socket.gethostname(), "started": int(time.time())}
+    for _ in range(2):
+        try:
+            fd = os.open(LOCK_PATH, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not _lock_stale(LOCK_PATH):
+                break
+            print(f"[WARN] 清理失效的运行锁: {LOCK_PATH}")
+            LOCK_PATH.unlink(missing_ok=True)
+            continue
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(owner, f)
+        try:
+            yield True
+        finally:
+            LOCK_PATH.unlink(missing_ok=True)
+        return
+
+    try:
+        holder = json.loads(LOCK_PATH.read_text(encoding="utf-8"))
+    except Exception:
+        holder = {}
+    print(f"[INFO] 另一个任务正在运行 ({holder.get('name', '?')}, pid {holder.get('pid', '?')})，本次退出")
+    yield False
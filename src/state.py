@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+运行状态文件 (state/<name>.json)
+保存跨次运行需要记住的少量信息（例如上次看到的必应壁纸、HTTP 缓存校验头），
+随仓库一起提交，供定时任务下次运行时读取。
+只依赖标准库，可以在快速路径中使用而不拖慢启动。
+"""
+
+import json
+import os
+from pathlib import Path
+
+STATE_DIR = Path("state")
+
+
+def state_path(name: str) -> Path:
+    return STATE_DIR / f"{name}.json"
+
+
+def load_state(name: str) -> dict:
+    """读取状态文件，不存在或损坏时返回空 dict"""
+    path = state_path(name)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception:
+        print(f"[WARN] 状态文件损坏，已忽略: {path}")
+        return {}
+
+
+def save_state(name: str, data: dict):
+    """原子写入状态文件，内容未变化时不写（避免无意义的提交）"""
+    path = state_path(name)
+    text = json.dumps(data, ensure_ascii=False, indent=2, sort_keys=True) + "\n"
+    if path.exists() and path.read_text(encoding="utf-8") == text:
+        return
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+"""
+存储后端（Storage Sink）
+把归档文件同步到外部存储，统一接口:
+  sink.upload_file(本地路径, 对象键) -> URL 或 None
+  sink.upload_many([(本地路径, 对象键)]) -> 统计信息
+
+后端:
+  github  图床仓库（Git Data API 单提交批量同步，见 src/github_sync.py）
+  s3      S3 兼容对象存储（AWS S3 / 腾讯云 COS / MinIO 等），自带 SigV4 签名，不依赖 SDK
+  local   本地目录（例如挂载的网盘或另一块磁盘）
+
+共同特性:
+  - 有界并发：upload_many 最多同时上传 STORAGE_WORKERS 个文件
+  - 内容去重：state/storage_manifest.json 记录每个对象键上次上传的 SHA-256，内容未变化时跳过
+  - 大文件分片：超过 STORAGE_MULTIPART_MB 的文件按 STORAGE_PART_MB 分片并发上传
+    （GitHub 不支持分片，单个 blob 上限 100MB）；S3 分片上传中断后，
+    state/storage_uploads.json 记住 UploadId，下次运行只补传缺失的分片
+
+环境变量:
+  STORAGE_SINKS          启用的后端，逗号分隔，默认 github；s3 / local 需要显式列出（例如 github,s3）
+  STORAGE_WORKERS        并发上传数，默认 4
+  STORAGE_MULTIPART_MB   分片上传阈值，默认 16
+  STORAGE_PART_MB        分片大小，默认 8（S3 要求除最后一片外不小于 5MB）
+  S3_ENDPOINT / S3_BUCKET / S3_REGION / S3_ACCESS_KEY_ID / S3_SECRET_ACCESS_KEY / S3_PUBLIC_URL
+  COS_SECRET_ID / COS_SECRET_KEY / COS_REGION / COS_BUCKET  （腾讯云 COS，未配置 S3_* 时使用）
+  LOCAL_SINK_DIR         local 后端的目标目录
+"""
+
+import hashlib
+import hmac
+import os
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src import http_client
+from src.github_sync import repo_path_for as object_key_for
+from src.state import load_state, save_state
+from src.wallpaper_meta import file_sha256
+
+MANIFEST_STATE = "storage_manifest"
+# 未完成的分片上传 {后端标识: {对象键: {"upload_id", "sha256", "part_size"}}}
+UPLOADS_STATE = "storage_uploads"
+# 每张壁纸同步到对象存储的文件（GitHub 图床只同步原图）
+WALLPAPER_FILES = ("image.jpg", "thumb.jpg", "story.md", "meta.json")
+
+_manifest_lock = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class StorageSink:
+    """存储后端基类：去重、并发与分片调度；子类实现 _put / _put_multipart / url_for"""
+
+    name = "base"
+    files = WALLPAPER_FILES
+    supports_multipart = True
+
+    def __init__(self):
+        self.workers = max(1, _env_int("STORAGE_WORKERS", 4))
+        self.multipart_threshold = _env_int("STORAGE_MULTIPART_MB", 16) * 1024 * 1024
+        self.part_size = max(5, _env_int("STORAGE_PART_MB", 8)) * 1024 * 1024
+
+    # ---- 子类接口 ----
+    @property
+    def sink_id(self) -> str:
+        """去重清单中区分不同目标的标识"""
+        return self.name
+
+    def enabled(self) -> bool:
+        return True
+
+    def url_for(self, key: str) -> str:
+        raise NotImplementedError
+
+    def _put(self, local_path: Path, key: str, sha256: str):
+        raise NotImplementedError
+
+    def _put_multipart(self, local_path: Path, key: str, sha256: str, parts: List[Tuple[int, int, int]]):
+        raise NotImplementedError
+
+    def _remote_sha256(self, key: str) -> Optional[str]:
+        """远端记录的内容哈希（清单缺失时用于去重），不支持时返回 None"""
+        return None
+
+    # ---- 通用逻辑 ----
+    def _parts(self, size: int) -> List[Tuple[int, int, int]]:
+        """[(分片号, 偏移, 长度)]，分片号从 1 开始"""
+        return [(i + 1, offset, min(self.part_size, size - offset))
+                for i, offset in enumerate(range(0, size, self.part_size))]
+
+    def _manifest(self) -> Dict[str, str]:
+        return load_state(MANIFEST_STATE).get(self.sink_id, {})
+
+    def _remember(self, entries: Dict[str, str]):
+        with _manifest_lock:
+            state = load_state(MANIFEST_STATE)
+            current = state.setdefault(self.sink_id, {})
+            current.update(entries)
+            state[self.sink_id] = dict(sorted(current.items()))
+            save_state(MANIFEST_STATE, state)
+
+    def _upload(self, local_path: Path, key: str, manifest: Dict[str, str]) -> bool:
+        """上传单个文件，返回是否真正上传（内容未变化时为 False）"""
+        local_path = Path(local_path)
+        sha256 = file_sha256(local_path)
+        if manifest.get(key) == sha256:
+            return False
+        if self._remote_sha256(key) == sha256:
+            self._remember({key: sha256})
+            return False
+
+        size = local_path.stat().st_size
+        if self.supports_multipart and size > self.multipart_threshold:
+            self._put_multipart(local_path, key, sha256, self._parts(size))
+        else:
+            self._put(local_path, key, sha256)
+        self._remember({key: sha256})
+        return True
+
+    def upload_file(self, local_path: Path, key: str) -> Optional[str]:
+        """上传单个文件，内容未变化时跳过；返回对象 URL，失败抛出异常"""
+        self._upload(local_path, key, self._manifest())
+        return self.url_for(key)
+
+    def upload_many(self, files: Sequence[Tuple[Path, str]]) -> dict:
+        """有界并发上传一批文件，返回 {"uploaded": n, "skipped": n, "failed": {键: 原因}}"""
+        manifest = self._manifest()
+        pending = [(Path(local), key) for local, key in files if Path(local).exists()]
+        stats = {"uploaded": 0, "skipped": 0, "failed": {}}
+
+        def one(item):
+            try:
+                return item[1], self._upload(item[0], item[1], manifest), None
+            except Exception as e:
+                return item[1], False, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for key, uploaded, error in pool.map(one, pending):
+                if error:
+                    stats["failed"][key] = error
+                    print(f"[ERROR] [{self.name}] 上传失败 {key}: {error}")
+                else:
+                    stats["uploaded" if uploaded else "skipped"] += 1
+        print(f"[OK] [{self.name}] 上传 {stats['uploaded']}，未变化跳过 {stats['skipped']}，失败 {len(stats['failed'])}")
+        return stats
+
+
+class LocalSink(StorageSink):
+    """复制到本地目录；大文件按分片并发写入同一个临时文件，完成后原子替换"""
+
+    name = "local"
+
+    def __init__(self, root: Optional[str] = None):
+        super().__init__()
+        self.root = Path(root or os.environ.get("LOCAL_SINK_DIR", ""))
+
+    @property
+    def sink_id(self) -> str:
+        return f"local:{self.root.resolve().as_posix()}"
+
+    def enabled(self) -> bool:
+        return bool(str(self.root)) and str(self.root) != "."
+
+    def url_for(self, key: str) -> str:
+        return (self.root / key).resolve().as_uri()
+
+    def _target(self, key: str) -> Tuple[Path, Path]:
+        target = self.root / key
+        target.parent.mkdir(parents=True, exist_ok=True)
+        return target, target.with_name(target.name + ".part")
+
+    def _put(self, local_path: Path, key: str, sha256: str):
+        target, tmp = self._target(key)
+        shutil.copyfile(local_path, tmp)
+        os.replace(tmp, target)
+
+    def _put_multipart(self, local_path: Path, key: str, sha256: str, parts):
+        target, tmp = self._target(key)
+        with open(tmp, "wb") as f:
+            f.truncate(local_path.stat().st_size)
+
+        def copy_part(part):
+            _, offset, length = part
+            with open(local_path, "rb") as src, open(tmp, "r+b") as dst:
+                src.seek(offset)
+                dst.seek(offset)
+                dst.write(src.read(length))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            list(pool.map(copy_part, parts))
+        os.replace(tmp, target)
+
+
+class S3Sink(StorageSink):
+    """S3 兼容对象存储（SigV4 签名，分片上传中断后续传）"""
+
+    name = "s3"
+
+    def __init__(self):
+        super().__init__()
+        env = os.environ.get
+        self.bucket = env("S3_BUCKET") or env("COS_BUCKET")
+        self.region = env("S3_REGION") or env("COS_REGION") or "us-east-1"
+        self.access_key = env("S3_ACCESS_KEY_ID") or env("COS_SECRET_ID")
+        self.secret_key = env("S3_SECRET_ACCESS_KEY") or env("COS_SECRET_KEY")
+        endpoint = env("S3_ENDPOINT")
+        if endpoint:
+            # 自定义端点（MinIO、本地替身等）使用 path-style: <端点>/<桶>/<键>
+            self.base_url = f"{endpoint.rstrip('/')}/{self.bucket}"
+        else:
+            # 腾讯云 COS 使用 virtual-hosted: https://<桶>.cos.<地域>.myqcloud.com/<键>
+            self.base_url = f"https://{self.bucket}.cos.{self.region}.myqcloud.com"
+        self.public_url = (env("S3_PUBLIC_URL") or self.base_url).rstrip("/")
+
+    @property
+    def sink_id(self) -> str:
+        return f"s3:{self.base_url}"
+
+    def enabled(self) -> bool:
+        return bool(self.bucket and self.access_key and self.secret_key)
+
+    def url_for(self, key: str) -> str:
+        return f"{self.public_url}/{quote(key)}"
+
+    # ---- SigV4 ----
+    def _signed_request(self, method: str, key: str, query: Optional[Dict[str, str]] = None,
+                        body: bytes = b"", headers: Optional[Dict[str, str]] = None):
+        query = query or {}
+        headers = dict(headers or {})
+        url_parts = urlsplit(f"{self.base_url}/{quote(key)}")
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+        date_stamp = now.strftime("%Y%m%d")
+        payload_hash = hashlib.sha256(body).hexdigest()
+
+        headers.update({"host": url_parts.netloc, "x-amz-date": amz_date, "x-amz-content-sha256": payload_hash})
+        canonical_query = "&".join(f"{quote(k, safe='-_.~')}={quote(v, safe='-_.~')}"
+                                   for k, v in sorted(query.items()))
+        signed = sorted(k.lower() for k in headers)
+        lower = {k.lower(): str(v).strip() for k, v in headers.items()}
+        canonical_request = "\n".join([
+            method,
+            url_parts.path,
+            canonical_query,
+            "".join(f"{k}:{lower[k]}\n" for k in signed),
+            ";".join(signed),
+            payload_hash,
+        ])
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        string_to_sign = "\n".join([
+            "AWS4-HMAC-SHA256", amz_date, scope, hashlib.sha256(canonical_request.encode()).hexdigest(),
+        ])
+        signing_key = f"AWS4{self.secret_key}".encode()
+        for part in (date_stamp, self.region, "s3", "aws4_request"):
+            signing_key = hmac.new(signing_key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers["Authorization"] = (f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope}, "
+                                    f"SignedHeaders={';'.join(signed)}, Signature={signature}")
+        headers.pop("host")
+
+        url = f"{url_parts.scheme}://{url_parts.netloc}{url_parts.path}"
+        if canonical_query:
+            url += f"?{canonical_query}"
+        resp = http_client.request(method, url, data=body or None, headers=headers, timeout=(5, 120))
+        if resp.status_code >= 300 and not (method == "HEAD" and resp.status_code == 404):
+            raise RuntimeError(f"{method} {key} 返回 {resp.status_code}: {resp.text[:200]}")
+        return resp
+
+    def _remote_sha256(self, key: str) -> Optional[str]:
+        resp = self._signed_request("HEAD", key)
+        return resp.headers.get("x-amz-meta-sha256") if resp.status_code == 200 else None
+
+    def _put(self, local_path: Path, key: str, sha256: str):
+        self._signed_request("PUT", key, body=local_path.read_bytes(), headers={"x-amz-meta-sha256": sha256})
+
+    # ---- 分片上传续传记录 ----
+    def _pending_upload(self, key: str) -> Optional[dict]:
+        return load_state(UPLOADS_STATE).get(self.sink_id, {}).get(key)
+
+    def _set_pending_upload(self, key: str, entry: Optional[dict]):
+        with _manifest_lock:
+            state = load_state(UPLOADS_STATE)
+            uploads = state.setdefault(self.sink_id, {})
+            if entry is None:
+                uploads.pop(key, None)
+            else:
+                uploads[key] = entry
+            if not uploads:
+                state.pop(self.sink_id)
+            save_state(UPLOADS_STATE, state)
+
+    def _abort(self, key: str, upload_id: str):
+        try:
+            self._signed_request("DELETE", key, query={"uploadId": upload_id})
+        except Exception:
+            pass
+
+    def _uploaded_parts(self, key: str, upload_id: str) -> Optional[Dict[int, Tuple[str, int]]]:
+        """已上传的分片 {分片号: (ETag, 大小)}；上传已失效（完成、中止或被生命周期规则清理）时返回 None"""
+        try:
+            resp = self._signed_request("GET", key, query={"uploadId": upload_id})
+        except RuntimeError:
+            return None
+        parts = {}
+        for element in ElementTree.fromstring(resp.content).iter():
+            if element.tag.split("}")[-1] != "Part":
+                continue
+            fields = {child.tag.split("}")[-1]: child.text or "" for child in element}
+            parts[int(fields["PartNumber"])] = (fields["ETag"], int(fields["Size"]))
+        return parts
+
+    def _put_multipart(self, local_path: Path, key: str, sha256: str, parts):
+        # 上次中断的上传：内容和分片大小都没变时续传，否则中止旧上传重新开始
+        pending = self._pending_upload(key)
+        upload_id, uploaded = None, {}
+        if pending and pending["sha256"] == sha256 and pending["part_size"] == self.part_size:
+            uploaded = self._uploaded_parts(key, pending["upload_id"])
+            if uploaded is not None:
+                upload_id = pending["upload_id"]
+                print(f"[INFO] [{self.name}] 续传 {key}：已有 {len(uploaded)}/{len(parts)} 个分片")
+        elif pending:
+            self._abort(key, pending["upload_id"])
+        if upload_id is None:
+            resp = self._signed_request("POST", key, query={"uploads": ""}, headers={"x-amz-meta-sha256": sha256})
+            upload_id, uploaded = _xml_text(resp.content, "UploadId"), {}
+            self._set_pending_upload(key, {"upload_id": upload_id, "sha256": sha256, "part_size": self.part_size})
+
+        def upload_part(part):
+            number, offset, length = part
+            if number in uploaded and uploaded[number][1] == length:
+                return number, uploaded[number][0]
+            with open(local_path, "rb") as f:
+                f.seek(offset)
+                body = f.read(length)
+            part_resp = self._signed_request("PUT", key, query={"partNumber": str(number), "uploadId": upload_id},
+                                             body=body)
+            return number, part_resp.headers.get("ETag", "")
+
+        # 失败时保留已上传的分片和续传记录，下次运行只补传缺失的分片
+        # （彻底放弃的上传由桶的 AbortIncompleteMultipartUpload 生命周期规则清理）
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            etags = list(pool.map(upload_part, parts))
+        complete = "".join(f"<Part><PartNumber>{n}</PartNumber><ETag>{etag}</ETag></Part>" for n, etag in etags)
+        body = f"<CompleteMultipartUpload>{complete}</CompleteMultipartUpload>".encode()
+        self._signed_request("POST", key, query={"uploadId": upload_id}, body=body)
+        self._set_pending_upload(key, None)
+
+
+class GitHubSink(StorageSink):
+    """GitHub 图床仓库：单文件走 Contents API，批量走 Git Data API 单提交；去重基于 git blob SHA"""
+
+    name = "github"
+    files = ("image.jpg",)
+    supports_multipart = False
+
+    def enabled(self) -> bool:
+        return bool(os.environ.get("GH_PAT") or os.environ.get("GITHUB_TOKEN"))
+
+    def url_for(self, key: str) -> str:
+        repo = os.environ.get("IMAGE_REPO", "Hana19951208/blog-images")
+        branch = os.environ.get("IMAGE_REPO_BRANCH", "main")
+        return f"https://raw.githubusercontent.com/{repo}/{branch}/{key}"
+
+    def upload_file(self, local_path: Path, key: str) -> Optional[str]:
+        from src.utils import upload_to_github
+
+        url = upload_to_github(str(local_path), key)
+        if not url:
+            raise RuntimeError(f"GitHub 同步失败: {key}")
+        return url
+
+    def upload_many(self, files: Sequence[Tuple[Path, str]]) -> dict:
+        from src.github_sync import sync_files
+
+        files = [(Path(local), key) for local, key in files if Path(local).exists()]
+        try:
+            if len(files) == 1:
+                self.upload_file(*files[0])
+                return {"uploaded": 1, "skipped": 0, "failed": {}}
+            result = sync_files(files, f"upload: {len(files)} files (batch sync)", workers=max(self.workers, 8))
+        except Exception as e:
+            # 单提交要么全部成功要么全部失败
+            print(f"[ERROR] [{self.name}] 同步失败: {e}")
+            return {"uploaded": 0, "skipped": 0, "failed": {key: str(e) for _, key in files}}
+        if not result:
+            return {"uploaded": 0, "skipped": 0, "failed": {}}
+        return {"uploaded": result["files"], "skipped": result["skipped"], "failed": {}}
+
+
+SINKS = {"github": GitHubSink, "s3": S3Sink, "local": LocalSink}
+
+
+def _xml_text(content: bytes, tag: str) -> str:
+    for element in ElementTree.fromstring(content).iter():
+        if element.tag.split("}")[-1] == tag:
+            return element.text or ""
+    raise RuntimeError(f"响应中缺少 {tag}")
+
+
+def get_sinks() -> List[StorageSink]:
+    """按 STORAGE_SINKS 创建已启用（配置齐全）的后端；只配置了凭据而未列出的后端不会启用"""
+    names = [n.strip() for n in os.environ.get("STORAGE_SINKS", "github").split(",") if n.strip()]
+    sinks = []
+    for name in names:
+        if name not in SINKS:
+            print(f"[WARN] 未知的存储后端: {name}")
+            continue
+        sink = SINKS[name]()
+        if sink.enabled():
+            sinks.append(sink)
+    return sinks
+
+
+def sync_wallpapers(dirs: Sequence[Path], names: Optional[Sequence[str]] = None,
+                    sinks: Optional[List[StorageSink]] = None) -> Dict[str, dict]:
+    """
+    把若干壁纸目录同步到所有启用的后端（每个后端只同步自己关心的文件）
+    names: 只同步这些文件（例如补写故事后只同步 story.md / meta.json）
+    返回 {后端名: 统计}
+    """
+    sinks = get_sinks() if sinks is None else sinks
+    results = {}
+    for sink in sinks:
+        wanted = [n for n in sink.files if names is None or n in names]
+        files = [(Path(d) / n, object_key_for(Path(d) / n)) for d in dirs for n in wanted
+                 if (Path(d) / n).exists()]
+        if files:
+            results[sink.name] = sink.upload_many(files)
+    return results
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+AI 故事生成
+- 通过支持视觉的 LLM 为壁纸生成背景故事（输入缩小后的 llm.jpg，见 src/derivatives）
+- 提示词从 STORY_PROMPT_FILE（默认 prompts/story_prompt.txt）加载
+- 结果按图片 / 提示词 / 模型缓存（src/story_cache），story.md 原子写入
+
+流水线 (src/pipeline)、scripts/story_worker.py 与 scripts/generate_missing_stories.py 共用。
+"""
+
+import base64
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+STORY_PARAMS = {"max_tokens": 1000}
+# 流式响应被截断时，至少收到这么多字符才当作可用的故事
+PARTIAL_MIN_CHARS = 300
+
+
+def load_story_prompt() -> str:
+    """从外部文件加载系统提示词（STORY_PROMPT_FILE），不存在时使用内置提示词"""
+    prompt_file = Path(os.environ.get("STORY_PROMPT_FILE", "prompts/story_prompt.txt"))
+    if prompt_file.exists():
+        return prompt_file.read_text(encoding="utf-8").strip()
+    return "你是一位地理与文化深度旅行作家。请结合提供的图片内容、标题和背景信息，写一篇约 500 字的精美短文。要求：\n1. 直接输出 Markdown 正文，不要包含“好的”、“这是一篇...”等开头或结尾的客套话。\n2. 标题使用一级标题 (# Title)。\n3. 内容要包含对画面视觉细节（光影、色彩、构图）的细腻描写，并自然引出背后的地理文化故事。\n4. 语言风格优美、感性且富有深度。"
+
+
+def write_story(story_path: Path, content: str):
+    """先写临时文件再原子替换，中途退出不会留下半截的 story.md"""
+    tmp_path = story_path.with_name(f".{story_path.name}.part")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, story_path)
+    # 清理流式生成留下的临时文件
+    story_path.with_name(story_path.name + ".part").unlink(missing_ok=True)
+
+
+def story_provenance(image_path: Path, model_name: str = None, image_sha: str = None) -> dict:
+    """按当前提示词 / 模型（默认主服务商的模型）/ 参数计算故事来源信息（含缓存键），见 src/story_cache.describe"""
+    from src import story_cache
+    # 视觉输入使用缩小后的 llm.jpg，其规格也是缓存键的一部分
+    from src.derivatives import spec_for
+
+    model_name = model_name or os.environ.get("LLM_MODEL_NAME") or "gpt-4o"  # 默认尝试视觉模型
+    llm_spec = spec_for("llm")
+    params = {**STORY_PARAMS, "image_size": list(llm_spec["size"]), "image_quality": llm_spec["quality"]}
+    return story_cache.describe(image_path, load_story_prompt(), model_name, params, image_sha)
+
+
+def story_payload(title, copyright, image_path: Path) -> dict:
+    """构造 Chat Completions 请求体（单次调用与 Batch API 共用）"""
+    from src.derivatives import llm_input
+
+    # 读取 LLM 输入图并编码为 base64（生成失败时退回原图）
+    try:
+        input_path = llm_input(image_path)
+    except Exception as e:
+        print(f"[WARN] LLM 输入图生成失败，改用原图: {e}")
+        input_path = image_path
+    with open(input_path, "rb") as image_file:
+        base64_image = base64.b64encode(image_file.read()).decode('utf-8')
+
+    return {
+        "model": os.environ.get("LLM_MODEL_NAME") or "gpt-4o",
+        "messages": [
+            {
+                "role": "system", 
+                "content": load_story_prompt()
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"题目：{title}\n背景项：{copyright}\n请结合这张图片进行创作。"
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{base64_image}"
+                        }
+                    }
+                ]
+            }
+        ],
+        **STORY_PARAMS
+    }
+
+
+def finish_story(title, image_path: Path, story_text: str, story_path: Path = None) -> str:
+    """在正文头部插入原图展示（根据图片文件名动态调整），传入 story_path 时原子写入"""
+    final_content = f"![{title}]({image_path.name})\n\n{story_text}"
+    if story_path:
+        write_story(story_path, final_content)
+    return final_content
+
+
+def generate_story(title, copyright, image_path: Path, info: dict = None, story_path: Path = None):
+    """
+    通过支持视觉的 LLM 生成壁纸背景故事
+    相同图片 + 提示词 + 模型 + 参数的结果从 src/story_cache 直接返回，不再调用 LLM
+    传入 info 字典时写入故事来源（cache_key / image_sha256 / prompt_sha256 / model），供 meta.json 记录
+    传入 story_path 时，流式生成的正文增量写入 story.md.part，完成后原子替换为 story_path；
+    超时截断但已足够长的正文同样保留（info["partial"] = True，不写入缓存）
+    配置了多个服务商（LLM_API_KEY_2 ...）时使用对冲调用，见 src/llm_client.hedged_completion
+    """
+    from src import story_cache
+    from src.llm_client import hedged_completion, load_providers
+    from src.wallpaper_meta import file_sha256
+
+    providers = load_providers()
+    if not providers:
+        return None
+
+    # 任一服务商模型的缓存命中都可以直接使用（图片哈希只计算一次）
+    image_sha = file_sha256(image_path)
+    for provider in providers:
+        provenance = story_provenance(image_path, provider["model"], image_sha)
+        cached = story_cache.get(provenance["cache_key"])
+        if cached:
+            if info is not None:
+                info.update(provenance)
+            print(f"[INFO] 故事缓存命中: '{title}' ({provenance['cache_key'][:12]})")
+            return finish_story(title, image_path, cached, story_path)
+    
+    print(f"[INFO] 正在为 '{title}' 生成视觉深度故事...")
+    try:
+        payload = story_payload(title, copyright, image_path)
+        part_path = story_path.with_name(story_path.name + ".part") if story_path else None
+        result = hedged_completion(payload, partial_path=part_path)
+        story_text = result["text"]
+        provenance = story_provenance(image_path, result["provider"]["model"], image_sha)
+        if info is not None:
+            info.update(provenance)
+        if result["partial"]:
+            if len(story_text) < PARTIAL_MIN_CHARS:
+                print(f"[WARN] 视觉故事生成超时，仅收到 {len(story_text)} 字，放弃")
+                return None
+            print(f"[WARN] 视觉故事生成超时，保留已生成的 {len(story_text)} 字")
+            if info is not None:
+                info["partial"] = True
+        else:
+            story_cache.put(provenance["cache_key"], story_text, provenance)
+        return finish_story(title, image_path, story_text, story_path)
+    except Exception as e:
+        print(f"[WARN] 视觉故事生成失败: {e}")
+        return None
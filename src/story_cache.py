@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+AI 故事缓存 (state/story_cache.json)
+按内容寻址：键 = SHA-256(图片 SHA-256 + 系统提示词 SHA-256 + 模型名 + 请求参数)，值为 LLM 返回的正文。
+
+- 同一张图片在重试、补生成或跨数据源重复出现时直接命中，不再花 90 秒和一次调用费用
+- 修改提示词文件 (STORY_PROMPT_FILE) 或模型 (LLM_MODEL_NAME) 后键自然变化，旧条目不会被误用
+- 总大小超过 STORY_CACHE_KB（默认 2048）时按最近使用时间淘汰最旧的条目；
+  最近使用时间精确到天（命中时只在距上次记录超过一天才写回），避免每次命中都改动状态文件产生提交
+- 每个条目记录提示词 SHA 与模型名，可以按提示词版本 / 模型选择性失效；
+  故事生成后同样的信息写入 meta.json 的 "story" 字段，供 generate_missing_stories --regenerate-prompt 筛选
+
+标题与版权信息不参与键计算：故事主要由画面决定，跨源重复的同一张图可以共用。
+
+用法:
+  python src/story_cache.py --stats
+  python src/story_cache.py --invalidate-prompt 3f2a9c    # 提示词 SHA 前缀
+  python src/story_cache.py --invalidate-model gpt-4o
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from src.state import load_state, save_state
+
+CACHE_STATE = "story_cache"
+DEFAULT_MAX_KB = 2048
+# 命中时刷新 last_used 的最小间隔（秒）
+TOUCH_INTERVAL = 24 * 3600
+
+_lock = threading.Lock()
+
+
+def _max_bytes() -> int:
+    try:
+        return int(os.environ.get("STORY_CACHE_KB", DEFAULT_MAX_KB)) * 1024
+    except ValueError:
+        return DEFAULT_MAX_KB * 1024
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def cache_key(image_sha: str, prompt_sha: str, model: str, params: dict) -> str:
+    raw = json.dumps([image_sha, prompt_sha, model, params], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def describe(image_path: Path, system_prompt: str, model: str, params: dict,
+             image_sha: Optional[str] = None) -> Dict[str, str]:
+    """
+    故事的来源信息（写入 meta.json 的 "story" 字段）: cache_key / image_sha256 / prompt_sha256 / model
+    image_sha: 调用方已计算好的图片哈希（按多个模型查缓存时只计算一次）
+    """
+    from src.wallpaper_meta import file_sha256
+
+    image_sha = image_sha or file_sha256(image_path)
+    prompt_sha = text_sha256(system_prompt)
+    return {
+        "cache_key": cache_key(image_sha, prompt_sha, model, params),
+        "image_sha256": image_sha,
+        "prompt_sha256": prompt_sha,
+        "model": model,
+    }
+
+
+def _entries() -> dict:
+    return load_state(CACHE_STATE).get("entries", {})
+
+
+def _save(entries: dict):
+    save_state(CACHE_STATE, {"entries": entries})
+
+
+def get(key: str) -> Optional[str]:
+    """命中时返回缓存的正文；记录的最近使用时间超过一天时才刷新并写回"""
+    with _lock:
+        entries = _entries()
+        entry = entries.get(key)
+        if not entry:
+            return None
+        now = int(time.time())
+        if now - entry.get("last_used", 0) >= TOUCH_INTERVAL:
+            entry["last_used"] = now
+            _save(entries)
+        return entry["text"]
+
+
+def put(key: str, text: str, info: Dict[str, str]):
+    """写入一条缓存，超出容量时淘汰最久未使用的条目"""
+    now = int(time.time())
+    with _lock:
+        entries = _entries()
+        entries[key] = {
+            "text": text,
+            "prompt_sha256": info.get("prompt_sha256"),
+            "image_sha256": info.get("image_sha256"),
+            "model": info.get("model"),
+            "created": now,
+            "last_used": now,
+        }
+        _evict(entries, _max_bytes())
+        _save(entries)
+
+
+def _evict(entries: dict, max_bytes: int) -> int:
+    total = sum(len(entry["text"].encode("utf-8")) for entry in entries.values())
+    evicted = 0
+    for key in sorted(entries, key=lambda k: entries[k].get("last_used", 0)):
+        if total <= max_bytes:
+            break
+        total -= len(entries.pop(key)["text"].encode("utf-8"))
+        evicted += 1
+    return evicted
+
+
+def matches(info: dict, prompt: str = None, model: str = None) -> bool:
+    """info（缓存条目或 meta.json 的 story 字段）是否属于指定的提示词版本（SHA 前缀）/ 模型"""
+    if not info or (prompt is None and model is None):
+        return False
+    if prompt is not None and not (info.get("prompt_sha256") or "").startswith(prompt):
+        return False
+    if model is not None and info.get("model") != model:
+        return False
+    return True
+
+
+def invalidate(prompt: str = None, model: str = None) -> int:
+    """删除指定提示词版本 / 模型生成的条目，返回删除数量"""
+    with _lock:
+        entries = _entries()
+        doomed = [key for key, entry in entries.items() if matches(entry, prompt, model)]
+        for key in doomed:
+            del entries[key]
+        if doomed:
+            _save(entries)
+        return len(doomed)
+
+
+def stats() -> dict:
+    entries = _entries()
+    prompts: Dict[str, int] = {}
+    for entry in entries.values():
+        prompt = (entry.get("prompt_sha256") or "")[:12]
+        prompts[prompt] = prompts.get(prompt, 0) + 1
+    return {
+        "entries": len(entries),
+        "bytes": sum(len(entry["text"].encode("utf-8")) for entry in entries.values()),
+        "max_bytes": _max_bytes(),
+        "prompts": prompts,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AI 故事缓存管理")
+    parser.add_argument("--stats", action="store_true", help="显示缓存统计")
+    parser.add_argument("--invalidate-prompt", metavar="SHA", help="删除该提示词版本（SHA 前缀）生成的条目")
+    parser.add_argument("--invalidate-model", metavar="MODEL", help="删除该模型生成的条目")
+    args = parser.parse_args()
+
+    if args.invalidate_prompt or args.invalidate_model:
+        removed = invalidate(prompt=args.invalidate_prompt, model=args.invalidate_model)
+        print(f"[OK] 已删除 {removed} 条缓存")
+    info = stats()
+    print(f"[INFO] 缓存条目 {info['entries']}，{info['bytes'] / 1024:.1f}KB / {info['max_bytes'] / 1024:.0f}KB")
+    for prompt, count in sorted(info["prompts"].items(), key=lambda kv: -kv[1]):
+        print(f"  提示词 {prompt}: {count} 条")
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 更新 docs/index.html 中的壁纸画廊
-支持多数据源
+支持多数据源；必应卡片带 data-markets，页面顶部的市场下拉框按市场筛选
 """
 
 import re
@@ -12,12 +12,100 @@ from pathlib import Path
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.config_loader import get_enabled_sources, get_display_config
+from src.catalog import load_catalog
+from src.wallpaper_meta import markets_of
+
+# 卡片在桌面端约 320~460px 宽，移动端单列铺满
+CARD_SIZES = "(max-width: 640px) 100vw, 460px"
+SOURCE_TYPES = {"avif": "image/avif", "webp": "image/webp"}
+
+
+def _image_html(wp):
+    """有响应式派生图时输出 <picture> + srcset，否则退回单张缩略图"""
+    variants = wp.get("variants")
+    img_tag = f'<img src="{wp["thumb_url"]}" alt="{wp["title"]}" loading="lazy">'
+    if not variants or not variants.get("files"):
+        return img_tag
+
+    srcsets = {}
+    for file in variants["files"]:
+        srcsets.setdefault(file["format"], []).append(f'{wp["base_url"]}/{file["path"]} {file["width"]}w')
+
+    lines = ["<picture>"]
+    for fmt in ("avif", "webp"):
+        if fmt in srcsets:
+            lines.append(f'<source type="{SOURCE_TYPES[fmt]}" srcset="{", ".join(srcsets[fmt])}" sizes="{CARD_SIZES}">')
+    jpg_srcset = ", ".join(srcsets.get("jpg", []))
+    if jpg_srcset:
+        lines.append(f'<img src="{wp["thumb_url"]}" srcset="{jpg_srcset}" sizes="{CARD_SIZES}" alt="{wp["title"]}" loading="lazy">')
+    else:
+        lines.append(img_tag)
+    indent = "\n                "
+    return "<picture>" + "".join(indent + "    " + line for line in lines[1:]) + indent + "</picture>"
+
+
+def _wallpaper_view(record, source_map):
+    """目录索引记录 → 卡片需要的字段"""
+    date = record["date"]
+    source_name = record["source"]
+    title = record["meta"].get("title", date)
+    
+    # 生成相对于 docs/ 的相对路径
+    # 例如 dir 是 docs/wallpapers/bing/2026-01/2026-01-09
+    # 我们需要 ./wallpapers/bing/2026-01/2026-01-09/image.jpg
+    rel_to_docs = Path(record["dir"]).relative_to(Path("docs"))
+    
+    # 统一使用 image.jpg
+    img_url = f"./{rel_to_docs}/image.jpg"
+    thumb_url = f"./{rel_to_docs}/thumb.jpg"
+    story_url = f"./{rel_to_docs}/story.md" if record["has_story"] else None
+    
+    return {
+        "id": f"{source_name}/{date}",
+        # 同一天其他市场的图片归档在带市场后缀的目录中（如 2026-10-18-en-us），显示时去掉后缀
+        "date": date[:len("YYYY-MM-DD")],
+        "title": title,
+        "img_url": img_url,
+        "thumb_url": thumb_url,
+        "story_url": story_url,
+        "base_url": f"./{rel_to_docs}",
+        "variants": record["meta"].get("variants"),
+        "markets": markets_of(source_name, record["meta"]),
+        "source": source_map[source_name].get("display_name", source_name)
+    }
+
+
+def _card_html(wp):
+    title_html = f'<span class="title">{wp["title"]}</span>'
+    if wp["story_url"]:
+        title_html = f'<a href="{wp["story_url"]}" class="story-link"><span class="title">{wp["title"]} 📖</span></a>'
+    
+    markets_attr = f' data-markets="{" ".join(wp["markets"])}"' if wp["markets"] else ""
+    return f'''        <div class="card" data-id="{wp["id"]}"{markets_attr}>
+            <a href="{wp["img_url"]}" target="_blank">
+                {_image_html(wp)}
+            </a>
+            <p>{wp["date"]} · {wp["source"]}</p>
+            {title_html}
+        </div>'''
+
+
+def _render_market_filter(html_content, wallpapers):
+    """按出现次数列出市场下拉框的选项（页面没有下拉框时原样返回）"""
+    counts = {}
+    for wp in wallpapers:
+        for market in wp["markets"]:
+            counts[market] = counts.get(market, 0) + 1
+    options = ['            <option value="">全部市场</option>']
+    options += [f'            <option value="{market}">{market} ({count})</option>'
+                for market, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))]
+    pattern = r'(<select id="market-filter"[^>]*>)[\s\S]*?(\s*</select>)'
+    return re.sub(pattern, lambda m: m.group(1) + "\n" + "\n".join(options) + m.group(2), html_content, count=1)
 
 
 def update_gallery():
     """更新 docs/index.html 中的画廊内容"""
     html_path = Path("docs/index.html")
-    wallpapers_base = Path("docs/wallpapers")
     
     # 获取配置
     enabled_sources = get_enabled_sources()
@@ -29,79 +117,51 @@ def update_gallery():
         return
     
     # 收集所有壁纸
-    all_wallpapers = []
-    
-    for source in enabled_sources:
-        source_name = source["name"]
-        source_dir = wallpapers_base / source_name
-        
-        if not source_dir.exists():
-            continue
-            
-        # 递归寻找所有包含 meta.json 的目录
-        for meta_file in source_dir.rglob("meta.json"):
-            date_dir = meta_file.parent
-            date = date_dir.name
-            
-            # 统一使用 image.jpg
-            image_file = "image.jpg"
-            thumb_path = date_dir / "thumb.jpg"
-            image_path = date_dir / image_file
-            story_path = date_dir / "story.md"
-            
-            if thumb_path.exists() and image_path.exists():
-                try:
-                    meta = json.loads(meta_file.read_text(encoding="utf-8"))
-                    title = meta.get("title", date)
-                    
-                    # 生成相对于 docs/ 的相对路径
-                    # 例如 date_dir 是 docs/wallpapers/bing/2026-01/2026-01-09
-                    # 我们需要 ./wallpapers/bing/2026-01/2026-01-09/image.jpg
-                    rel_to_docs = date_dir.relative_to(Path("docs"))
-                    
-                    img_url = f"./{rel_to_docs}/{image_file}"
-                    thumb_url = f"./{rel_to_docs}/thumb.jpg"
-                    story_url = f"./{rel_to_docs}/story.md" if story_path.exists() else None
-                    
-                    all_wallpapers.append({
-                        "date": date,
-                        "title": title,
-                        "img_url": img_url,
-                        "thumb_url": thumb_url,
-                        "story_url": story_url,
-                        "source": source.get("display_name", source_name)
-                    })
-                except:
-                    pass
+    source_map = {s["name"]: s for s in enabled_sources}
+    all_wallpapers = [
+        _wallpaper_view(record, source_map)
+        for record in load_catalog(sources=list(source_map))
+        if record["has_thumb"] and record["has_image"]
+    ]
     
     # 按日期排序
     all_wallpapers.sort(key=lambda x: x["date"], reverse=True)
     
     # 生成卡片
-    cards = []
-    for wp in all_wallpapers:
-        title_html = f'<span class="title">{wp["title"]}</span>'
-        if wp["story_url"]:
-            title_html = f'<a href="{wp["story_url"]}" class="story-link"><span class="title">{wp["title"]} 📖</span></a>'
-        
-        cards.append(f'''        <div class="card">
-            <a href="{wp["img_url"]}" target="_blank">
-                <img src="{wp["thumb_url"]}" alt="{wp["title"]}" loading="lazy">
-            </a>
-            <p>{wp["date"]} · {wp["source"]}</p>
-            {title_html}
-        </div>''')
-    
-    gallery_content = "\n".join(cards)
+    gallery_content = "\n".join(_card_html(wp) for wp in all_wallpapers)
     
     # 更新 HTML
     html_content = html_path.read_text(encoding="utf-8")
+    html_content = _render_market_filter(html_content, all_wallpapers)
     pattern = r'(<div class="gallery">)[\s\S]*?(</div>\s*</body>)'
     replacement = f"\\1\n{gallery_content}\n    \\2"
     new_content = re.sub(pattern, replacement, html_content)
     html_path.write_text(new_content, encoding="utf-8")
 
 
+def refresh_cards(keys) -> bool:
+    """
+    只重绘指定 (源, 日期) 的卡片（例如补写故事后），其余卡片保持不变
+    页面中找不到某张卡片时返回 False，由调用方改为全量渲染
+    """
+    html_path = Path("docs/index.html")
+    source_map = {s["name"]: s for s in get_enabled_sources()}
+    keys = set(keys)
+    records = [r for r in load_catalog(sources=list(source_map)) if (r["source"], r["date"]) in keys]
+    if len(records) != len(keys):
+        return False
+
+    html_content = html_path.read_text(encoding="utf-8")
+    for record in records:
+        wp = _wallpaper_view(record, source_map)
+        pattern = rf'        <div class="card" data-id="{re.escape(wp["id"])}"[^>]*>[\s\S]*?\n        </div>'
+        html_content, count = re.subn(pattern, lambda _: _card_html(wp), html_content, count=1)
+        if not count:
+            return False
+    html_path.write_text(html_content, encoding="utf-8")
+    return True
+
+
 if __name__ == "__main__":
     update_gallery()
     print("[OK] docs/index.html 已更新 (多源模式)")
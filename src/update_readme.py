@@ -13,55 +13,39 @@ from collections import defaultdict
 # 添加项目根目录到路径
 sys.path.insert(0, str(Path(__file__).parent.parent))
 from src.config_loader import get_enabled_sources, get_display_config
+from src.catalog import load_catalog
 
 
 def update_readme():
     """更新 README.md 中 WALLPAPER_INDEX 锚点区域的内容"""
     readme_path = Path("README.md")
-    # 获取壁纸数据
-    wallpapers_base = Path("docs/wallpapers")
-    
     # 获取配置
     enabled_sources = get_enabled_sources()
     display_config = get_display_config()
     max_items = display_config.get("max_items_per_source", 10)
     
-    # 按日期聚合所有源的壁纸
+    # 按日期聚合所有源的壁纸（从目录索引读取，不再遍历归档目录）
     date_wallpapers = defaultdict(dict)  # {date: {source_name: {meta, paths}}}
+    source_map = {s["name"]: s for s in enabled_sources}
     
-    for source in enabled_sources:
-        source_name = source["name"]
-        source_dir = wallpapers_base / source_name
+    for record in load_catalog(sources=list(source_map)):
+        if not record["has_thumb"]:
+            continue
         
-        if not source_dir.exists():
+        source_name = record["source"]
+        date = record["date"]  # 文件夹名即日期
+        date_dir = Path(record["dir"])
+        if len(date) > len("YYYY-MM-DD"):
+            # 其他市场当天的另一张图片（目录带市场后缀），README 每天每个源只展示一张
             continue
-            
-        # 递归寻找所有包含 meta.json 的目录
-        # 以前在 doc/wallpapers/bing/2026-01-09/
-        # 现在在 doc/wallpapers/bing/2026-01/2026-01-09/
-        for meta_file in source_dir.rglob("meta.json"):
-            date_dir = meta_file.parent
-            date = date_dir.name # 文件夹名即日期
-            
-            thumb_path = date_dir / "thumb.jpg"
-            image_path = date_dir / "image.jpg"
-            story_path = date_dir / "story.md"
-            
-            if thumb_path.exists():
-                try:
-                    meta = json.loads(meta_file.read_text(encoding="utf-8"))
-                    # 计算相对于项目根目录的相对路径
-                    rel_dir = date_dir.relative_to(Path().absolute()) if date_dir.is_absolute() else date_dir
-                    
-                    date_wallpapers[date][source_name] = {
-                        "meta": meta,
-                        "thumb": str(date_dir / "thumb.jpg"),
-                        "image": str(date_dir / "image.jpg"),
-                        "story": str(date_dir / "story.md") if story_path.exists() else None,
-                        "display_name": source.get("display_name", source_name)
-                    }
-                except:
-                    pass
+
+        date_wallpapers[date][source_name] = {
+            "meta": record["meta"],
+            "thumb": str(date_dir / "thumb.jpg"),
+            "image": str(date_dir / "image.jpg"),
+            "story": str(date_dir / "story.md") if record["has_story"] else None,
+            "display_name": source_map[source_name].get("display_name", source_name)
+        }
     
     # 排序并限制数量
     sorted_dates = sorted(date_wallpapers.keys(), reverse=True)[:max_items]
@@ -5,7 +5,7 @@
 
 import hashlib
 import os
-import requests
+from src import http_client
 import json
 import base64
 import sys
@@ -28,7 +28,7 @@ def send_image_to_wecom(webhook_url: str, image_path: str):
         }
     }
 
-    resp = requests.post(webhook_url, json=payload, timeout=10)
+    resp = http_client.post(webhook_url, json=payload, timeout=10)
     resp.raise_for_status()
     
     result = resp.json()
@@ -60,7 +60,7 @@ def send_markdown_to_wecom(webhook_url: str, meta: dict, source_name: str = "Bin
         }
     }
 
-    resp = requests.post(webhook_url, json=payload, timeout=10)
+    resp = http_client.post(webhook_url, json=payload, timeout=10)
     resp.raise_for_status()
     
     result = resp.json()
@@ -96,7 +96,7 @@ def send_story_to_wecom(webhook_url: str, meta: dict, story_content: str):
             }
         }
         
-        resp = requests.post(webhook_url, json=payload, timeout=10)
+        resp = http_client.post(webhook_url, json=payload, timeout=10)
         resp.raise_for_status()
         result = resp.json()
         
@@ -109,6 +109,7 @@ def send_story_to_wecom(webhook_url: str, meta: dict, story_content: str):
 def upload_to_github(local_path: str, github_path: str):
     """
     上传文件到指定的 GitHub 仓库（替代 COS）
+    本地 blob SHA 与清单或远端一致时跳过上传
     """
     token = os.environ.get('GH_PAT') or os.environ.get('GITHUB_TOKEN')
     token_src = "GH_PAT" if os.environ.get('GH_PAT') else "GITHUB_TOKEN"
@@ -119,10 +120,16 @@ def upload_to_github(local_path: str, github_path: str):
         print("[INFO] GH_PAT/GITHUB_TOKEN 未配置，跳过 GitHub 上传")
         return None
 
+    from src.github_sync import git_blob_sha, load_manifest, update_manifest
+
+    raw_url = f"https://raw.githubusercontent.com/{repo}/{branch}/{github_path}"
+    manifest_config = {"repo": repo, "branch": branch}
     try:
-        # 读取文件内容并进行 base64 编码
-        with open(local_path, "rb") as f:
-            content = base64.b64encode(f.read()).decode("utf-8")
+        # 与清单记录的远端 SHA 一致：不发任何请求
+        local_sha = git_blob_sha(local_path)
+        if load_manifest(manifest_config).get(github_path) == local_sha:
+            print(f"[INFO] 文件未变化，跳过上传: {github_path}")
+            return raw_url
 
         # GitHub API URL
         url = f"https://api.github.com/repos/{repo}/contents/{github_path}"
@@ -135,13 +142,21 @@ def upload_to_github(local_path: str, github_path: str):
 
         # 检查文件是否已存在（为了获取 sha 以进行更新）
         sha = None
-        resp = requests.get(url, headers=headers)
+        resp = http_client.get(url, headers=headers)
         if resp.status_code == 200:
             sha = resp.json().get("sha")
+            if sha == local_sha:
+                update_manifest({github_path: sha}, manifest_config)
+                print(f"[INFO] 远端文件内容相同，跳过上传: {github_path}")
+                return raw_url
             print(f"[INFO] 文件已存在，准备更新 (SHA: {sha[:7]}): {github_path}")
         elif resp.status_code != 404:
             print(f"[WARN] 检查文件是否存在时返回异常状态码 {resp.status_code}: {resp.text}")
 
+        # 读取文件内容并进行 base64 编码
+        with open(local_path, "rb") as f:
+            content = base64.b64encode(f.read()).decode("utf-8")
+
         # 提交更改
         payload = {
             "message": f"upload: {github_path} (auto sync)",
@@ -152,10 +167,10 @@ def upload_to_github(local_path: str, github_path: str):
             payload["sha"] = sha
 
         print(f"[INFO] 正在上传至 {repo} (Using {token_src})...")
-        put_resp = requests.put(url, headers=headers, json=payload)
+        put_resp = http_client.put(url, headers=headers, json=payload, timeout=(5, 120))
         
         if put_resp.status_code in [200, 201]:
-            raw_url = f"https://raw.githubusercontent.com/{repo}/{branch}/{github_path}"
+            update_manifest({github_path: put_resp.json().get("content", {}).get("sha", local_sha)}, manifest_config)
             print(f"[OK] 文件已同步至 GitHub: {raw_url}")
             return raw_url
         else:
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+meta.json 读写工具
+v2 结构在抓取时记录图片事实（分辨率、压缩后字节数、SHA-256、缩略图尺寸），
+索引与 API 生成只需读取 JSON，无需再解码图片:
+
+{
+  "schema_version": 2,
+  "date": "...", "title": "...", "copyright": "...", "image_url": "...", "has_story": true,
+  "image": {"width": 1920, "height": 1080, "file_size": 341462, "sha256": "..."},
+  "thumb": {"width": 400, "height": 225},
+  "story": {"cache_key": "...", "image_sha256": "...", "prompt_sha256": "...", "model": "gpt-4o"},
+  "hsh": "...", "markets": {"zh-CN": {"title": "...", "copyright": "...", "startdate": "20261018"}, "en-US": {...}}
+}
+story 记录生成故事时使用的提示词与模型（见 src/story_cache.py），旧归档没有该字段。
+hsh / markets 只有必应壁纸有：同一张图片在各市场的标题与版权信息，旧归档没有该字段（只抓取过 zh-CN）。
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, Dict
+
+META_SCHEMA_VERSION = 2
+HASH_CHUNK_SIZE = 1024 * 1024
+# 没有 markets 字段的旧归档来自哪些市场
+LEGACY_MARKETS = {"bing": ["zh-CN"]}
+
+
+def file_sha256(path: Path) -> str:
+    """分块计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_size(path: Path):
+    """只读取图片头部获取宽高（Image.open 是惰性的，不会解码像素）"""
+    from PIL import Image
+
+    with Image.open(path) as img:
+        return img.size
+
+
+def image_facts(base_dir: Path) -> Dict[str, Any]:
+    """收集壁纸目录中 image.jpg / thumb.jpg 的事实信息"""
+    facts = {}
+    image_path = base_dir / "image.jpg"
+    thumb_path = base_dir / "thumb.jpg"
+
+    if image_path.exists():
+        width, height = image_size(image_path)
+        facts["image"] = {
+            "width": width,
+            "height": height,
+            "file_size": image_path.stat().st_size,
+            "sha256": file_sha256(image_path),
+        }
+    if thumb_path.exists():
+        width, height = image_size(thumb_path)
+        facts["thumb"] = {"width": width, "height": height}
+    return facts
+
+
+def is_current(meta: dict) -> bool:
+    return meta.get("schema_version", 1) >= META_SCHEMA_VERSION and "image" in meta
+
+
+def write_meta(base_dir: Path, meta_info: dict) -> dict:
+    """
+    补全图片事实后写入 base_dir/meta.json，返回最终写入的字典
+    需在压缩原图、生成缩略图之后调用，保证记录的是最终文件
+    """
+    meta = {"schema_version": META_SCHEMA_VERSION}
+    meta.update({k: v for k, v in meta_info.items() if k not in ("image", "thumb")})
+    meta.update(image_facts(base_dir))
+
+    meta_path = base_dir / "meta.json"
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    return meta
+
+
+def markets_of(source: str, meta: dict) -> list:
+    """壁纸所属的市场列表（按抓取配置的顺序），非必应源返回空列表"""
+    return list(meta.get("markets") or LEGACY_MARKETS.get(source, []))
+
+
+def read_meta(base_dir: Path) -> dict:
+    return json.loads((base_dir / "meta.json").read_text(encoding="utf-8"))
@@ -0,0 +1,145 @@
+"""
+测试辅助：本地替身服务器 (http.server) 与临时工作目录
+
+各模块的状态文件 (state/*.json)、归档目录 (docs/wallpapers) 都是相对当前目录的路径，
+因此测试在临时目录中运行，不会碰到仓库里的真实数据。
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = Path(__file__).parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+class Request:
+    """替身服务器收到的一次请求"""
+
+    def __init__(self, handler: BaseHTTPRequestHandler, body: bytes):
+        parts = urlsplit(handler.path)
+        self.method = handler.command
+        self.path = parts.path
+        self.query = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+        self.headers = handler.headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body or b"null")
+
+
+class Response:
+    """
+    路由函数的返回值
+    body 为 dict/list 时按 JSON 输出；chunks 为可迭代的字节串时按 chunked 编码逐块写出并 flush（模拟 SSE / 慢响应）
+    abort=True 时写完 chunks 后不发结束块直接断开连接（模拟传输中断）
+    """
+
+    def __init__(self, status: int = 200, body=None, headers: dict = None, chunks=None, abort: bool = False):
+        self.status = status
+        self.body = body
+        self.headers = dict(headers or {})
+        self.chunks = chunks
+        self.abort = abort
+
+
+class StubServer:
+    """
+    在后台线程运行的本地 HTTP 替身服务器
+      with StubServer(route) as server:
+          requests.get(server.url + "/path")
+    route(Request) -> Response；所有请求按顺序记录在 server.requests
+    """
+
+    def __init__(self, route):
+        self.route = route
+        self.requests = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _handle(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                request = Request(self, self.rfile.read(length) if length else b"")
+                with stub._lock:
+                    stub.requests.append(request)
+                response = stub.route(request)
+                self.send_response(response.status)
+                for key, value in response.headers.items():
+                    self.send_header(key, value)
+                if response.chunks is not None:
+                    # 流式响应：chunked 编码逐块发送，写完后关闭连接
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.send_header("Connection", "close")
+                    self.end_headers()
+                    try:
+                        for chunk in response.chunks:
+                            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                            self.wfile.flush()
+                        if not response.abort:
+                            self.wfile.write(b"0\r\n\r\n")
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+                    self.close_connection = True
+                    return
+                body = response.body
+                if isinstance(body, (dict, list)):
+                    body = json.dumps(body).encode()
+                    if "Content-Type" not in response.headers:
+                        self.send_header("Content-Type", "application/json")
+                elif isinstance(body, str):
+                    body = body.encode()
+                body = body or b""
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = do_HEAD = _handle
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def calls(self, method: str = None):
+        """按顺序返回 "METHOD /path" 列表，可按方法过滤"""
+        return [f"{r.method} {r.path}" for r in self.requests if method in (None, r.method)]
+
+
+class TempDirTestCase(unittest.TestCase):
+    """在临时目录中运行的测试（state/ 等相对路径都落在临时目录）"""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        self.tmp = Path(self._tmp.name)
+        os.chdir(self.tmp)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def write_file(self, rel_path: str, data: bytes) -> Path:
+        path = self.tmp / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return Path(rel_path)
@@ -0,0 +1,127 @@
+"""fetch_bing_wallpaper 快速路径对本地 Bing 接口替身服务器的测试"""
+
+import json
+import unittest
+from unittest import mock
+
+from tests.helpers import Response, StubServer, TempDirTestCase
+
+import fetch_bing_wallpaper as bing
+from src.state import load_state, save_state
+
+ARCHIVE = "docs/wallpapers/bing/2026-10/2026-10-18"
+IMAGE = {"startdate": "20261018", "fullstartdate": "202610180000", "hsh": "abc123", "url": "/th?id=OHR.Test.jpg",
+         "title": "标题", "copyright": "版权"}
+
+
+class FastPathTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        meta = {"date": "2026-10-18", "hsh": "abc123", "markets": {"zh-CN": {"title": "标题"}}}
+        self.write_file(f"{ARCHIVE}/meta.json", json.dumps(meta).encode())
+        server = self.enterContext(StubServer(self.route))
+        self.server = server
+        self.enterContext(mock.patch.object(bing, "BING_API", f"{server.url}/HPImageArchive.aspx"))
+
+    @staticmethod
+    def route(request):
+        # 主市场带着上次的 ETag 请求时返回 304，其他请求返回同一张图片
+        if request.headers.get("If-None-Match") == '"e1"':
+            return Response(304)
+        return Response(200, {"images": [dict(IMAGE, title=f"title {request.query['mkt']}")]},
+                        headers={"ETag": '"e1"'})
+
+    def save(self, **extra):
+        save_state(bing.STATE_NAME, {"etag": '"e1"', "hsh": "abc123", "startdate": "20261018", "date": "2026-10-18",
+                                     "images": {"abc123": ARCHIVE}, **extra})
+
+    def test_unchanged_exits_without_loading_config(self):
+        self.save(market_list=["zh-CN"])
+
+        with mock.patch.object(bing, "configured_markets", side_effect=AssertionError("快速路径读取了配置")):
+            self.assertIsNone(bing.run(render=False))
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(self.server.requests[0].query["mkt"], "zh-CN")
+
+    def test_first_run_records_market_list(self):
+        self.save()
+
+        with mock.patch.object(bing, "configured_markets", return_value=["zh-CN"]) as configured:
+            self.assertIsNone(bing.run(render=False))
+            self.assertIsNone(bing.run(render=False))
+
+        configured.assert_called_once()
+        self.assertEqual(load_state(bing.STATE_NAME)["market_list"], ["zh-CN"])
+
+    def test_market_added_to_config_is_checked_and_merged(self):
+        self.save()
+
+        with mock.patch.object(bing, "configured_markets", return_value=["zh-CN", "en-US"]):
+            base_dir = bing.run(render=False)
+
+        self.assertEqual(base_dir.as_posix(), ARCHIVE)
+        meta = json.loads((self.tmp / ARCHIVE / "meta.json").read_text(encoding="utf-8"))
+        self.assertEqual(meta["markets"]["en-US"]["title"], "title en-US")
+        state = load_state(bing.STATE_NAME)
+        self.assertEqual(state["market_list"], ["zh-CN", "en-US"])
+        self.assertEqual(state["markets"]["en-US"]["hsh"], "abc123")
+
+        # 之后的快速路径两个市场都已归档，不再读取配置
+        with mock.patch.object(bing, "configured_markets", side_effect=AssertionError("快速路径读取了配置")):
+            self.assertIsNone(bing.run(render=False))
+
+    def test_config_change_applies_when_there_is_work(self):
+        # 记下的列表是 zh-CN + en-US，配置已改为 zh-CN + ja-JP：en-US 的新列出触发读取配置
+        self.save(market_list=["zh-CN", "en-US"])
+
+        with mock.patch.object(bing, "configured_markets", return_value=["zh-CN", "ja-JP"]):
+            bing.run(render=False)
+
+        meta = json.loads((self.tmp / ARCHIVE / "meta.json").read_text(encoding="utf-8"))
+        self.assertEqual(sorted(meta["markets"]), ["ja-JP", "zh-CN"])
+        self.assertEqual(load_state(bing.STATE_NAME)["market_list"], ["zh-CN", "ja-JP"])
+        self.assertEqual([r.query["mkt"] for r in self.server.requests].count("ja-JP"), 1)
+
+
+class StagedPublishTest(TempDirTestCase):
+    """预取的 2026-10-19 壁纸已到上线时间；Bing 当前公布的主市场图片决定是否发布暂存目录"""
+
+    STAGED = dict(IMAGE, startdate="20261019", fullstartdate="202610190000", hsh="next1")
+    STAGING = "state/staging/bing/2026-10-19"
+
+    def setUp(self):
+        super().setUp()
+        self.write_file(f"{self.STAGING}/image.jpg", b"staged")
+        save_state(bing.STATE_NAME, {"market_list": ["zh-CN"], "staged": self.STAGED})
+        self.listed = dict(self.STAGED)
+        self.server = self.enterContext(StubServer(lambda request: Response(200, {"images": [self.listed]})))
+        self.enterContext(mock.patch.object(bing, "BING_API", f"{self.server.url}/HPImageArchive.aspx"))
+        self.enterContext(mock.patch.object(bing, "configured_markets", return_value=["zh-CN"]))
+        self.enterContext(mock.patch.object(bing, "add_markets"))
+        self.process = self.enterContext(mock.patch("src.pipeline.process_wallpaper", return_value={"failed": {}}))
+
+    def test_matching_hsh_publishes_staging_dir(self):
+        base_dir = bing.run(render=False)
+
+        self.assertEqual(base_dir.as_posix(), "docs/wallpapers/bing/2026-10/2026-10-19")
+        self.assertEqual((self.tmp / base_dir / "image.jpg").read_bytes(), b"staged")
+        self.assertFalse((self.tmp / self.STAGING).exists())
+        self.assertEqual([r.query["mkt"] for r in self.server.requests], ["zh-CN"])
+        self.assertNotIn("staged", load_state(bing.STATE_NAME))
+
+    def test_replaced_image_discards_staging_dir(self):
+        self.listed["hsh"] = "replaced"
+
+        base_dir = bing.run(render=False)
+
+        self.assertFalse((self.tmp / self.STAGING).exists())
+        self.assertFalse((self.tmp / base_dir / "image.jpg").exists())
+        item = self.process.call_args.args[2]()
+        self.assertEqual(item["extra"]["hsh"], "replaced")
+        self.assertNotIn("staged", load_state(bing.STATE_NAME))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+"""src/github_sync 对本地 Git Data API 替身服务器的测试"""
+
+import base64
+import hashlib
+import json
+import os
+import unittest
+from unittest import mock
+
+from tests.helpers import Response, StubServer, TempDirTestCase
+
+from src import github_sync
+
+REPO = "owner/images"
+PREFIX = f"/repos/{REPO}/git"
+
+
+class FakeGitData:
+    """
+    最小的 Git Data API：refs / commits / trees / blobs 存在内存中
+    advance_before_patch > 0 时，下一次 PATCH ref 之前分支被"别人"推进（模拟并发推送）
+    """
+
+    def __init__(self, files: dict = None):
+        self.blobs = {}
+        self.trees = {}
+        self.commits = {}
+        tree = self._store_tree({path: self._store_blob(data) for path, data in (files or {}).items()})
+        self.head = self._store_commit(tree, [], "init")
+        self.advance_before_patch = 0
+
+    @staticmethod
+    def _sha(*parts) -> str:
+        return hashlib.sha1(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+    def _store_blob(self, data: bytes) -> str:
+        sha = hashlib.sha1(f"blob {len(data)}\0".encode() + data).hexdigest()
+        self.blobs[sha] = data
+        return sha
+
+    def _store_tree(self, entries: dict) -> str:
+        sha = self._sha("tree", entries)
+        self.trees[sha] = dict(entries)
+        return sha
+
+    def _store_commit(self, tree: str, parents: list, message: str) -> str:
+        sha = self._sha("commit", tree, parents, message)
+        self.commits[sha] = {"tree": tree, "parents": parents}
+        return sha
+
+    def files(self) -> dict:
+        """分支头提交中的 {路径: 内容}"""
+        tree = self.trees[self.commits[self.head]["tree"]]
+        return {path: self.blobs[sha] for path, sha in tree.items()}
+
+    def route(self, request):
+        path = request.path[len(PREFIX):]
+        if request.method == "GET" and path == "/ref/heads/main":
+            return Response(200, {"object": {"sha": self.head}})
+        if request.method == "GET" and path.startswith("/commits/"):
+            return Response(200, {"sha": path.split("/")[-1], "tree": {"sha": self.commits[path.split("/")[-1]]["tree"]}})
+        if request.method == "GET" and path.startswith("/trees/"):
+            tree = self.trees[path.split("/")[-1]]
+            items = [{"path": p, "type": "blob", "sha": s} for p, s in sorted(tree.items())]
+            return Response(200, {"tree": items, "truncated": False})
+        if request.method == "POST" and path == "/blobs":
+            payload = request.json()
+            return Response(201, {"sha": self._store_blob(base64.b64decode(payload["content"]))})
+        if request.method == "POST" and path == "/trees":
+            payload = request.json()
+            entries = dict(self.trees[payload["base_tree"]])
+            entries.update({item["path"]: item["sha"] for item in payload["tree"]})
+            return Response(201, {"sha": self._store_tree(entries)})
+        if request.method == "POST" and path == "/commits":
+            payload = request.json()
+            return Response(201, {"sha": self._store_commit(payload["tree"], payload["parents"], payload["message"])})
+        if request.method == "PATCH" and path == "/refs/heads/main":
+            if self.advance_before_patch:
+                self.advance_before_patch -= 1
+                tree = dict(self.trees[self.commits[self.head]["tree"]])
+                tree["other.txt"] = self._store_blob(b"pushed by someone else")
+                self.head = self._store_commit(self._store_tree(tree), [self.head], "concurrent")
+            sha = request.json()["sha"]
+            if self.commits[sha]["parents"] != [self.head]:
+                return Response(422, {"message": "Update is not a fast forward"})
+            self.head = sha
+            return Response(200, {"object": {"sha": sha}})
+        return Response(404, {"message": "not found"})
+
+
+class GitHubSyncTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a = self.write_file("docs/wallpapers/bing/2026-01/2026-01-01/image.jpg", b"image-a" * 100)
+        self.b = self.write_file("docs/wallpapers/bing/2026-01/2026-01-02/image.jpg", b"image-b" * 100)
+        self.files = [(self.a, github_sync.repo_path_for(self.a)), (self.b, github_sync.repo_path_for(self.b))]
+
+    def serve(self, git: FakeGitData):
+        server = StubServer(git.route)
+        env = mock.patch.dict(os.environ, {"GH_PAT": "token", "IMAGE_REPO": REPO, "IMAGE_REPO_BRANCH": "main",
+                                           "GITHUB_API_URL": server.url})
+        env.start()
+        self.addCleanup(env.stop)
+        self.enterContext(server)
+        return server
+
+    def test_blob_sha_matches_git(self):
+        data = self.a.read_bytes()
+        expected = hashlib.sha1(f"blob {len(data)}\0".encode() + data).hexdigest()
+        self.assertEqual(github_sync.git_blob_sha(self.a), expected)
+
+    def test_batch_is_one_commit(self):
+        git = FakeGitData()
+        server = self.serve(git)
+
+        result = github_sync.sync_files(self.files, "upload")
+
+        self.assertEqual(server.calls(), [
+            f"GET {PREFIX}/ref/heads/main",
+            f"GET {PREFIX}/commits/{git.commits[git.head]['parents'][0]}",
+            f"GET {PREFIX}/trees/{git.commits[git.commits[git.head]['parents'][0]]['tree']}",
+            f"POST {PREFIX}/blobs",
+            f"POST {PREFIX}/blobs",
+            f"POST {PREFIX}/trees",
+            f"POST {PREFIX}/commits",
+            f"PATCH {PREFIX}/refs/heads/main",
+        ])
+        self.assertEqual(result["files"], 2)
+        self.assertEqual(result["commit"], git.head)
+        self.assertEqual(git.files(), {
+            "wallpapers/bing/2026-01/2026-01-01/image.jpg": self.a.read_bytes(),
+            "wallpapers/bing/2026-01/2026-01-02/image.jpg": self.b.read_bytes(),
+        })
+        manifest = github_sync.load_manifest()
+        self.assertEqual(manifest[self.files[0][1]], github_sync.git_blob_sha(self.a))
+
+    def test_unchanged_files_skip_without_requests(self):
+        git = FakeGitData()
+        server = self.serve(git)
+        github_sync.sync_files(self.files, "upload")
+        server.requests.clear()
+
+        result = github_sync.sync_files(self.files, "upload again")
+
+        self.assertEqual(server.requests, [])
+        self.assertEqual(result, {"commit": None, "files": 0, "skipped": 2, "requests": 0})
+
+    def test_remote_tree_fills_missing_manifest(self):
+        # 远端已有 a（内容相同），本地清单为空：读一次远端树后只上传 b
+        git = FakeGitData({self.files[0][1]: self.a.read_bytes()})
+        server = self.serve(git)
+
+        result = github_sync.sync_files(self.files, "upload")
+
+        self.assertEqual(server.calls("POST").count(f"POST {PREFIX}/blobs"), 1)
+        self.assertEqual((result["files"], result["skipped"]), (1, 1))
+        self.assertIn(self.files[0][1], github_sync.load_manifest())
+
+    def test_ref_moved_rebuilds_on_new_head(self):
+        git = FakeGitData()
+        git.advance_before_patch = 1
+        server = self.serve(git)
+
+        result = github_sync.sync_files(self.files, "upload")
+
+        # blob 只上传一次；树、提交、快进各重做一次
+        self.assertEqual(server.calls("POST").count(f"POST {PREFIX}/blobs"), 2)
+        self.assertEqual(server.calls("PATCH"), [f"PATCH {PREFIX}/refs/heads/main"] * 2)
+        self.assertEqual(result["commit"], git.head)
+        self.assertIn("other.txt", git.files())
+        self.assertIn(self.files[1][1], git.files())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,274 @@
+"""src/llm_client 对本地 OpenAI 兼容替身服务器的测试（SSE 流式、指标、Batch API）"""
+
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from tests.helpers import Response, StubServer, TempDirTestCase
+
+from src import llm_client
+from src.state import load_state
+
+
+def sse(*contents, usage=None, done=True, delay=0.0):
+    """按 OpenAI 流式格式逐块输出 content；delay 为第一块之前的等待秒数"""
+    if delay:
+        time.sleep(delay)
+    for content in contents:
+        yield f"data: {json.dumps({'choices': [{'delta': {'content': content}}]})}\n\n".encode()
+    if usage:
+        yield f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode()
+    if done:
+        yield b"data: [DONE]\n\n"
+
+
+class LLMServerTestCase(TempDirTestCase):
+    """在临时目录中运行，指标写入临时的 state/llm_metrics.json"""
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.dict(os.environ, {"HTTP_RETRIES": "0"}))
+
+    def serve(self, route) -> StubServer:
+        server = self.enterContext(StubServer(route))
+        self.base_url = f"{server.url}/v1"
+        self.provider = server.url.split("//")[1]
+        return server
+
+    def metrics(self, model: str = "m") -> list:
+        return load_state(llm_client.METRICS_STATE).get(f"{self.provider}|{model}", [])
+
+
+class StreamTest(LLMServerTestCase):
+
+    def test_sse_chunks_joined_with_ttft(self):
+        server = self.serve(lambda request: Response(200, headers={"Content-Type": "text/event-stream"},
+                                                     chunks=sse("晨光", "穿过", "山谷", usage={"completion_tokens": 7},
+                                                                delay=0.2)))
+        part = self.tmp / "story.part"
+
+        result = llm_client.chat_completion(self.base_url, "key", {"model": "m"}, stream=True, partial_path=part)
+
+        self.assertEqual(result["text"], "晨光穿过山谷")
+        self.assertFalse(result["partial"])
+        self.assertEqual(part.read_text(encoding="utf-8"), "晨光穿过山谷")
+        request = server.requests[0]
+        self.assertEqual(request.path, "/v1/chat/completions")
+        self.assertEqual(request.headers["Authorization"], "Bearer key")
+        self.assertTrue(request.json()["stream"])
+
+        metrics = result["metrics"]
+        self.assertTrue(metrics["ok"])
+        self.assertGreaterEqual(metrics["ttft"], 0.2)
+        self.assertGreaterEqual(metrics["total"], metrics["ttft"])
+        self.assertEqual(metrics["tokens"], 7)  # token 数只取 usage，内容块单独记录
+        self.assertEqual(metrics["chunks"], 3)
+        self.assertEqual(self.metrics(), [metrics])
+
+    def test_ignores_comments_and_empty_deltas(self):
+        def chunks():
+            yield b": keep-alive\n\n"
+            yield b'data: {"choices": [{"delta": {"role": "assistant"}}]}\n\n'
+            yield from sse("你好")
+
+        self.serve(lambda request: Response(200, chunks=chunks()))
+
+        result = llm_client.chat_completion(self.base_url, "key", {"model": "m"}, stream=True)
+
+        self.assertEqual(result["text"], "你好")
+        self.assertEqual(result["metrics"]["chunks"], 1)
+        # 没有 usage 时不把内容块数当作 token 数，也不计算生成速度
+        self.assertIsNone(result["metrics"]["tokens"])
+        self.assertIsNone(result["metrics"]["tokens_per_second"])
+
+    def test_disconnect_keeps_partial_text(self):
+        # 发出几块之后不发结束块直接断开连接
+        self.serve(lambda request: Response(200, chunks=sse("已经", "写了", "一半", done=False), abort=True))
+        part = self.tmp / "story.part"
+
+        result = llm_client.chat_completion(self.base_url, "key", {"model": "m"}, stream=True, partial_path=part)
+
+        self.assertEqual(result["text"], "已经写了一半")
+        self.assertTrue(result["partial"])
+        self.assertEqual(part.read_text(encoding="utf-8"), "已经写了一半")
+        self.assertTrue(self.metrics()[-1]["partial"])
+
+    def test_error_before_any_text_is_recorded(self):
+        self.serve(lambda request: Response(500, {"error": "boom"}))
+
+        with self.assertRaises(llm_client.LLMError):
+            llm_client.chat_completion(self.base_url, "key", {"model": "m"}, stream=True)
+
+        recorded = self.metrics()
+        self.assertEqual(len(recorded), 1)
+        self.assertFalse(recorded[0]["ok"])
+        self.assertIn("HTTP 500", recorded[0]["error"])
+
+    def test_non_stream_reads_usage(self):
+        self.serve(lambda request: Response(200, {"choices": [{"message": {"content": "完整正文"}}],
+                                                  "usage": {"completion_tokens": 4}}))
+
+        result = llm_client.chat_completion(self.base_url, "key", {"model": "m"}, stream=False)
+
+        self.assertEqual(result["text"], "完整正文")
+        self.assertIsNone(result["metrics"]["ttft"])
+        self.assertEqual(result["metrics"]["tokens"], 4)
+
+
+class HedgeTest(LLMServerTestCase):
+    """三个替身服务商；对冲等待固定为 HEDGE 秒"""
+
+    HEDGE = 0.3
+
+    def setUp(self):
+        super().setUp()
+        self.routes = [lambda request, i=i: Response(200, chunks=sse(f"来自{i}")) for i in range(3)]
+        self.servers = [self.enterContext(StubServer(lambda request, i=i: self.routes[i](request))) for i in range(3)]
+        env = {"LLM_STREAM": "1", "LLM_BREAKER_FAILURES": "2"}
+        for index, server in enumerate(self.servers):
+            suffix = "" if index == 0 else f"_{index + 1}"
+            env.update({f"LLM_API_KEY{suffix}": "key", f"LLM_BASE_URL{suffix}": f"{server.url}/v1",
+                        f"LLM_MODEL_NAME{suffix}": f"m{index}"})
+        self.enterContext(mock.patch.dict(os.environ, env))
+        self.enterContext(mock.patch.object(llm_client, "hedge_delay", return_value=self.HEDGE))
+
+    def name(self, index: int) -> str:
+        return f"{self.servers[index].url.split('//')[1]}|m{index}"
+
+    def samples(self, index: int) -> list:
+        return load_state(llm_client.METRICS_STATE).get(self.name(index), [])
+
+    def test_fast_provider_needs_no_hedge(self):
+        result = llm_client.hedged_completion({"messages": []}, timeout=5)
+
+        self.assertEqual(result["text"], "来自0")
+        self.assertEqual(result["provider"]["model"], "m0")
+        self.assertEqual([len(server.requests) for server in self.servers], [1, 0, 0])
+
+    def test_slow_provider_is_hedged(self):
+        self.routes[0] = lambda request: Response(200, chunks=sse("慢", delay=1.5))
+
+        start = time.monotonic()
+        result = llm_client.hedged_completion({"messages": []}, timeout=5)
+
+        self.assertEqual(result["provider"]["model"], "m1")
+        self.assertLess(time.monotonic() - start, 1.0)
+        self.assertEqual([len(server.requests) for server in self.servers], [1, 1, 0])
+        self.assertEqual(self.servers[1].requests[0].json()["model"], "m1")
+        # 被取消的慢请求不留下成功的延迟样本
+        time.sleep(1.5)
+        self.assertFalse(any(c["ok"] for c in self.samples(0)))
+
+    def test_slow_non_stream_provider_is_cancelled(self):
+        def slow(request):
+            def chunks():
+                time.sleep(1.0)
+                yield json.dumps({"choices": [{"message": {"content": "慢"}}]}).encode()
+            return Response(200, chunks=chunks())
+
+        self.routes[0] = slow
+        self.routes[1] = lambda request: Response(200, {"choices": [{"message": {"content": "快"}}]})
+        os.environ["LLM_STREAM"] = "0"
+
+        result = llm_client.hedged_completion({"messages": []}, timeout=5)
+
+        self.assertEqual(result["text"], "快")
+        self.assertFalse(self.servers[1].requests[0].json().get("stream"))
+        # 落后的非流式请求读到响应体时发现已取消，不留下成功样本
+        time.sleep(1.2)
+        self.assertEqual(self.samples(0), [])
+
+    def test_failing_provider_fails_over_immediately(self):
+        self.routes[0] = lambda request: Response(500, {"error": "boom"})
+
+        start = time.monotonic()
+        result = llm_client.hedged_completion({"messages": []}, timeout=5)
+
+        self.assertEqual(result["provider"]["model"], "m1")
+        self.assertLess(time.monotonic() - start, self.HEDGE)
+        self.assertEqual([c["ok"] for c in self.samples(0)], [False])
+
+    def test_breaker_opens_after_consecutive_failures(self):
+        self.routes[0] = lambda request: Response(500, {"error": "boom"})
+        for _ in range(2):
+            llm_client.hedged_completion({"messages": []}, timeout=5)
+        self.assertTrue(llm_client.breaker_open(self.name(0)))
+
+        result = llm_client.hedged_completion({"messages": []}, timeout=5)
+
+        self.assertEqual(result["provider"]["model"], "m1")
+        self.assertEqual(len(self.servers[0].requests), 2)  # 第三次调用跳过了熔断的服务商
+
+    def test_deadline_returns_partial_without_late_launches(self):
+        def stalls(request):
+            def chunks():
+                yield from sse("写到", done=False)
+                time.sleep(2)
+                yield from sse("一半")
+            return Response(200, chunks=chunks())
+
+        self.routes[0] = self.routes[1] = self.routes[2] = stalls
+
+        start = time.monotonic()
+        result = llm_client.hedged_completion({"messages": []}, timeout=0.5)
+
+        # 第三个服务商的对冲时刻 (0.6s) 晚于截止时间，不再发出
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertTrue(result["partial"])
+        self.assertEqual(result["text"], "写到")
+        self.assertEqual([len(server.requests) for server in self.servers], [1, 1, 0])
+        time.sleep(0.3)  # 对冲请求的超时同样截止于 0.5s，等它记录完
+        recorded = self.samples(0) + self.samples(1)
+        self.assertEqual(len(recorded), 2)
+        self.assertTrue(all(c["partial"] and not c["ok"] for c in recorded))
+        self.assertIsNone(llm_client.metrics_summary()[self.name(0)]["total_p95"])
+
+
+class BatchTest(LLMServerTestCase):
+
+    def test_submit_uploads_jsonl(self):
+        def route(request):
+            if request.path == "/v1/files":
+                return Response(200, {"id": "file-1"})
+            return Response(200, {"id": "batch-1"})
+
+        server = self.serve(route)
+
+        batch_id = llm_client.submit_batch(self.base_url, "key", [("a", {"model": "m"}), ("b", {"model": "m"})])
+
+        self.assertEqual(batch_id, "batch-1")
+        self.assertEqual(server.calls(), ["POST /v1/files", "POST /v1/batches"])
+        upload = server.requests[0].body
+        self.assertIn(b'"custom_id": "a"', upload)
+        self.assertIn(b'"url": "/v1/chat/completions"', upload)
+        self.assertEqual(server.requests[1].json()["input_file_id"], "file-1")
+
+    def test_results_parse_output_and_error_files(self):
+        output = "\n".join(json.dumps(line) for line in [
+            {"custom_id": "ok", "response": {"status_code": 200,
+                                             "body": {"choices": [{"message": {"content": "故事"}}]}}},
+            {"custom_id": "bad-status", "response": {"status_code": 429, "body": {"error": "rate limited"}}},
+            {"custom_id": "no-choices", "response": {"status_code": 200, "body": {"choices": []}}},
+        ]) + "\n\n"
+        errors = json.dumps({"custom_id": "expired", "response": None, "error": "batch_expired"})
+        files = {"/v1/files/out/content": output, "/v1/files/err/content": errors}
+        self.serve(lambda request: Response(200, files[request.path]))
+
+        results = llm_client.batch_results(self.base_url, "key", {"output_file_id": "out", "error_file_id": "err"})
+
+        self.assertEqual(results["ok"], {"text": "故事"})
+        self.assertEqual(results["bad-status"], {"error": "rate limited"})
+        self.assertIn("error", results["no-choices"])
+        self.assertEqual(results["expired"], {"error": "batch_expired"})
+
+    def test_missing_batch_api_is_unsupported(self):
+        self.serve(lambda request: Response(404, {"error": "not found"}))
+
+        with self.assertRaises(llm_client.BatchUnsupported):
+            llm_client.get_batch(self.base_url, "key", "batch-1")
+
+
+if __name__ == "__main__":
+    unittest.main()
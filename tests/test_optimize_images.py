@@ -0,0 +1,48 @@
+"""scripts/optimize_images 账本与 meta / 目录索引同步的测试"""
+
+import io
+import json
+import os
+import unittest
+
+from PIL import Image
+
+from tests.helpers import TempDirTestCase
+
+from scripts import optimize_images
+from src.catalog import load_catalog, rebuild_catalog
+from src.wallpaper_meta import file_sha256, read_meta, write_meta
+
+ARCHIVE = "docs/wallpapers/bing/2026-10/2026-10-18"
+
+
+class OptimizeTest(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # 随机噪声几乎不可压缩，高质量编码后超过 THRESHOLD_KB
+        img = Image.frombytes("RGB", (1200, 900), os.urandom(1200 * 900 * 3))
+        buf = io.BytesIO()
+        img.save(buf, "JPEG", quality=95)
+        self.image = self.write_file(f"{ARCHIVE}/image.jpg", buf.getvalue())
+        self.assertGreater(self.image.stat().st_size, optimize_images.THRESHOLD_KB * 1024)
+        write_meta(self.image.parent, {"date": "2026-10-18", "title": "标题"})
+        rebuild_catalog()
+
+    def test_recompress_updates_meta_and_catalog(self):
+        optimize_images.batch_optimize_legacy()
+
+        ledger = json.loads(optimize_images.LEDGER_PATH.read_text(encoding="utf-8"))
+        entry = ledger[self.image.as_posix()]
+        self.assertEqual(sorted(entry), ["saved", "settings", "sha256", "size"])
+        self.assertLessEqual(entry["size"], optimize_images.TARGET_SIZE_KB * 1024)
+        self.assertEqual(entry["sha256"], file_sha256(self.image))
+
+        facts = read_meta(self.image.parent)["image"]
+        self.assertEqual((facts["sha256"], facts["file_size"]), (entry["sha256"], entry["size"]))
+        self.assertEqual(load_catalog()[0]["meta"]["image"]["sha256"], entry["sha256"])
+        self.assertEqual(optimize_images._find_candidates(ledger, full=False), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""src/pipeline 完成记录位置的测试"""
+
+import json
+import unittest
+from pathlib import Path
+
+from tests.helpers import TempDirTestCase
+
+from src import pipeline
+
+ARCHIVE = Path("docs/wallpapers/bing/2026-10/2026-10-18")
+
+
+class RecordPathTest(TempDirTestCase):
+
+    def test_archive_records_live_in_state(self):
+        self.assertEqual(pipeline.record_path(ARCHIVE), Path("state/pipeline/bing/2026-10-18.json"))
+        staging = Path("state/staging/bing/2026-10-19")
+        self.assertEqual(pipeline.record_path(staging), staging / pipeline.RECORD_FILENAME)
+
+    def test_mark_done_writes_nothing_into_docs(self):
+        ARCHIVE.mkdir(parents=True)
+        pipeline.mark_done(ARCHIVE, "sync")
+
+        self.assertTrue(pipeline.stage_done(ARCHIVE, "sync"))
+        self.assertEqual(list(ARCHIVE.iterdir()), [])
+
+    def test_legacy_record_migrates_on_save(self):
+        legacy = self.write_file(f"{ARCHIVE}/{pipeline.RECORD_FILENAME}", json.dumps(
+            {"version": 1, "stages": {"download": {"status": "done"}}, "data": {}}).encode())
+
+        pipeline.mark_done(ARCHIVE, "sync")
+
+        self.assertFalse(legacy.exists())
+        self.assertTrue(pipeline.stage_done(ARCHIVE, "download"))
+        self.assertTrue(pipeline.stage_done(ARCHIVE, "sync"))
+
+    def test_move_record_follows_published_staging_dir(self):
+        staging = Path("state/staging/bing/2026-10-18")
+        staging.mkdir(parents=True)
+        pipeline.mark_done(staging, "story")
+
+        pipeline.move_record(staging, ARCHIVE)
+
+        self.assertFalse((staging / pipeline.RECORD_FILENAME).exists())
+        self.assertTrue(pipeline.stage_done(ARCHIVE, "story"))
+
+
+if __name__ == "__main__":
+    unittest.main()
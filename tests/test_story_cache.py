@@ -0,0 +1,47 @@
+"""src/story_cache 的命中刷新与淘汰测试"""
+
+import time
+import unittest
+
+from tests.helpers import TempDirTestCase
+
+from src import story_cache
+from src.state import load_state, state_path
+
+INFO = {"prompt_sha256": "p" * 64, "image_sha256": "i" * 64, "model": "model"}
+
+
+class StoryCacheTest(TempDirTestCase):
+
+    def test_recent_hit_does_not_rewrite_state(self):
+        story_cache.put("k", "故事", INFO)
+        entries = story_cache._entries()
+        entries["k"]["last_used"] -= 3600
+        story_cache._save(entries)
+        before = state_path(story_cache.CACHE_STATE).read_text(encoding="utf-8")
+
+        self.assertEqual(story_cache.get("k"), "故事")
+        self.assertEqual(state_path(story_cache.CACHE_STATE).read_text(encoding="utf-8"), before)
+
+    def test_stale_hit_refreshes_last_used(self):
+        story_cache.put("k", "故事", INFO)
+        entries = story_cache._entries()
+        entries["k"]["last_used"] -= story_cache.TOUCH_INTERVAL + 1
+        story_cache._save(entries)
+
+        story_cache.get("k")
+
+        last_used = load_state(story_cache.CACHE_STATE)["entries"]["k"]["last_used"]
+        self.assertGreaterEqual(last_used, int(time.time()) - 5)
+
+    def test_evicts_least_recently_used(self):
+        entries = {
+            "old": {"text": "a" * 600, "last_used": 1},
+            "new": {"text": "b" * 600, "last_used": 2},
+        }
+        self.assertEqual(story_cache._evict(entries, 1000), 1)
+        self.assertEqual(list(entries), ["new"])
+
+
+if __name__ == "__main__":
+    unittest.main()